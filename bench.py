@@ -0,0 +1,428 @@
+"""Offline benchmark for the tutor's agent loop, with no OpenAI key or network.
+
+Every model tier's ChatOpenAI client is replaced by FakeChatModel, a deterministic stand-in with configurable
+latency that answers from a script: each student message of the scenario says which
+tool calls the model makes before replying, and structured-output calls (teaching step
+generation and updates) get synthetic teaching steps. Scripted sessions, including
+notebook edits, are driven through the same Session methods the frontend calls.
+
+Reported per run: turn latency percentiles, LLM round trips per turn, prompt size by
+turn (to catch context growth), traced memory per session, and calls and cost per model
+tier (priced as the configured models).
+
+With --openai-server the fake model answers from fake_openai_server.py (in a child process) instead, so calls go
+through the real ChatOpenAI clients: the shared connection pool, retries and, with --hedge,
+hedged requests (llm_client.py). --slow-fraction gives that server's latency a tail.
+
+    python bench.py                                # one session
+    python bench.py --sessions 20 --turns 30       # 20 concurrent sessions
+    python bench.py --json report.json             # save a baseline
+    python bench.py --check report.json            # exit 1 if worse than the baseline
+    python bench.py --startup                      # cold start of the desktop app
+    python bench.py --lesson-pack course.pack      # lessons served from a pack (python lesson_pack.py build)
+    python bench.py --openai-server --sessions 4 --turns 30 --slow-fraction 0.05 --hedge
+"""
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+# tutor builds a ChatOpenAI client at import time; it is never called here.
+os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import Field
+
+import llm_client
+import tutor
+import fake_openai_server
+from lesson_pack import load_lesson_pack
+from model_router import router
+from context import count_tokens, message_text
+from teaching_steps_cache import TeachingStepsCache
+from session_store import SessionStore
+from tracing import percentile, tracer
+
+# Allowed slowdown against a --check baseline before the run counts as a regression.
+REGRESSION_TOLERANCE = 0.2
+# Provider prompt caching as documented by OpenAI: prompts from 1024 tokens, cached in 128-token steps.
+PROMPT_CACHE_MIN_TOKENS = 1024
+PROMPT_CACHE_STEP_TOKENS = 128
+
+SOLUTION_LINES = [
+    "def binary_search(nums, target):",
+    "    lo, hi = 0, len(nums) - 1",
+    "    while lo <= hi:",
+    "        mid = (lo + hi) // 2",
+    "        if nums[mid] == target:",
+    "            return mid",
+    "        if nums[mid] < target:",
+    "            lo = mid + 1",
+    "        else:",
+    "            hi = mid - 1",
+    "    return -1",
+]
+
+# Opening turns of the default scenario; --turns pads it with plain chat turns that each add a note line.
+DEFAULT_SCENARIO = [
+    {"student": "I want to learn binary search.",
+     "tool_calls": [{"name": "get_expert_teaching_steps", "args": {"concept": "binary search"}}]},
+    {"student": "Can you give me a problem to practice on?",
+     "tool_calls": [{"name": "set_problem_statement", "args": {
+         "title": "Find the target",
+         "description": "Given a sorted list nums and a target, return the index of target or -1.",
+         "test_case": "binary_search([1, 3, 5, 7], 5) == 2\nbinary_search([1, 3, 5, 7], 4) == -1",
+         "visualization": {"kind": "array", "values": [1, 3, 5, 7],
+                           "pointers": [{"label": "lo", "index": 0}, {"label": "mid", "index": 1}, {"label": "hi", "index": 3}]}}}]},
+    {"student": "I started writing the loop.",
+     "notebook": [{"start": 0, "delete": 1, "insert": SOLUTION_LINES[:4]}]},
+    {"student": "Here is my full solution, does it work?",
+     "notebook": [{"start": 4, "delete": 0, "insert": SOLUTION_LINES[4:]}],
+     "tool_calls": [{"name": "run_notebook_tests", "args": {}}]},
+    {"student": "Why do we use lo <= hi instead of lo < hi?"},
+]
+
+def default_scenario(turns: int) -> List[dict]:
+    scenario = [dict(turn) for turn in DEFAULT_SCENARIO[:turns]]
+    for index in range(len(scenario), turns):
+        scenario.append({
+            "student": f"Follow-up question {index}: what happens if the list has duplicates?",
+            "notebook": [{"start": len(SOLUTION_LINES) + index - len(DEFAULT_SCENARIO), "delete": 0,
+                          "insert": [f"# note {index}: duplicates return any matching index"]}],
+        })
+    return scenario
+
+class FakeChatModel(BaseChatModel):
+    """Deterministic chat model: scripted tool calls, fixed-length replies, simulated latency.
+
+    `tool_script` maps a student message to the tool calls the model makes for it; once the
+    tool results are in (or when no calls are scripted) it answers with `reply_words` words.
+    Usage metadata includes cache reads from a simulated provider prompt cache, shared by all
+    copies of the model, that matches requests on whole-message prefixes.
+    """
+
+    model_name: str = "fake-chat-model"
+    tool_script: Dict[str, List[dict]] = {}
+    first_token_seconds: float = 0.2
+    seconds_per_token: float = 0.005
+    reply_words: int = 60
+    bound_tools: List[dict] = []
+    tool_choice: Optional[str] = None
+    prompt_cache: set = Field(default_factory=set)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    def bind_tools(self, tools, tool_choice=None, **kwargs):
+        return self.model_copy(update={"bound_tools": [convert_to_openai_tool(t) for t in tools], "tool_choice": tool_choice})
+
+    def _prompt_tokens(self, messages: List[BaseMessage]) -> tuple:
+        """(input tokens, of which cached): the longest previously sent message prefix counts as cached."""
+        running = hashlib.sha256(json.dumps(self.bound_tools, sort_keys=True).encode("utf-8"))
+        input_tokens = matched_tokens = 0
+        prefixes = []
+        for message in messages:
+            text = message_text(message)
+            running.update(f"{message.type}\0{text}\0".encode("utf-8"))
+            input_tokens += count_tokens(text)
+            prefixes.append(running.hexdigest())
+            if prefixes[-1] in self.prompt_cache:
+                matched_tokens = input_tokens
+        self.prompt_cache.update(prefixes)
+        if matched_tokens < PROMPT_CACHE_MIN_TOKENS:
+            return input_tokens, 0
+        steps = (matched_tokens - PROMPT_CACHE_MIN_TOKENS) // PROMPT_CACHE_STEP_TOKENS
+        return input_tokens, PROMPT_CACHE_MIN_TOKENS + steps * PROMPT_CACHE_STEP_TOKENS
+
+    def _respond(self, messages: List[BaseMessage]) -> AIMessage:
+        input_tokens, cached_tokens = self._prompt_tokens(messages)
+        tool_names = [t["function"]["name"] for t in self.bound_tools]
+        if self.tool_choice not in (None, "none", "auto") and tool_names:
+            # with_structured_output: answer with the schema's "tool call".
+            args = self._structured_args(tool_names[0], messages)
+            message = AIMessage(content="", tool_calls=[{"name": tool_names[0], "args": args, "id": "call_structured"}])
+        else:
+            last_student = max((index for index, m in enumerate(messages) if isinstance(m, HumanMessage)), default=-1)
+            script = self.tool_script.get(messages[last_student].content, []) if last_student >= 0 else []
+            tools_done = any(isinstance(m, ToolMessage) for m in messages[last_student + 1:])
+            if script and not tools_done and self.tool_choice != "none":
+                calls = [{"name": call["name"], "args": call["args"], "id": f"call_{index}"} for index, call in enumerate(script)]
+                message = AIMessage(content="", tool_calls=calls)
+            else:
+                message = AIMessage(content=" ".join(f"word{index}" for index in range(self.reply_words)))
+        output_tokens = max(1, count_tokens(message_text(message)))
+        message.usage_metadata = {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                                  "total_tokens": input_tokens + output_tokens,
+                                  "input_token_details": {"cache_read": cached_tokens}}
+        return message
+
+    def _structured_args(self, schema_name: str, messages: List[BaseMessage]) -> Dict[str, Any]:
+        if schema_name == "TeachingStepList":
+            steps = [{"content": f"Step {index + 1} of learning the concept", "status": "not_started"} for index in range(6)]
+            return {"concept": "binary search", "steps": steps}
+        if schema_name == "TeachingStepPatchList":
+            # Each update completes one more step as the conversation grows, so the steps actually change.
+            step = min(5, sum(isinstance(m, AIMessage) for m in messages) // 8)
+            return {"patches": [{"op": "set_status", "index": step, "status": "completed", "content": None}]}
+        if schema_name == "LessonProblem":
+            practice = DEFAULT_SCENARIO[1]["tool_calls"][0]["args"]
+            return {**practice, "reference_solution": "\n".join(SOLUTION_LINES)}
+        return {}
+
+    def _delay(self, message: AIMessage) -> float:
+        return self.first_token_seconds + self.seconds_per_token * message.usage_metadata["output_tokens"]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        message = self._respond(messages)
+        time.sleep(self._delay(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        message = self._respond(messages)
+        await asyncio.sleep(self._delay(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        message = self._respond(messages)
+        await asyncio.sleep(self.first_token_seconds)
+        if message.content:
+            for word in message.content.split(" "):
+                yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+                await asyncio.sleep(self.seconds_per_token)
+        tool_call_chunks = [{"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": index}
+                            for index, call in enumerate(message.tool_calls)]
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=tool_call_chunks,
+                                                         usage_metadata=message.usage_metadata))
+
+def run_session(scenario: List[dict]) -> dict:
+    """Drive one session through the scenario the way the frontend would; return its measurements."""
+    session = tutor.Session()
+    turns = []
+    for turn in scenario:
+        if "notebook" in turn:
+            result = session.apply_notebook_delta(session.notebook.version, turn["notebook"])
+            if not result["ok"]:
+                raise RuntimeError(f"scenario notebook edit does not apply: {turn['notebook']}")
+        started = time.perf_counter()
+        session.send_message(turn["student"])
+        elapsed = time.perf_counter() - started
+        stats = session.get_turn_stats()
+        turns.append({
+            "seconds": elapsed,
+            "round_trips": stats["llm_round_trips"],
+            "tool_calls": stats["tool_calls"],
+            "read_only_tool_calls": stats["read_only_tool_calls"],
+            "state_snapshots_unread": stats["state_snapshots_unread"],
+            "input_tokens": stats["input_tokens"],
+            "cached_tokens": stats["cached_tokens"],
+            "prompt_tokens": session.context.last_build_tokens,
+            "history_messages": len(session.messages),
+        })
+    return {"session": session, "turns": turns}
+
+def run_benchmark(scenario: List[dict], sessions: int) -> dict:
+    tracemalloc.start()
+    baseline_bytes = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        results = list(pool.map(lambda _: run_session(scenario), range(sessions)))
+    wall_seconds = time.perf_counter() - started
+    session_bytes = (tracemalloc.get_traced_memory()[0] - baseline_bytes) / sessions
+    tracemalloc.stop()
+    for result in results:
+        result["session"].close()
+    resume_seconds, resumed_messages = [], []
+    for result in results:
+        started_resume = time.perf_counter()
+        resumed = tutor.Session.resume(result["session"].id)
+        resume_seconds.append(time.perf_counter() - started_resume)
+        resumed_messages.append(len(resumed.messages))
+
+    turns = [turn for result in results for turn in result["turns"]]
+    seconds = [turn["seconds"] for turn in turns]
+    prompt_by_turn = [max(result["turns"][index]["prompt_tokens"] for result in results) for index in range(len(scenario))]
+    seconds_by_turn = [round(percentile([result["turns"][index]["seconds"] for result in results], 0.5), 4) for index in range(len(scenario))]
+    return {
+        "sessions": sessions,
+        "turns_per_session": len(scenario),
+        "wall_seconds": round(wall_seconds, 3),
+        "turns_per_second": round(len(turns) / wall_seconds, 2),
+        "p50_turn_seconds": round(percentile(seconds, 0.5), 4),
+        "p95_turn_seconds": round(percentile(seconds, 0.95), 4),
+        "p99_turn_seconds": round(percentile(seconds, 0.99), 4),
+        "max_turn_seconds": round(max(seconds), 4),
+        "round_trips_per_turn": round(sum(turn["round_trips"] for turn in turns) / len(turns), 3),
+        "read_only_tool_calls": sum(turn["read_only_tool_calls"] for turn in turns),
+        "state_snapshots_unread": sum(turn["state_snapshots_unread"] for turn in turns),
+        "input_tokens_per_turn": round(sum(turn["input_tokens"] for turn in turns) / len(turns), 1),
+        "cached_token_ratio": round(sum(turn["cached_tokens"] for turn in turns) / max(1, sum(turn["input_tokens"] for turn in turns)), 3),
+        "p50_seconds_by_turn": seconds_by_turn,
+        "prompt_tokens_by_turn": prompt_by_turn,
+        "final_prompt_tokens": prompt_by_turn[-1],
+        "history_messages": results[0]["turns"][-1]["history_messages"],
+        "memory_kb_per_session": round(session_bytes / 1024, 1),
+        "p50_resume_ms": round(percentile(resume_seconds, 0.5) * 1000, 2),
+        "resumed_history_messages": max(resumed_messages),
+        "cost_usd_per_turn": round(sum(tier["cost_usd"] or 0 for tier in router.stats().values()) / len(turns), 6),
+        "llm_retries": sum(tier["retries"] for tier in router.stats().values()),
+        "llm_hedges": sum(tier["hedges"] for tier in router.stats().values()),
+        "llm_hedge_wins": sum(tier["hedge_wins"] for tier in router.stats().values()),
+        "model_tiers": {name: {key: tier[key] for key in ("model", "calls", "calls_by_site", "p50_seconds", "cost_usd")}
+                        for name, tier in router.stats().items()},
+    }
+
+def print_report(report: dict) -> None:
+    print(f"{report['sessions']} session(s) x {report['turns_per_session']} turns in {report['wall_seconds']}s "
+          f"({report['turns_per_second']} turns/s)")
+    print(f"  turn latency     p50 {report['p50_turn_seconds']}s  p95 {report['p95_turn_seconds']}s  "
+          f"p99 {report['p99_turn_seconds']}s  max {report['max_turn_seconds']}s")
+    slowest = max(range(len(report["p50_seconds_by_turn"])), key=report["p50_seconds_by_turn"].__getitem__)
+    print(f"  slowest turn     #{slowest + 1} (p50 {report['p50_seconds_by_turn'][slowest]}s)")
+    print(f"  LLM round trips  {report['round_trips_per_turn']} per turn; {report['read_only_tool_calls']} read-only tool call(s), "
+          f"{report['state_snapshots_unread']} attached snapshot(s) not re-read")
+    print(f"  input tokens     {report['input_tokens_per_turn']} per turn (all round trips), "
+          f"{report['cached_token_ratio']:.0%} served from the prompt cache")
+    growth = report["prompt_tokens_by_turn"]
+    print(f"  prompt tokens    first turn {growth[0]}, last turn {growth[-1]}, max {max(growth)}")
+    print(f"  memory           {report['memory_kb_per_session']} KiB per session ({report['history_messages']} history messages)")
+    print(f"  resume           p50 {report['p50_resume_ms']}ms from the session store ({report['resumed_history_messages']} history messages loaded)")
+    print(f"  cost             ${report['cost_usd_per_turn']:.5f} per turn")
+    print(f"  LLM client       {report['llm_retries']} retries, {report['llm_hedges']} hedged calls "
+          f"({report['llm_hedge_wins']} won by the duplicate)")
+    if "server" in report:
+        server = report["server"]
+        print(f"  fake server      {server['requests']} requests on {server['connections']} connection(s); "
+              f"{server['slow_requests']} slow, {server['rate_limited']} rate limited")
+    for name, tier in report["model_tiers"].items():
+        sites = ", ".join(f"{site} {count}" for site, count in tier["calls_by_site"].items())
+        print(f"    {name:<8} {tier['model']:<14} {tier['calls']} calls ({sites or 'unused'})")
+
+# Runs in a fresh interpreter: what app.py does before the window opens, then the background warm-up.
+STARTUP_SCRIPT = r'''
+import json, time
+started = time.perf_counter()
+import app
+api = app.API()
+api._start_warm_up()
+window = time.perf_counter() - started
+api._ready.wait()
+ready = time.perf_counter() - started
+if api._warm_up_error is not None:
+    raise api._warm_up_error
+print(json.dumps({"window_seconds": window, "ready_seconds": ready}))
+'''
+
+def run_startup_benchmark(runs: int) -> dict:
+    """Median time until the window can open and until the first message can be sent, over fresh processes."""
+    env = dict(os.environ, GOOSETOR_TRACE="0")
+    samples = []
+    for _ in range(runs):
+        completed = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                   env=env, capture_output=True, text=True, check=True)
+        samples.append(json.loads(completed.stdout.strip().split("\n")[-1]))
+    return {key: round(statistics.median(sample[key] for sample in samples), 3) for key in ("window_seconds", "ready_seconds")}
+
+# Report keys compared by --check; higher is worse for all of them.
+CHECKED_METRICS = ("p95_turn_seconds", "round_trips_per_turn", "final_prompt_tokens", "memory_kb_per_session")
+
+def regressions(report: dict, baseline: dict) -> List[str]:
+    found = []
+    for key in CHECKED_METRICS:
+        if baseline.get(key) and report[key] > baseline[key] * (1 + REGRESSION_TOLERANCE):
+            found.append(f"{key}: {report[key]} vs baseline {baseline[key]}")
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the tutor's agent loop against a local fake chat model.")
+    parser.add_argument("--sessions", type=int, default=1, help="concurrent sessions")
+    parser.add_argument("--turns", type=int, default=12, help="student turns per session")
+    parser.add_argument("--scenario", help="JSON list of turns ({student, tool_calls?, notebook?}) instead of the built-in one")
+    parser.add_argument("--first-token-latency", type=float, default=0.2, help="simulated seconds before the first token")
+    parser.add_argument("--token-latency", type=float, default=0.005, help="simulated seconds per output token")
+    parser.add_argument("--reply-words", type=int, default=60, help="words in each tutor reply")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--check", help="baseline report; exit 1 if a checked metric is more than 20%% worse")
+    parser.add_argument("--startup", action="store_true", help="measure the desktop app's cold start instead")
+    parser.add_argument("--startup-runs", type=int, default=5)
+    parser.add_argument("--trace", action="store_true", help="write trace spans as a normal run would")
+    parser.add_argument("--verbose", action="store_true", help="keep the tutor's console output")
+    parser.add_argument("--openai-server", action="store_true", help="serve the fake model over HTTP and call it with the real clients")
+    parser.add_argument("--slow-fraction", type=float, default=0.0, help="with --openai-server, share of requests that are slow")
+    parser.add_argument("--slow-seconds", type=float, default=3.0, help="extra seconds a slow request takes")
+    parser.add_argument("--rate-limit-fraction", type=float, default=0.0, help="with --openai-server, share of requests answered with 429")
+    parser.add_argument("--hedge", action="store_true", help="hedge slow calls at every call site")
+    parser.add_argument("--lesson-pack", help="serve lessons from this pack instead of generating them")
+    args = parser.parse_args()
+
+    if args.startup:
+        report = run_startup_benchmark(args.startup_runs)
+        print(f"cold start (median of {args.startup_runs}): window can open after {report['window_seconds']}s, "
+              f"tutor ready after {report['ready_seconds']}s")
+        return
+    if args.scenario:
+        with open(args.scenario, encoding="utf-8") as f:
+            scenario = json.load(f)
+    else:
+        scenario = default_scenario(args.turns)
+    fake = FakeChatModel(
+        tool_script={turn["student"]: turn.get("tool_calls", []) for turn in scenario},
+        first_token_seconds=args.first_token_latency,
+        seconds_per_token=args.token_latency,
+        reply_words=args.reply_words,
+    )
+    server = None
+    if args.openai_server:
+        server, base_url = fake_openai_server.start_process(fake, slow_fraction=args.slow_fraction, slow_seconds=args.slow_seconds,
+                                                             rate_limit_fraction=args.rate_limit_fraction)
+        os.environ["OPENAI_BASE_URL"] = base_url
+    for tier in router.tiers:
+        router.set_model(tier, llm_client.chat_model(router.tiers[tier], router.timeouts.get(tier)) if server else fake)
+    if args.hedge:
+        router.hedged_call_sites = set(router.call_sites)
+    tracer.enabled = args.trace
+    # Only the pack asked for, not whatever lesson pack is installed.
+    tutor.lesson_pack = load_lesson_pack(args.lesson_pack, tutor.LESSON_PROMPT_VERSION) if args.lesson_pack else None
+    if args.lesson_pack and tutor.lesson_pack is None:
+        parser.error(f"can't serve lessons from {args.lesson_pack}")
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # A cold, private teaching-steps cache so runs are comparable.
+        tutor.teaching_steps_cache = TeachingStepsCache(path=os.path.join(cache_dir, "teaching_steps.sqlite3"))
+        tutor.session_store = SessionStore(path=os.path.join(cache_dir, "sessions.sqlite3"))
+        output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        with output:
+            report = run_benchmark(scenario, args.sessions)
+        tutor.teaching_steps_cache.close()
+        tutor.session_store.close()
+    if server is not None:
+        report["server"] = fake_openai_server.fetch_stats(os.environ["OPENAI_BASE_URL"])
+        server.terminate()
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.check:
+        with open(args.check, encoding="utf-8") as f:
+            found = regressions(report, json.load(f))
+        for line in found:
+            print(f"REGRESSION {line}")
+        if found:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""Record LLM calls of a tutoring session to a cassette file and replay them offline.
+
+A cassette holds the student's inputs and, for every LLM request the session made, the
+request (normalized messages, bound tools and tool choice), the model's reply and how
+long the call took live, plus the tool calls of each turn. CassetteChatModel stands in
+for a tier's chat model: when recording it forwards calls to the real model and saves
+them; when replaying it answers each request from the cassette by content hash, so no
+key or network is needed and replies are identical run to run.
+
+A replayed request with no recorded match is a divergence: the session built a different
+prompt than when it was recorded. It is reported with a diff against the recorded request
+it most likely corresponds to, and that request's reply is used so the replay can go on.
+"""
+import difflib
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, message_to_dict, messages_from_dict
+from langchain_core.messages.utils import message_chunk_to_message
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import ConfigDict
+
+CASSETTE_VERSION = 1
+
+class CassetteMismatch(RuntimeError):
+    pass
+
+def normalize_request(messages: List[BaseMessage], tools: List[dict], tool_choice: Any) -> dict:
+    """The parts of a request that decide the model's reply. Message ids, usage and response
+    metadata, and the per-session prompt cache key differ between runs, so they are left out."""
+    normalized = []
+    for message in messages:
+        entry = {"type": message.type, "content": message.content}
+        if isinstance(message, AIMessage) and message.tool_calls:
+            entry["tool_calls"] = [{"name": call["name"], "args": call["args"], "id": call["id"]} for call in message.tool_calls]
+        if getattr(message, "tool_call_id", None):
+            entry["tool_call_id"] = message.tool_call_id
+        normalized.append(entry)
+    return {
+        "messages": normalized,
+        "tools": [tool["function"]["name"] for tool in tools],
+        # Schemas are long; a changed tool description still shows up as a changed hash.
+        "tools_schema_hash": hashlib.sha256(json.dumps(tools, sort_keys=True).encode("utf-8")).hexdigest()[:16],
+        "tool_choice": tool_choice,
+    }
+
+def request_hash(request: dict) -> str:
+    return hashlib.sha256(json.dumps(request, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def request_diff(expected: dict, actual: dict) -> str:
+    lines = lambda request: json.dumps(request, indent=1, sort_keys=True, default=str).splitlines()
+    return "\n".join(difflib.unified_diff(lines(expected), lines(actual), "recorded", "replayed", lineterm="", n=2))
+
+class Cassette:
+    def __init__(self, path: str):
+        self.path = path
+        self.turns: List[dict] = []
+        self.calls: List[dict] = []
+        self.divergences: List[dict] = []
+        self._used = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str) -> "Cassette":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != CASSETTE_VERSION:
+            raise ValueError(f"{path} is a version {data.get('version')} cassette; expected {CASSETTE_VERSION}")
+        cassette = cls(path)
+        cassette.turns = data["turns"]
+        cassette.calls = data["calls"]
+        return cassette
+
+    def save(self) -> None:
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"version": CASSETTE_VERSION, "turns": self.turns, "calls": self.calls}, f, indent=1)
+
+    def record(self, tier: str, request: dict, response: AIMessage, seconds: float) -> None:
+        with self._lock:
+            self.calls.append({"tier": tier, "hash": request_hash(request), "request": request,
+                               "response": message_to_dict(response), "seconds": round(seconds, 4)})
+
+    def replay(self, tier: str, request: dict) -> AIMessage:
+        """The recorded reply to this request. Identical requests are answered in recorded order."""
+        digest = request_hash(request)
+        with self._lock:
+            index = next((i for i, call in enumerate(self.calls) if i not in self._used and call["hash"] == digest), None)
+            if index is None:
+                # Most likely the same call with a changed prompt: the next unused one of the same kind.
+                kind = request["tool_choice"]
+                index = next((i for i, call in enumerate(self.calls)
+                              if i not in self._used and call["request"]["tool_choice"] == kind), None)
+                if index is None:
+                    raise CassetteMismatch(f"no recorded call left for a {tier} request with tool_choice={kind!r}")
+                self.divergences.append({"call": index, "tier": tier, "diff": request_diff(self.calls[index]["request"], request)})
+            self._used.add(index)
+            return messages_from_dict([self.calls[index]["response"]])[0]
+
+    def unused_calls(self) -> List[int]:
+        return [index for index in range(len(self.calls)) if index not in self._used]
+
+class CassetteChatModel(BaseChatModel):
+    """Chat model for one tier that records calls to `inner` (when set) or replays them from the cassette."""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    cassette: Cassette
+    tier: str
+    inner: Optional[Any] = None
+    bound_tools: List[dict] = []
+    bind_kwargs: Dict[str, Any] = {}
+
+    @property
+    def _llm_type(self) -> str:
+        return "cassette"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.model_copy(update={"bound_tools": [convert_to_openai_tool(t) for t in tools], "bind_kwargs": kwargs})
+
+    def _request(self, messages: List[BaseMessage]) -> dict:
+        return normalize_request(messages, self.bound_tools, self.bind_kwargs.get("tool_choice"))
+
+    def _live_model(self):
+        return self.inner.bind_tools(self.bound_tools, **self.bind_kwargs) if self.bound_tools else self.inner
+
+    def _result(self, message: AIMessage) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        request = self._request(messages)
+        if self.inner is None:
+            return self._result(self.cassette.replay(self.tier, request))
+        started = time.perf_counter()
+        message = self._live_model().invoke(messages)
+        self.cassette.record(self.tier, request, message, time.perf_counter() - started)
+        return self._result(message)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        request = self._request(messages)
+        if self.inner is None:
+            return self._result(self.cassette.replay(self.tier, request))
+        started = time.perf_counter()
+        message = await self._live_model().ainvoke(messages)
+        self.cassette.record(self.tier, request, message, time.perf_counter() - started)
+        return self._result(message)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        request = self._request(messages)
+        if self.inner is None:
+            message = self.cassette.replay(self.tier, request)
+            if message.content:
+                yield ChatGenerationChunk(message=AIMessageChunk(content=message.content))
+            tool_call_chunks = [{"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": index}
+                                for index, call in enumerate(message.tool_calls)]
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=tool_call_chunks,
+                                                             usage_metadata=message.usage_metadata))
+            return
+        started = time.perf_counter()
+        full = None
+        async for chunk in self._live_model().astream(messages):
+            full = chunk if full is None else full + chunk
+            yield ChatGenerationChunk(message=chunk)
+        message = message_chunk_to_message(full) if full is not None else AIMessage(content="")
+        self.cassette.record(self.tier, request, message, time.perf_counter() - started)
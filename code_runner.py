@@ -0,0 +1,301 @@
+"""Run the student's notebook code against the problem's test case in a sandboxed subprocess.
+
+The notebook is free-form (code mixed with notes), so the runnable Python is extracted
+first. The test case is the free text given to set_problem_statement; two shapes are
+understood:
+
+    Input: nums = [1, 3, 5], target = 3        binary_search([1, 3, 5], 3) == 1
+    Output: 1                                  assert binary_search([], 3) == -1
+
+Each run gets a fresh interpreter (`python -I`) in an empty temporary directory, with no
+environment variables (so no API key), CPU, memory, file size and process limits, and a
+wall-clock timeout. Before the student's code runs, an audit hook (which Python code can't
+remove) refuses sockets, starting processes, loading native libraries and opening files
+outside the temporary directory and the Python installation. This stops accidental and
+casual misuse; it is not a security boundary against a determined attacker. Results are
+cached by a hash of the code and the test case.
+"""
+import ast
+import asyncio
+import hashlib
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+TIMEOUT_SECONDS = 5.0
+CPU_SECONDS = 3
+MEMORY_BYTES = 256 * 1024 * 1024
+OUTPUT_BYTES = 1024 * 1024
+MAX_CONCURRENT_RUNS = 4
+CACHE_SIZE = 256
+STDOUT_PREVIEW_CHARS = 500
+
+_CODE_START = re.compile(r"^(def|class|import|from|@)\b")
+_FENCED_BLOCK = re.compile(r"```(?:python|py)?[ \t]*\n(.*?)```", re.DOTALL)
+_INPUT_OUTPUT = re.compile(r"input\s*:\s*(.+?)\s*output\s*:\s*(.+?)(?=\binput\s*:|\bexplanation\s*:|$)", re.IGNORECASE | re.DOTALL)
+
+@dataclass
+class TestRunResult:
+    status: str  # "passed", "failed", "error", "timeout" or "unsupported"
+    summary: str
+    cases: List[dict] = field(default_factory=list)
+    stdout: str = ""
+
+    def format(self) -> str:
+        lines = [f"Test run: {self.status.upper()} - {self.summary}"]
+        for case in self.cases:
+            line = f"- {case['call']}: expected {case['expected']}, got {case['actual']}"
+            if case.get("error"):
+                line = f"- {case['call']}: raised {case['error']}"
+            lines.append(("PASS " if case["passed"] else "FAIL ") + line)
+        if self.stdout:
+            lines.append(f"Printed output:\n{self.stdout}")
+        return "\n".join(lines)
+
+def extract_code(notebook: str) -> Optional[str]:
+    """Return the runnable Python in the notebook, or None if there isn't any."""
+    blocks = _FENCED_BLOCK.findall(notebook)
+    lines = notebook.split("\n")
+    start = next((index for index, line in enumerate(lines) if _CODE_START.match(line)), None)
+    if blocks:
+        candidates = ["\n".join(blocks)]
+    elif start is not None:
+        # Notes before or after the code: try the code start with progressively shorter endings.
+        candidates = ["\n".join(lines[start:end]) for end in range(len(lines), start, -1)]
+    else:
+        candidates = [notebook]
+    for candidate in candidates[:200]:
+        try:
+            tree = ast.parse(candidate)
+        except SyntaxError:
+            continue
+        if any(isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)) for node in tree.body):
+            return _strip_bare_expressions(candidate, tree)
+    return None
+
+def _strip_bare_expressions(source: str, tree: ast.Module) -> str:
+    """Blank out top-level expressions that aren't calls, e.g. a one-word note that happens to parse."""
+    lines = source.split("\n")
+    for node in tree.body:
+        if isinstance(node, ast.Expr) and not isinstance(node.value, ast.Call):
+            for index in range(node.lineno - 1, node.end_lineno):
+                lines[index] = ""
+    return "\n".join(lines)
+
+def _is_valid_expression(source: str) -> bool:
+    try:
+        ast.parse(source, mode="eval")
+        return True
+    except SyntaxError:
+        return False
+
+def parse_test_cases(test_case: str) -> List[dict]:
+    """Turn the free-text test case into calls the sandbox can check. Unknown shapes yield []."""
+    cases = []
+    for line in test_case.split("\n"):
+        line = line.strip().removeprefix("assert ").strip()
+        try:
+            node = ast.parse(line, mode="eval").body
+        except SyntaxError:
+            continue
+        if isinstance(node, ast.Compare) and len(node.ops) == 1 and isinstance(node.ops[0], ast.Eq) and isinstance(node.left, ast.Call):
+            cases.append({"kind": "expression", "call": ast.unparse(node.left), "expected": ast.unparse(node.comparators[0])})
+    if cases:
+        return cases
+    for raw_input, raw_output in _INPUT_OUTPUT.findall(test_case):
+        arguments = " ".join(raw_input.split()).rstrip(",")
+        expected = raw_output.strip().split("\n")[0].strip().rstrip(".")
+        if not _is_valid_expression(f"f({arguments})"):
+            arguments = ", ".join(part.strip() for part in raw_input.strip().split("\n") if part.strip())
+        if _is_valid_expression(f"f({arguments})") and _is_valid_expression(expected):
+            cases.append({"kind": "arguments", "arguments": arguments, "expected": expected})
+    return cases
+
+# Runs inside the sandboxed interpreter: reads {"code", "cases", "limits"} on stdin, prints one JSON result line.
+# The limits are set here rather than in a preexec_fn, which isn't safe in the tutor's threaded process.
+_SANDBOX_SOURCE = r'''
+import contextlib, inspect, io, json, os, sys
+payload = json.loads(sys.stdin.read())
+real_stdout = sys.stdout
+
+try:
+    import resource
+except ImportError:  # Windows: no rlimits, only the timeout applies.
+    resource = None
+if resource is not None:
+    limits = payload["limits"]
+    # SIGXCPU at the soft limit (reported as a timeout); the kernel only SIGKILLs at the hard one.
+    resource.setrlimit(resource.RLIMIT_CPU, (limits["cpu_seconds"], limits["cpu_seconds"] + 1))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (limits["output_bytes"], limits["output_bytes"]))
+    try:
+        resource.setrlimit(resource.RLIMIT_AS, (limits["memory_bytes"], limits["memory_bytes"]))
+    except (ValueError, OSError):  # not enforceable on macOS
+        pass
+    if hasattr(resource, "RLIMIT_NPROC"):
+        resource.setrlimit(resource.RLIMIT_NPROC, (0, 0))
+
+WORK_DIR = os.path.realpath(os.getcwd())
+READABLE = tuple({os.path.realpath(path) for path in (sys.prefix, sys.base_prefix, sys.exec_prefix, sys.base_exec_prefix)})
+WRITE_FLAGS = os.O_WRONLY | os.O_RDWR | os.O_CREAT | os.O_APPEND | os.O_TRUNC
+BLOCKED_EVENTS = ("socket.", "subprocess.", "os.system", "os.exec", "os.posix_spawn", "os.spawn", "os.fork",
+                  "os.kill", "ctypes.", "sys.addaudithook", "_posixsubprocess", "pty.")
+BLOCKED_MODULES = {"_socket", "socket", "_ssl", "ssl", "_ctypes", "ctypes"}
+# Events whose path arguments change the file system: allowed only inside the temporary directory.
+WRITE_EVENTS = {"os.remove": 1, "os.rmdir": 1, "os.mkdir": 1, "os.rename": 2, "os.link": 2, "os.symlink": 2,
+                "os.chmod": 1, "os.chown": 1, "os.truncate": 1, "os.utime": 1, "shutil.rmtree": 1}
+
+def _inside(path, roots):
+    return any(path == root or path.startswith(root + os.sep) for root in roots)
+
+def _audit(event, args):
+    if event.startswith(BLOCKED_EVENTS):
+        raise PermissionError(f"{event} is not allowed in the notebook sandbox")
+    if event == "import" and args[0].partition(".")[0] in BLOCKED_MODULES:
+        raise ImportError(f"module {args[0]} is not available in the notebook sandbox")
+    if event in WRITE_EVENTS:
+        for path in args[:WRITE_EVENTS[event]]:
+            if isinstance(path, (str, bytes)) and not _inside(os.path.realpath(os.fsdecode(path)), (WORK_DIR,)):
+                raise PermissionError(f"{os.fsdecode(path)} is outside the notebook sandbox")
+    if event == "open" and isinstance(args[0], (str, bytes)):
+        path = os.path.realpath(os.fsdecode(args[0]))
+        mode, flags = args[1], args[2]
+        writing = any(c in mode for c in "wax+") if isinstance(mode, str) else bool((flags or 0) & WRITE_FLAGS)
+        if not _inside(path, (WORK_DIR,)) and (writing or not _inside(path, READABLE)):
+            raise PermissionError(f"{path} is outside the notebook sandbox")
+
+sys.addaudithook(_audit)
+
+def report(status, summary, cases=(), stdout=""):
+    real_stdout.write(json.dumps({"status": status, "summary": summary, "cases": list(cases), "stdout": stdout}) + "\n")
+    sys.exit(0)
+
+namespace = {"__name__": "__notebook__"}
+printed = io.StringIO()
+try:
+    with contextlib.redirect_stdout(printed):
+        exec(compile(payload["code"], "notebook", "exec"), namespace)
+except BaseException as e:
+    report("error", f"the code failed to run: {type(e).__name__}: {e}", stdout=printed.getvalue())
+
+def candidates():
+    solution = namespace.get("Solution")
+    found = []
+    if isinstance(solution, type):
+        instance = solution()
+        found += [getattr(instance, name) for name, value in vars(solution).items() if callable(value) and not name.startswith("_")]
+    found += [value for value in namespace.values() if inspect.isfunction(value) and value.__code__.co_filename == "notebook"]
+    return found[::-1]  # the most recently defined function is the likely solution
+
+def pick(args, kwargs):
+    for function in candidates():
+        try:
+            inspect.signature(function).bind(*args, **kwargs)
+            return function
+        except (TypeError, ValueError):
+            continue
+    return None
+
+results = []
+for case in payload["cases"]:
+    result = {"passed": False, "actual": None, "error": None}
+    try:
+        with contextlib.redirect_stdout(printed):
+            expected = eval(case["expected"], dict(namespace))
+            if case["kind"] == "expression":
+                result["call"] = case["call"]
+                actual = eval(case["call"], namespace)
+            else:
+                args, kwargs = eval(f"(lambda *a, **k: (a, k))({case['arguments']})", {})
+                function = pick(args, kwargs)
+                if function is None:
+                    report("unsupported", f"no function in the notebook accepts ({case['arguments']})", stdout=printed.getvalue())
+                result["call"] = f"{function.__name__}({case['arguments']})"
+                actual = function(*args, **kwargs)
+        result["passed"] = actual == expected
+        result["actual"] = repr(actual)
+    except SystemExit:
+        raise
+    except BaseException as e:
+        result.setdefault("call", case.get("call") or case.get("arguments"))
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["expected"] = case["expected"]
+    results.append(result)
+
+passed = sum(result["passed"] for result in results)
+report("passed" if passed == len(results) else "failed", f"{passed}/{len(results)} test cases passed", results, printed.getvalue())
+'''
+
+def _sandbox_env() -> dict:
+    """Nothing from the tutor's environment; on Windows the interpreter needs SYSTEMROOT to start."""
+    return {"SYSTEMROOT": os.environ["SYSTEMROOT"]} if "SYSTEMROOT" in os.environ else {}
+
+def _run_sandbox(code: str, cases: List[dict]) -> TestRunResult:
+    limits = {"cpu_seconds": CPU_SECONDS, "output_bytes": OUTPUT_BYTES, "memory_bytes": MEMORY_BYTES}
+    try:
+        with tempfile.TemporaryDirectory(prefix="goosetor-sandbox-") as work_dir:
+            completed = subprocess.run(
+                [sys.executable, "-I", "-c", _SANDBOX_SOURCE],
+                input=json.dumps({"code": code, "cases": cases, "limits": limits}),
+                capture_output=True,
+                text=True,
+                timeout=TIMEOUT_SECONDS,
+                cwd=work_dir,
+                env=_sandbox_env(),
+            )
+    except subprocess.TimeoutExpired:
+        return TestRunResult("timeout", f"the code did not finish within {TIMEOUT_SECONDS:g}s (infinite loop?)")
+    if completed.returncode == -getattr(signal, "SIGXCPU", 0):
+        return TestRunResult("timeout", f"the code used more than {limits['cpu_seconds']}s of CPU time (infinite loop?)")
+    last_line = completed.stdout.strip().split("\n")[-1] if completed.stdout.strip() else ""
+    try:
+        report = json.loads(last_line)
+    except ValueError:
+        reason = "exceeded the CPU or memory limit" if completed.returncode < 0 else (completed.stderr.strip().split("\n")[-1] or "crashed")
+        return TestRunResult("error", f"the code {reason}")
+    return TestRunResult(report["status"], report["summary"], report["cases"], report["stdout"][:STDOUT_PREVIEW_CHARS])
+
+class CodeRunner:
+    """Runs notebook code in subprocesses, at most MAX_CONCURRENT_RUNS at a time, with a result cache."""
+
+    def __init__(self, max_concurrent_runs: int = MAX_CONCURRENT_RUNS, cache_size: int = CACHE_SIZE):
+        self._semaphore = asyncio.Semaphore(max_concurrent_runs)
+        self._cache: "OrderedDict[str, TestRunResult]" = OrderedDict()
+        # Runs in flight by cache key: a second request for the same code and cases waits on the first.
+        self._running: Dict[str, "asyncio.Task[TestRunResult]"] = {}
+        self.cache_size = cache_size
+
+    async def run(self, notebook: str, test_case: str) -> TestRunResult:
+        code = extract_code(notebook)
+        if code is None:
+            return TestRunResult("unsupported", "no Python function found in the notebook")
+        cases = parse_test_cases(test_case)
+        if not cases:
+            return TestRunResult("unsupported", "the test case is not in a checkable form")
+        key = hashlib.sha256(json.dumps([code, cases]).encode("utf-8")).hexdigest()
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        if key not in self._running:
+            self._running[key] = asyncio.create_task(self._run(key, code, cases))
+        # A caller that gives up (a cancelled turn, a precheck past its wait) leaves the run going for the cache.
+        return await asyncio.shield(self._running[key])
+
+    async def _run(self, key: str, code: str, cases: List[dict]) -> TestRunResult:
+        try:
+            async with self._semaphore:
+                result = await asyncio.to_thread(_run_sandbox, code, cases)
+        finally:
+            del self._running[key]
+        self._cache[key] = result
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return result
+
+code_runner = CodeRunner()
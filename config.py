@@ -0,0 +1,51 @@
+"""Settings shared by the tutor's modules (local stores, model tiers), overridable through environment variables."""
+import os
+
+# Where caches, traces and other local state live.
+DATA_DIR = os.environ.get("GOOSETOR_DATA_DIR", os.path.join(os.path.expanduser("~"), ".goosetor"))
+
+# Model behind each tier. Override with GOOSETOR_MODEL_<TIER>, e.g. GOOSETOR_MODEL_FAST=gpt-4.1-nano.
+MODEL_TIERS = {
+    tier: os.environ.get(f"GOOSETOR_MODEL_{tier.upper()}", model)
+    for tier, model in {"flagship": "gpt-4.1", "fast": "gpt-4.1-mini"}.items()
+}
+# Per-request timeout of each tier; a timed-out call falls back to the call site's next tier.
+MODEL_TIMEOUT_SECONDS = {"flagship": 60.0, "fast": 30.0}
+# Retries of a rate-limited (429) or transiently failing (connection error, 5xx) call on the same
+# tier, with jittered exponential backoff, before it falls back to the next tier. See llm_client.py.
+MODEL_MAX_RETRIES = 2
+RETRY_BASE_SECONDS = 0.5
+RETRY_MAX_SECONDS = 8.0
+# Connection pool shared by every model client.
+HTTP_MAX_CONNECTIONS = 64
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 32
+HTTP_KEEPALIVE_EXPIRY_SECONDS = 90.0
+
+def _call_site_tiers(call_site: str, default: list) -> list:
+    preferred = os.environ.get(f"GOOSETOR_TIER_{call_site.upper()}")
+    return [preferred] + [tier for tier in default if tier != preferred] if preferred else default
+
+# Tiers tried in order by each LLM call site. Override the first choice with
+# GOOSETOR_TIER_<CALL_SITE>, e.g. GOOSETOR_TIER_STEP_UPDATE=flagship.
+CALL_SITE_TIERS = {
+    "chat": _call_site_tiers("chat", ["flagship", "fast"]),
+    "step_generation": _call_site_tiers("step_generation", ["flagship", "fast"]),
+    "problem_generation": _call_site_tiers("problem_generation", ["flagship", "fast"]),
+    "step_update": _call_site_tiers("step_update", ["fast", "flagship"]),
+    "summarize": _call_site_tiers("summarize", ["fast", "flagship"]),
+}
+
+# Deadline of one call at each call site, across its retries and tier fallbacks.
+CALL_SITE_DEADLINE_SECONDS = {"chat": 90.0, "step_generation": 90.0, "problem_generation": 90.0, "step_update": 45.0, "summarize": 60.0}
+
+# Call sites whose slow calls are hedged: once a call has run longer than the p95 time to first
+# output of its call site and tier, a duplicate is sent and whichever answers first is used.
+# Off by default since a hedge costs a second request; e.g. GOOSETOR_HEDGE=chat,step_generation.
+HEDGED_CALL_SITES = [site.strip() for site in os.environ.get("GOOSETOR_HEDGE", "").split(",") if site.strip()]
+# Latencies needed before hedging starts, and the shortest wait before a hedge is sent.
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_SECONDS = 0.5
+
+# Pre-generated lessons (python lesson_pack.py build) served instead of generating teaching steps
+# and a practice problem live; a missing file just means everything is generated as before.
+LESSON_PACK_PATH = os.environ.get("GOOSETOR_LESSON_PACK", os.path.join(DATA_DIR, "lessons.pack"))
@@ -0,0 +1,134 @@
+"""Token-budgeted view of the conversation history.
+
+The full history keeps growing for the whole session; what is sent to the model is
+the pinned prefix (system prompt and greeting, a digest of older turns), the recent
+turns, and a volatile tail (current teaching steps, problem, reminders) rebuilt for
+every call. Everything before the tail only grows by appending, so consecutive calls
+share a byte-identical prefix that the provider can serve from its prompt cache. Older
+turns are folded into the digest incrementally by `ContextManager.compact`, which runs
+between turns; that is the only time the prefix changes.
+"""
+import json
+from typing import Awaitable, Callable, Iterable, List, Optional
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+
+# Rough fixed cost of the role/separator tokens the chat format adds to every message.
+MESSAGE_OVERHEAD_TOKENS = 4
+# Per-message cap when rendering folded turns for the summarizer.
+TRANSCRIPT_MESSAGE_CHARS = 2000
+
+_encoding = None
+_encoding_failed = False
+
+def count_tokens(text: str) -> int:
+    """Count tokens with tiktoken when its encoding is available, otherwise estimate ~4 characters per token."""
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            # tiktoken downloads its encoding on first use, which fails offline.
+            _encoding_failed = True
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+def message_text(message: BaseMessage) -> str:
+    """Text of a message as the model sees it, including tool call arguments."""
+    if isinstance(message.content, str):
+        text = message.content
+    else:
+        text = "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in message.content)
+    if isinstance(message, AIMessage) and message.tool_calls:
+        text += json.dumps([{"name": tool_call["name"], "args": tool_call["args"]} for tool_call in message.tool_calls])
+    return text
+
+def format_transcript(messages: Iterable[BaseMessage]) -> str:
+    """Render messages as a plain transcript for the summarizer."""
+    lines = []
+    for message in messages:
+        text = message_text(message)
+        if len(text) > TRANSCRIPT_MESSAGE_CHARS:
+            text = text[:TRANSCRIPT_MESSAGE_CHARS] + " [...]"
+        if isinstance(message, HumanMessage):
+            role = "Student"
+        elif isinstance(message, AIMessage):
+            role = "Tutor"
+        elif isinstance(message, ToolMessage):
+            role = "Tool result"
+        else:
+            role = "System"
+        lines.append(f"{role}: {text}")
+    return "\n".join(lines)
+
+class ContextManager:
+    """Builds the message list sent to the model from the full history within a token budget."""
+
+    def __init__(self, num_pinned: int, max_history_tokens: int = 12000, keep_recent_tokens: int = 4000):
+        """
+        Args:
+            num_pinned: number of leading history messages that are always sent verbatim (STARTING_MESSAGES).
+            max_history_tokens: once the unfolded turns exceed this, `compact` folds the oldest ones into the digest.
+            keep_recent_tokens: roughly how many tokens of recent turns stay verbatim after compaction.
+        """
+        self.num_pinned = num_pinned
+        self.max_history_tokens = max_history_tokens
+        self.keep_recent_tokens = keep_recent_tokens
+        self.digest = ""
+        self.folded_upto = num_pinned
+        self.last_build_tokens = 0
+        # id(message) -> (message, tokens). Holding the message keeps its id from being reused.
+        self._token_cache = {}
+
+    def message_tokens(self, message: BaseMessage) -> int:
+        cached = self._token_cache.get(id(message))
+        if cached is not None and cached[0] is message:
+            return cached[1]
+        tokens = count_tokens(message_text(message)) + MESSAGE_OVERHEAD_TOKENS
+        self._token_cache[id(message)] = (message, tokens)
+        return tokens
+
+    def build(self, history: List[BaseMessage], volatile_tail: Optional[str] = None) -> List[BaseMessage]:
+        """Return the messages to send: pinned messages, digest and unfolded turns (the stable prefix),
+        then `volatile_tail` as a closing system message that is not part of the history."""
+        digest = [SystemMessage(f"Summary of the earlier conversation:\n{self.digest}")] if self.digest else []
+        tail = [SystemMessage(volatile_tail)] if volatile_tail else []
+        body = history[max(self.folded_upto, self.num_pinned):]
+        pinned = history[:self.num_pinned]
+        # Digest and tail messages are rebuilt on every call, so they are counted without going through the cache.
+        self.last_build_tokens = (sum(self.message_tokens(message) for message in pinned + body)
+                                  + sum(count_tokens(message_text(message)) + MESSAGE_OVERHEAD_TOKENS for message in digest + tail))
+        return pinned + digest + body + tail
+
+    async def compact(self, history: List[BaseMessage], summarize: Callable[[str, List[BaseMessage]], Awaitable[str]]) -> bool:
+        """Fold the oldest unfolded turns into the digest if they are over budget. Returns whether anything was folded.
+
+        `history` must be append-only between calls; folding only ever cuts at a student message so
+        an AI tool call is never separated from its tool results.
+        """
+        start = max(self.folded_upto, self.num_pinned)
+        body = history[start:]
+        if sum(self.message_tokens(message) for message in body) <= self.max_history_tokens:
+            return False
+        boundary = None
+        kept_tokens = 0
+        for index in range(len(history) - 1, start, -1):
+            kept_tokens += self.message_tokens(history[index])
+            if kept_tokens > self.keep_recent_tokens:
+                break
+            if isinstance(history[index], HumanMessage):
+                boundary = index
+        if boundary is None:
+            # Even the latest turn is over the recent budget; keep just that turn.
+            boundary = next((index for index in range(len(history) - 1, start, -1) if isinstance(history[index], HumanMessage)), None)
+        if boundary is None:
+            return False
+        self.digest = await summarize(self.digest, history[start:boundary])
+        self._forget(history[start:boundary])
+        self.folded_upto = boundary
+        return True
+
+    def _forget(self, messages: List[BaseMessage]) -> None:
+        for message in messages:
+            self._token_cache.pop(id(message), None)
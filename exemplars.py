@@ -0,0 +1,138 @@
+"""Curated teaching-step exemplars, picked per concept for the few-shot prompts.
+
+Each file in exemplars/ is one worked answer to "How would you teach X?", with a small
+header:
+
+    concept: binary search
+    keywords: sorted array, halving, invariant, ...
+
+    <exemplar text>
+
+A TF-IDF index over the concept, keywords and text selects the few exemplars closest to
+the requested concept, so generating steps for tries shows a trie-like example instead of
+the same long binary search answer every time. Everything is local; nothing is embedded
+through an API.
+"""
+import math
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from context import count_tokens
+from teaching_steps_cache import normalize_concept, prompt_version
+
+EXEMPLAR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "exemplars")
+TOP_K = 2
+TOKEN_BUDGET = 1800
+# Below this cosine similarity an exemplar is unrelated; the best one is still used as a format example.
+MIN_SIMILARITY = 0.06
+# Terms from the concept name and keywords count this many times more than terms in the text.
+HEADER_WEIGHT = 3
+STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "each", "for", "from", "how", "if",
+    "in", "is", "it", "its", "not", "of", "on", "or", "so", "that", "the", "their", "them", "then", "they",
+    "this", "to", "what", "when", "where", "which", "why", "with", "you", "your",
+}
+
+@dataclass
+class Exemplar:
+    name: str
+    concept: str
+    keywords: List[str]
+    text: str
+    tokens: int
+
+def _words(text: str) -> List[str]:
+    words = []
+    for word in re.findall(r"[a-z0-9+#]+", text.lower()):
+        if word in STOP_WORDS:
+            continue
+        # Light stemming so "tries"/"trie" and "heaps"/"heap" match.
+        if len(word) > 4 and word.endswith("ies"):
+            word = word[:-3] + "ie"
+        elif len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.append(word)
+    return words
+
+def _terms(text: str, header: bool = False) -> List[str]:
+    """Words and word bigrams; header fields also get character trigrams to match misspellings and partial names."""
+    words = _words(text)
+    terms = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    if header:
+        for word in words:
+            padded = f" {word} "
+            terms += [padded[i:i + 3] for i in range(len(padded) - 2)]
+    return terms
+
+def _normalize(vector: Dict[str, float]) -> Dict[str, float]:
+    norm = math.sqrt(sum(value * value for value in vector.values()))
+    return {term: value / norm for term, value in vector.items()} if norm else vector
+
+def load_exemplar(path: str) -> Exemplar:
+    with open(path, encoding="utf-8") as f:
+        header, _, text = f.read().partition("\n\n")
+    fields = dict(line.split(":", 1) for line in header.splitlines() if ":" in line)
+    concept = fields.get("concept", os.path.splitext(os.path.basename(path))[0].replace("_", " ")).strip()
+    keywords = [keyword.strip() for keyword in fields.get("keywords", "").split(",") if keyword.strip()]
+    text = text.strip()
+    return Exemplar(os.path.basename(path), concept, keywords, text, count_tokens(text))
+
+class ExemplarLibrary:
+    def __init__(self, directory: str = EXEMPLAR_DIR):
+        paths = sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".md"))
+        self.exemplars = [load_exemplar(path) for path in paths]
+        counts = []
+        for exemplar in self.exemplars:
+            header = " ".join([exemplar.concept] + exemplar.keywords)
+            term_counts = Counter(_terms(exemplar.text))
+            for term in _terms(header, header=True):
+                term_counts[term] += HEADER_WEIGHT
+            counts.append(term_counts)
+        documents = len(counts)
+        document_frequency = Counter(term for term_counts in counts for term in term_counts)
+        self.idf = {term: math.log((1 + documents) / (1 + frequency)) + 1 for term, frequency in document_frequency.items()}
+        self.vectors = [
+            _normalize({term: (1 + math.log(count)) * self.idf[term] for term, count in term_counts.items()})
+            for term_counts in counts
+        ]
+        # Part of the teaching steps cache key, so editing an exemplar regenerates cached step lists.
+        self.fingerprint = prompt_version(*(f"{exemplar.name}\x00{exemplar.text}" for exemplar in self.exemplars))
+
+    def search(self, concept: str) -> List[Tuple[float, Exemplar]]:
+        """All exemplars with their cosine similarity to the concept, most similar first."""
+        query = " ".join({concept.lower(), normalize_concept(concept)})
+        query_counts = Counter(_terms(query, header=True))
+        query_vector = _normalize({term: (1 + math.log(count)) * self.idf[term]
+                                   for term, count in query_counts.items() if term in self.idf})
+        scored = [(sum(weight * vector.get(term, 0.0) for term, weight in query_vector.items()), exemplar)
+                  for vector, exemplar in zip(self.vectors, self.exemplars)]
+        return sorted(scored, key=lambda item: -item[0])
+
+    def select(self, concept: str, k: int = TOP_K, token_budget: int = TOKEN_BUDGET) -> List[Exemplar]:
+        """Up to k of the closest exemplars that fit in the token budget. The closest one is always
+        included, even when nothing is similar, so the model still sees the expected format."""
+        scored = self.search(concept)
+        if not scored:
+            return []
+        selected = [scored[0][1]]
+        used = scored[0][1].tokens
+        for score, exemplar in scored[1:]:
+            if len(selected) == k or score < MIN_SIMILARITY:
+                break
+            if used + exemplar.tokens <= token_budget:
+                selected.append(exemplar)
+                used += exemplar.tokens
+        return selected
+
+def exemplar_messages(exemplars: List[Exemplar]) -> List[BaseMessage]:
+    """Exemplars as question/answer message pairs, in reverse order of similarity so the
+    closest example sits right before the real question."""
+    messages = []
+    for exemplar in reversed(exemplars):
+        messages += [HumanMessage(content=f"How would you teach {exemplar.concept}?"), AIMessage(content=exemplar.text)]
+    return messages
+
+exemplar_library = ExemplarLibrary()
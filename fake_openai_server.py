@@ -0,0 +1,219 @@
+"""Local OpenAI-compatible stand-in for testing the real client path offline.
+
+Serves /v1/chat/completions (streaming and not, tool calls, json_schema structured output)
+with bench.FakeChatModel's deterministic replies and latency, over HTTP/1.1 keep-alive, so
+the tutor's actual ChatOpenAI clients, connection pool, retries and hedging (llm_client.py)
+can be exercised without a key or network. A fraction of requests can be made slow, to give
+the latency a tail, rate limited (429 with Retry-After), or failed with a 500.
+
+    python fake_openai_server.py --port 8765 --slow-fraction 0.05 --slow-seconds 3
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=fake python terminal_tutor.py
+
+GET /stats returns request and connection counts. bench.py --openai-server starts one in a
+child process (`start_process`), so the server's work doesn't compete with the tutor's for
+the GIL, and runs the benchmark through it.
+"""
+import argparse
+import json
+import multiprocessing
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+
+import httpx
+from langchain_core.messages import AIMessage, convert_to_messages
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, model, port: int = 0, slow_fraction: float = 0.0, slow_seconds: float = 3.0,
+                 rate_limit_fraction: float = 0.0, error_fraction: float = 0.0, seed: int = 0):
+        """
+        Args:
+            model: a bench.FakeChatModel that decides replies, token usage and latency.
+            slow_fraction: share of requests delayed by an extra `slow_seconds` before the first byte.
+            rate_limit_fraction: share of requests answered with 429 and a Retry-After.
+            error_fraction: share of requests answered with 500.
+        """
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.model = model
+        self.slow_fraction = slow_fraction
+        self.slow_seconds = slow_seconds
+        self.rate_limit_fraction = rate_limit_fraction
+        self.error_fraction = error_fraction
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"connections": 0, "requests": 0, "slow_requests": 0, "rate_limited": 0, "server_errors": 0}
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def count(self, key: str) -> None:
+        with self._lock:
+            self.stats[key] += 1
+
+    def roll(self, fraction: float) -> bool:
+        with self._lock:
+            return self._random.random() < fraction
+
+def _serve(model, options: dict, ready) -> None:
+    server = FakeOpenAIServer(model, **options)
+    ready.put(server.base_url)
+    server.serve_forever()
+
+def start_process(model, **options) -> Tuple[multiprocessing.Process, str]:
+    """Serve from a child process; returns the process and the server's base URL. Options are FakeOpenAIServer's."""
+    context = multiprocessing.get_context()
+    ready = context.Queue()
+    process = context.Process(target=_serve, args=(model, options, ready), name="fake-openai-server", daemon=True)
+    process.start()
+    return process, ready.get(timeout=120)
+
+def fetch_stats(base_url: str) -> dict:
+    return httpx.get(f"{base_url}/stats").json()
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so reused connections show up in the stats
+
+    def setup(self):
+        super().setup()
+        self.server.count("connections")
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/stats"):
+            with self.server._lock:
+                return self._send_json(200, dict(self.server.stats))
+        self._send_json(404, {"error": {"message": f"no route {self.path}", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self._send_json(404, {"error": {"message": f"no route {self.path}", "type": "invalid_request_error"}})
+        server: FakeOpenAIServer = self.server
+        server.count("requests")
+        if server.roll(server.rate_limit_fraction):
+            server.count("rate_limited")
+            return self._send_json(429, {"error": {"message": "Rate limit reached", "type": "rate_limit_exceeded"}},
+                                   {"retry-after-ms": "200"})
+        if server.roll(server.error_fraction):
+            server.count("server_errors")
+            return self._send_json(500, {"error": {"message": "The server had an error processing your request", "type": "server_error"}})
+        message = self._reply(body)
+        if server.roll(server.slow_fraction):
+            server.count("slow_requests")
+            time.sleep(server.slow_seconds)
+        try:
+            if body.get("stream"):
+                self._stream(body, message)
+            else:
+                time.sleep(server.model._delay(message))
+                self._send_json(200, self._completion(body, message))
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up on the request (a hedged call's loser, a cancelled turn).
+            self.close_connection = True
+
+    def _reply(self, body: dict) -> AIMessage:
+        model = self.server.model
+        tools = body.get("tools") or []
+        tool_choice = body.get("tool_choice")
+        if isinstance(tool_choice, dict):
+            tool_choice = tool_choice.get("function", {}).get("name", "required")
+        messages = convert_to_messages(body["messages"])
+        response_format = body.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            # with_structured_output(method="json_schema"): the schema's fields as JSON content.
+            message = model.model_copy(update={"bound_tools": [], "tool_choice": None})._respond(messages)
+            args = model._structured_args(response_format["json_schema"]["name"], messages)
+            return AIMessage(content=json.dumps(args), usage_metadata=message.usage_metadata)
+        return model.model_copy(update={"bound_tools": tools, "tool_choice": tool_choice})._respond(messages)
+
+    def _completion(self, body: dict, message: AIMessage) -> dict:
+        tool_calls = [{"id": call["id"], "type": "function", "function": {"name": call["name"], "arguments": json.dumps(call["args"])}}
+                      for call in message.tool_calls]
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}", "object": "chat.completion", "created": int(time.time()), "model": body.get("model"),
+            "choices": [{"index": 0, "finish_reason": "tool_calls" if tool_calls else "stop",
+                         "message": {"role": "assistant", "content": message.content or None, **({"tool_calls": tool_calls} if tool_calls else {})}}],
+            "usage": _usage(message),
+        }
+
+    def _stream(self, body: dict, message: AIMessage):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        chunk_id, created = f"chatcmpl-{uuid.uuid4().hex}", int(time.time())
+
+        def send(delta: dict, finish_reason: Optional[str] = None, usage: Optional[dict] = None):
+            choices = [] if usage else [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            event = {"id": chunk_id, "object": "chat.completion.chunk", "created": created, "model": body.get("model"),
+                     "choices": choices, **({"usage": usage} if usage else {})}
+            self._write_chunk(f"data: {json.dumps(event)}\n\n")
+
+        model = self.server.model
+        time.sleep(model.first_token_seconds)
+        send({"role": "assistant", "content": ""})
+        if message.content:
+            for word in message.content.split(" "):
+                send({"content": word + " "})
+                time.sleep(model.seconds_per_token)
+        for index, call in enumerate(message.tool_calls):
+            send({"tool_calls": [{"index": index, "id": call["id"], "type": "function",
+                                  "function": {"name": call["name"], "arguments": json.dumps(call["args"])}}]})
+        send({}, "tool_calls" if message.tool_calls else "stop")
+        if (body.get("stream_options") or {}).get("include_usage"):
+            send({}, usage=_usage(message))
+        self._write_chunk("data: [DONE]\n\n")
+        self._write_chunk("")
+
+    def _write_chunk(self, text: str):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status: int, payload: dict, headers: Optional[dict] = None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+def _usage(message: AIMessage) -> dict:
+    usage = message.usage_metadata
+    return {"prompt_tokens": usage["input_tokens"], "completion_tokens": usage["output_tokens"], "total_tokens": usage["total_tokens"],
+            "prompt_tokens_details": {"cached_tokens": usage["input_token_details"]["cache_read"]}}
+
+def main():
+    import bench  # FakeChatModel; imported here so bench can import this module
+    parser = argparse.ArgumentParser(description="Serve a local OpenAI-compatible chat completions endpoint with scripted replies.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--first-token-latency", type=float, default=0.2, help="simulated seconds before the first token")
+    parser.add_argument("--token-latency", type=float, default=0.005, help="simulated seconds per output token")
+    parser.add_argument("--reply-words", type=int, default=60, help="words in each reply")
+    parser.add_argument("--slow-fraction", type=float, default=0.0, help="share of requests that are slow")
+    parser.add_argument("--slow-seconds", type=float, default=3.0, help="extra seconds a slow request takes")
+    parser.add_argument("--rate-limit-fraction", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--error-fraction", type=float, default=0.0, help="share of requests answered with 500")
+    args = parser.parse_args()
+    model = bench.FakeChatModel(first_token_seconds=args.first_token_latency, seconds_per_token=args.token_latency,
+                                reply_words=args.reply_words)
+    server = FakeOpenAIServer(model, args.port, args.slow_fraction, args.slow_seconds, args.rate_limit_fraction,
+                              args.error_fraction)
+    print(f"Serving on {server.base_url}; set OPENAI_BASE_URL={server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
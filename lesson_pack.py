@@ -0,0 +1,234 @@
+"""Lesson packs: teaching steps and a checked practice problem per concept, generated ahead of time.
+
+For a course whose concepts are known in advance, `build` does the lesson setup the tutor
+otherwise does live at the start of every session (generating the teaching steps, then
+writing a practice problem) once per concept, a few concepts at a time. Each problem comes
+with a reference solution its test cases are run against, and is regenerated if they fail.
+Finished lessons are appended to a progress file as they complete, so an interrupted build
+resumes where it stopped, and rebuilding after adding concepts only generates the new ones.
+
+A pack is one file: a fixed header, a JSON index of normalized concept -> (offset, length),
+then one JSON record per lesson. The tutor memory-maps config.LESSON_PACK_PATH at startup and
+reads only the index; a lesson is parsed when a session asks for its concept, and serving it
+takes no LLM calls.
+
+    python lesson_pack.py build concepts.txt                    # writes config.LESSON_PACK_PATH
+    python lesson_pack.py build concepts.txt -o course.pack --jobs 8
+    python lesson_pack.py info course.pack
+    python lesson_pack.py show course.pack "binary search"
+
+concepts.txt has one concept per line; blank lines and lines starting with # are skipped.
+"""
+import argparse
+import asyncio
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+from config import LESSON_PACK_PATH
+from teaching_steps_cache import normalize_concept
+
+MAGIC = b"GOOSEPK\x00"
+FORMAT_VERSION = 1
+# Magic, format version and index length; the index JSON follows, then the lesson records.
+HEADER = struct.Struct("<8sII")
+# Concepts generated at once by `build`.
+DEFAULT_JOBS = 4
+
+class LessonPackError(ValueError):
+    pass
+
+class LessonPack:
+    def __init__(self, path: str):
+        """Map the pack at `path` and read its index. Raises LessonPackError if it isn't a pack in this format version."""
+        self.path = path
+        self.hits = 0
+        if os.path.getsize(path) < HEADER.size:
+            raise LessonPackError(f"{path} is too short to be a lesson pack")
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, index_length = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise LessonPackError(f"{path} is not a lesson pack")
+        if version != FORMAT_VERSION:
+            raise LessonPackError(f"{path} is format version {version}; this tutor reads version {FORMAT_VERSION}")
+        header = json.loads(self._map[HEADER.size:HEADER.size + index_length])
+        self.prompt_version: str = header["prompt_version"]
+        self.created_at: float = header["created_at"]
+        self._records_start = HEADER.size + index_length
+        self._index: Dict[str, List[int]] = header["lessons"]
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def get(self, concept: str) -> Optional[dict]:
+        """The lesson for the concept ({"key", "concept", "teaching_steps", "problem"}), or None if the pack has none."""
+        location = self._index.get(normalize_concept(concept))
+        if location is None:
+            return None
+        self.hits += 1
+        return self._read(location)
+
+    def lessons(self) -> Iterator[dict]:
+        for location in self._index.values():
+            yield self._read(location)
+
+    def _read(self, location: List[int]) -> dict:
+        offset, length = location
+        start = self._records_start + offset
+        return json.loads(self._map[start:start + length])
+
+    def stats(self) -> dict:
+        return {"path": self.path, "lessons": len(self), "hits": self.hits}
+
+    def close(self) -> None:
+        self._map.close()
+
+def load_lesson_pack(path: str = LESSON_PACK_PATH, prompt_version: Optional[str] = None) -> Optional[LessonPack]:
+    """The pack at `path`, or None if there is none, it can't be read, or it was built with prompts or models
+    other than `prompt_version` (the tutor then generates lessons live)."""
+    if not os.path.exists(path):
+        return None
+    try:
+        pack = LessonPack(path)
+    except (LessonPackError, OSError, ValueError) as e:
+        print(f"Lesson pack {path} not loaded: {e}")
+        return None
+    if prompt_version is not None and pack.prompt_version != prompt_version:
+        print(f"Lesson pack {path} not loaded: built with prompt version {pack.prompt_version}, this tutor uses {prompt_version}; "
+              "rebuild it with `python lesson_pack.py build`")
+        pack.close()
+        return None
+    print(f"Loaded {len(pack)} lesson(s) from {path}")
+    return pack
+
+def write_pack(path: str, lessons: List[dict], prompt_version: str) -> None:
+    """Write the lessons to `path`, replacing any previous pack in one step."""
+    records, index, offset = [], {}, 0
+    for lesson in sorted(lessons, key=lambda lesson: lesson["key"]):
+        data = json.dumps(lesson, ensure_ascii=False, sort_keys=True).encode("utf-8")
+        index[lesson["key"]] = [offset, len(data)]
+        records.append(data)
+        offset += len(data)
+    header = json.dumps({"prompt_version": prompt_version, "created_at": time.time(), "lessons": index}).encode("utf-8")
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(header)))
+        f.write(header)
+        for data in records:
+            f.write(data)
+    os.replace(temporary, path)
+
+def read_concepts(path: str) -> List[str]:
+    """Concepts listed in the file, without duplicates (by normalized concept)."""
+    concepts, seen = [], set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            concept = line.strip()
+            if not concept or concept.startswith("#") or normalize_concept(concept) in seen:
+                continue
+            seen.add(normalize_concept(concept))
+            concepts.append(concept)
+    return concepts
+
+def _finished_lessons(output: str, progress_path: str, prompt_version: str) -> Dict[str, dict]:
+    """Lessons generated with the current prompts by an earlier build: in the existing pack or the progress file."""
+    finished = {}
+    if os.path.exists(output):
+        pack = load_lesson_pack(output)
+        if pack is not None and pack.prompt_version == prompt_version:
+            finished.update((lesson["key"], lesson) for lesson in pack.lessons())
+        if pack is not None:
+            pack.close()
+    if os.path.exists(progress_path):
+        with open(progress_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # cut short by an interrupted build
+                if record.get("prompt_version") == prompt_version:
+                    finished[record["lesson"]["key"]] = record["lesson"]
+    return finished
+
+async def build(concepts: List[str], output: str, jobs: int = DEFAULT_JOBS) -> Tuple[List[dict], Dict[str, str]]:
+    """Generate the lessons missing from earlier builds, `jobs` at a time, and write the pack.
+    Returns the lessons written and the concepts that failed with their error."""
+    import tutor  # imports this module
+    progress_path = f"{output}.progress.jsonl"
+    finished = _finished_lessons(output, progress_path, tutor.LESSON_PROMPT_VERSION)
+    todo = [concept for concept in concepts if normalize_concept(concept) not in finished]
+    print(f"{len(concepts)} concept(s): {len(concepts) - len(todo)} already generated, {len(todo)} to generate")
+    semaphore = asyncio.Semaphore(jobs)
+    failures: Dict[str, str] = {}
+
+    async def generate(concept: str):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                lesson = await tutor.generate_lesson(concept)
+            except Exception as e:
+                failures[concept] = f"{type(e).__name__}: {e}"
+                print(f"FAILED {concept}: {failures[concept]}")
+                return
+            lesson["key"] = normalize_concept(concept)
+            finished[lesson["key"]] = lesson
+            with open(progress_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"prompt_version": tutor.LESSON_PROMPT_VERSION, "lesson": lesson}) + "\n")
+            print(f"{concept}: {len(lesson['teaching_steps']['steps'])} steps, problem '{lesson['problem']['title']}' "
+                  f"({time.perf_counter() - started:.1f}s)")
+
+    await asyncio.gather(*(generate(concept) for concept in todo))
+    lessons = [finished[normalize_concept(concept)] for concept in concepts if normalize_concept(concept) in finished]
+    write_pack(output, lessons, tutor.LESSON_PROMPT_VERSION)
+    if not failures and os.path.exists(progress_path):
+        os.remove(progress_path)
+    return lessons, failures
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-generate lessons for a list of concepts, or inspect a lesson pack.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_command = commands.add_parser("build", help="generate a lesson per concept and write the pack")
+    build_command.add_argument("concepts", help="text file with one concept per line")
+    build_command.add_argument("-o", "--output", default=LESSON_PACK_PATH, help="pack file (default: the one the tutor loads)")
+    build_command.add_argument("--jobs", type=int, default=DEFAULT_JOBS, help="concepts generated at once")
+    info_command = commands.add_parser("info", help="list the lessons in a pack")
+    info_command.add_argument("pack", nargs="?", default=LESSON_PACK_PATH)
+    show_command = commands.add_parser("show", help="print one lesson as JSON")
+    show_command.add_argument("pack")
+    show_command.add_argument("concept")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        import tutor
+        from model_router import router
+        started = time.perf_counter()
+        lessons, failures = tutor.run_in_agent_loop(build(read_concepts(args.concepts), args.output, args.jobs))
+        cost = sum(tier["cost_usd"] or 0 for tier in router.stats().values())
+        calls = sum(tier["calls"] for tier in router.stats().values())
+        print(f"Wrote {len(lessons)} lesson(s) to {args.output} in {time.perf_counter() - started:.1f}s "
+              f"({calls} LLM calls, ${cost:.4f})")
+        if failures:
+            print(f"{len(failures)} concept(s) failed; run the same command again to retry them")
+            sys.exit(1)
+        return
+    pack = LessonPack(args.pack)
+    if args.command == "info":
+        created = time.strftime("%Y-%m-%d %H:%M", time.localtime(pack.created_at))
+        print(f"{args.pack}: format {FORMAT_VERSION}, prompt version {pack.prompt_version}, built {created}, {len(pack)} lesson(s)")
+        for lesson in pack.lessons():
+            print(f"  {lesson['concept']:<32} {len(lesson['teaching_steps']['steps']):>2} steps  {lesson['problem']['title']}")
+    else:
+        lesson = pack.get(args.concept)
+        if lesson is None:
+            print(f"No lesson for '{args.concept}' in {args.pack}")
+            sys.exit(1)
+        print(json.dumps(lesson, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
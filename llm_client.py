@@ -0,0 +1,149 @@
+"""Client layer shared by every model tier: pooled connections, retries with jitter, and hedged requests.
+
+- All ChatOpenAI clients share one httpx connection pool with keep-alive, so calls reuse warm
+  TLS connections instead of each tier's client opening its own. The async pool belongs to the
+  agent loop, where all async LLM calls run.
+- `call_with_retries` retries rate-limited (429) and transient (connection error, 5xx) failures
+  with full-jitter exponential backoff, honoring the server's Retry-After, and never sleeps past
+  the call's deadline. The OpenAI client's own retries are off so this is the only policy.
+- `hedged` sends a duplicate of a call that is slower than a threshold and returns whichever
+  attempt answers first. A streaming attempt calls `claim_output()` before it shows anything:
+  the first to claim wins and the other is cancelled, so a reply is never streamed twice.
+
+The router (model_router.py) decides deadlines and hedge thresholds per call site; test all of
+this offline against fake_openai_server.py.
+"""
+import asyncio
+import contextvars
+import random
+import threading
+import time
+from typing import Awaitable, Callable, List, Optional, Tuple, TypeVar
+import httpx
+import openai
+from langchain_openai import ChatOpenAI
+from config import (HTTP_KEEPALIVE_EXPIRY_SECONDS, HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE_CONNECTIONS, MODEL_MAX_RETRIES,
+                    RETRY_BASE_SECONDS, RETRY_MAX_SECONDS)
+
+T = TypeVar("T")
+
+_clients: Optional[Tuple[httpx.Client, httpx.AsyncClient]] = None
+_clients_lock = threading.Lock()
+
+def http_clients() -> Tuple[httpx.Client, httpx.AsyncClient]:
+    """The shared sync and async HTTP clients, created on first use."""
+    global _clients
+    with _clients_lock:
+        if _clients is None:
+            limits = httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                                  keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS)
+            # Per-request timeouts are set by each ChatOpenAI client; this is only the fallback.
+            timeout = httpx.Timeout(60.0, connect=10.0)
+            _clients = (httpx.Client(limits=limits, timeout=timeout), httpx.AsyncClient(limits=limits, timeout=timeout))
+        return _clients
+
+def chat_model(model: str, timeout: Optional[float]) -> ChatOpenAI:
+    client, async_client = http_clients()
+    return ChatOpenAI(model=model, stream_usage=True, timeout=timeout, max_retries=0,
+                      http_client=client, http_async_client=async_client)
+
+# ---------- retries ----------
+
+def is_retryable(error: BaseException) -> bool:
+    """Rate limits and failures that a second try of the same request is likely to get past.
+    Timeouts aren't retried: the next tier is a better bet than waiting as long again."""
+    if isinstance(error, openai.APITimeoutError):
+        return False
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    return isinstance(error, openai.APIStatusError) and (error.status_code in (408, 409, 429) or error.status_code >= 500)
+
+def retry_delay(retry: int, error: BaseException) -> float:
+    """Seconds to wait before retry number `retry` (0-based): the server's Retry-After when it sent one,
+    otherwise full jitter over an exponentially growing window, so rate-limited sessions don't retry in lockstep."""
+    response = getattr(error, "response", None)
+    headers = response.headers if response is not None else {}
+    try:
+        if "retry-after-ms" in headers:
+            return min(RETRY_MAX_SECONDS, float(headers["retry-after-ms"]) / 1000)
+        if "retry-after" in headers:
+            return min(RETRY_MAX_SECONDS, float(headers["retry-after"]))
+    except ValueError:
+        pass
+    return random.uniform(0, min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** retry))
+
+async def call_with_retries(attempt: Callable[[], Awaitable[T]], deadline: float, can_retry: Callable[[], bool] = lambda: True,
+                            on_retry: Callable[[BaseException, float], None] = lambda error, delay: None,
+                            max_retries: int = MODEL_MAX_RETRIES) -> T:
+    """Run `attempt()`, retrying retryable failures up to `max_retries` times while the monotonic `deadline` allows."""
+    retry = 0
+    while True:
+        try:
+            return await attempt()
+        except Exception as e:
+            if retry >= max_retries or not is_retryable(e) or not can_retry():
+                raise
+            delay = retry_delay(retry, e)
+            if time.monotonic() + delay >= deadline:
+                raise
+            on_retry(e, delay)
+            await asyncio.sleep(delay)
+            retry += 1
+
+# ---------- hedging ----------
+
+class _Race:
+    def __init__(self):
+        self.tasks: List[asyncio.Task] = []
+        self.winner: Optional[int] = None
+
+# (race, attempt index) of the hedged attempt running in the current task.
+_attempt: contextvars.ContextVar[Optional[Tuple[_Race, int]]] = contextvars.ContextVar("llm_hedge_attempt", default=None)
+
+def claim_output() -> bool:
+    """Called by an attempt right before it shows output (e.g. streams its first token). Returns
+    False if another attempt of the same hedged call already did; outside a hedged call, True."""
+    current = _attempt.get()
+    if current is None:
+        return True
+    race, index = current
+    if race.winner is None:
+        race.winner = index
+        for other, task in enumerate(race.tasks):
+            if other != index:
+                task.cancel()
+    return race.winner == index
+
+async def _run_attempt(race: _Race, index: int, make: Callable[[], Awaitable[T]]) -> T:
+    _attempt.set((race, index))
+    return await make()
+
+async def hedged(make: Callable[[], Awaitable[T]], hedge_after: Optional[float],
+                 on_hedge: Callable[[], None] = lambda: None) -> Tuple[T, bool]:
+    """Await `make()`; if it neither finished nor claimed output within `hedge_after` seconds, start a
+    second `make()` and return the first successful result. Returns (result, whether the duplicate won).
+    With `hedge_after` None this is just `await make()`."""
+    if hedge_after is None:
+        return await make(), False
+    race = _Race()
+    race.tasks.append(asyncio.create_task(_run_attempt(race, 0, make)))
+    try:
+        done, _ = await asyncio.wait(race.tasks, timeout=hedge_after)
+        if done or race.winner is not None:
+            return await race.tasks[0], False
+        on_hedge()
+        race.tasks.append(asyncio.create_task(_run_attempt(race, 1, make)))
+        pending, error = set(race.tasks), None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.cancelled():
+                    continue  # lost the race for output
+                if task.exception() is None:
+                    return task.result(), task is race.tasks[1]
+                error = task.exception()
+        raise error if error is not None else asyncio.CancelledError()
+    finally:
+        for task in race.tasks:
+            if not task.done():
+                task.cancel()
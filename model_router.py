@@ -0,0 +1,193 @@
+"""Model tiers per LLM call site, with fallback and per-tier latency/token/cost accounting.
+
+Each call site (chat, step_generation, step_update, summarize) has an ordered list of
+tiers in config.CALL_SITE_TIERS. `ModelRouter.call` runs the call on the first tier and,
+if it raises (API error, timeout, unparsable structured output), on the next one, all
+within the call site's deadline. Rate limits and transient errors are retried on the same
+tier first, and call sites in config.HEDGED_CALL_SITES hedge calls slower than their p95
+(see llm_client.py). Clients are built lazily, one per tier, with the tier's timeout, on
+one shared connection pool.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional, TypeVar
+import llm_client
+from config import (CALL_SITE_DEADLINE_SECONDS, CALL_SITE_TIERS, HEDGE_MIN_SAMPLES, HEDGE_MIN_SECONDS, HEDGED_CALL_SITES,
+                    MODEL_TIERS, MODEL_TIMEOUT_SECONDS)
+from tracing import Span, percentile, tracer
+
+T = TypeVar("T")
+
+# USD per million tokens: (input, cached input, output). Models not listed are reported without cost.
+MODEL_PRICES = {
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+}
+# Latencies kept per tier for the percentiles.
+LATENCY_WINDOW = 1000
+
+def token_cost(model: str, input_tokens: int, cached_tokens: int, output_tokens: int) -> Optional[float]:
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return None
+    input_price, cached_price, output_price = prices
+    return ((input_tokens - cached_tokens) * input_price + cached_tokens * cached_price + output_tokens * output_price) / 1_000_000
+
+class TierStats:
+    def __init__(self, model: str):
+        self.model = model
+        self.calls = 0
+        self.failures = 0
+        self.fallback_calls = 0  # successful calls that only ran here because an earlier tier failed
+        self.retries = 0
+        self.hedges = 0  # duplicate requests sent for slow calls
+        self.hedge_wins = 0  # of those, the ones that answered first
+        self.input_tokens = 0
+        self.cached_tokens = 0
+        self.output_tokens = 0
+        self.cost_usd = 0.0
+        self.calls_by_site: Dict[str, int] = {}
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def summary(self) -> dict:
+        return {
+            "model": self.model,
+            "calls": self.calls,
+            "failures": self.failures,
+            "fallback_calls": self.fallback_calls,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "calls_by_site": dict(self.calls_by_site),
+            "p50_seconds": percentile(list(self.latencies), 0.5),
+            "p95_seconds": percentile(list(self.latencies), 0.95),
+            "input_tokens": self.input_tokens,
+            "cached_tokens": self.cached_tokens,
+            "output_tokens": self.output_tokens,
+            "cost_usd": round(self.cost_usd, 6) if self.model in MODEL_PRICES else None,
+        }
+
+class ModelRouter:
+    def __init__(self, tiers: Dict[str, str] = MODEL_TIERS, call_sites: Dict[str, List[str]] = CALL_SITE_TIERS,
+                 timeouts: Dict[str, float] = MODEL_TIMEOUT_SECONDS, deadlines: Dict[str, float] = CALL_SITE_DEADLINE_SECONDS,
+                 hedged_call_sites: List[str] = HEDGED_CALL_SITES):
+        self.tiers = dict(tiers)
+        self.call_sites = {site: list(site_tiers) for site, site_tiers in call_sites.items()}
+        self.timeouts = dict(timeouts)
+        self.deadlines = dict(deadlines)
+        self.hedged_call_sites = set(hedged_call_sites)
+        self._models = {}
+        self._stats = {tier: TierStats(model) for tier, model in self.tiers.items()}
+        # Seconds to first output (first streamed chunk, or the whole reply) per (call site, tier), for hedging.
+        self._output_latencies: Dict[tuple, deque] = {}
+        self._lock = threading.Lock()
+
+    def tiers_for(self, call_site: str) -> List[str]:
+        return self.call_sites[call_site]
+
+    def model_name(self, call_site: str) -> str:
+        """Model of the call site's first-choice tier."""
+        return self.tiers[self.tiers_for(call_site)[0]]
+
+    def model(self, tier: str):
+        """The tier's chat model, created on first use."""
+        with self._lock:
+            if tier not in self._models:
+                self._models[tier] = llm_client.chat_model(self.tiers[tier], self.timeouts.get(tier))
+            return self._models[tier]
+
+    def set_model(self, tier: str, model) -> None:
+        """Use `model` for the tier instead of a ChatOpenAI client (benchmarks, local models)."""
+        with self._lock:
+            self._models[tier] = model
+
+    async def call(self, call_site: str, run: Callable[[str, Span], Awaitable[T]],
+                   can_retry: Callable[[], bool] = lambda: True) -> T:
+        """Run `run(tier, span)` on the call site's tiers in order until one succeeds.
+
+        `run` should record the response's token usage on the span. `can_retry` is checked
+        before falling back, e.g. a streamed answer can't be retried once text has been shown.
+        """
+        tiers = self.tiers_for(call_site)
+        deadline = time.monotonic() + self.deadlines.get(call_site, float("inf"))
+        for attempt, tier in enumerate(tiers):
+            started = time.perf_counter()
+            try:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"{call_site} call ran past its {self.deadlines[call_site]:.0f}s deadline")
+                with tracer.span("llm", call_site=call_site, tier=tier, model=self.tiers[tier], attempt=attempt + 1) as span:
+                    result = await asyncio.wait_for(self._call_tier(call_site, tier, run, span, deadline, can_retry), remaining)
+                    self._record(tier, call_site, time.perf_counter() - started, span, fallback=attempt > 0)
+                return result
+            except Exception as e:
+                with self._lock:
+                    self._stats[tier].failures += 1
+                if attempt + 1 == len(tiers) or not can_retry() or time.monotonic() >= deadline:
+                    raise
+                print(f"{call_site} call on the {tier} tier failed ({type(e).__name__}: {e}); trying {tiers[attempt + 1]}")
+
+    async def _call_tier(self, call_site: str, tier: str, run: Callable[[str, Span], Awaitable[T]], span: Span,
+                         deadline: float, can_retry: Callable[[], bool]) -> T:
+        """One tier's share of a call: retries of rate limits and transient errors, each attempt hedged if slow."""
+        def on_hedge():
+            with self._lock:
+                self._stats[tier].hedges += 1
+            span.set(hedged=True)
+
+        def on_retry(error, delay):
+            with self._lock:
+                self._stats[tier].retries += 1
+            span.set(retries=span.attributes.get("retries", 0) + 1)
+            print(f"{call_site} call on the {tier} tier failed ({type(error).__name__}); retrying in {delay:.2f}s")
+
+        attempt = lambda: llm_client.hedged(lambda: run(tier, span), self.hedge_after(call_site, tier), on_hedge)
+        result, hedge_won = await llm_client.call_with_retries(attempt, deadline, can_retry, on_retry)
+        if hedge_won:
+            with self._lock:
+                self._stats[tier].hedge_wins += 1
+            span.set(hedge_won=True)
+        return result
+
+    def hedge_after(self, call_site: str, tier: str) -> Optional[float]:
+        """Seconds after which a call is hedged: the p95 time to first output of recent calls, or
+        None if the call site isn't hedged or there aren't enough calls yet to know what slow is."""
+        if call_site not in self.hedged_call_sites:
+            return None
+        with self._lock:
+            latencies = list(self._output_latencies.get((call_site, tier), ()))
+        if len(latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        return max(HEDGE_MIN_SECONDS, percentile(latencies, 0.95))
+
+    def _record(self, tier: str, call_site: str, seconds: float, span: Span, fallback: bool) -> None:
+        input_tokens = span.attributes.get("input_tokens", 0)
+        cached_tokens = span.attributes.get("cached_tokens", 0)
+        output_tokens = span.attributes.get("output_tokens", 0)
+        cost = token_cost(self.tiers[tier], input_tokens, cached_tokens, output_tokens)
+        first_output = span.attributes["first_chunk_ms"] / 1000 if "first_chunk_ms" in span.attributes else seconds
+        if cost is not None:
+            span.set(cost_usd=round(cost, 6))
+        with self._lock:
+            stats = self._stats[tier]
+            stats.calls += 1
+            stats.fallback_calls += fallback
+            stats.calls_by_site[call_site] = stats.calls_by_site.get(call_site, 0) + 1
+            stats.latencies.append(seconds)
+            self._output_latencies.setdefault((call_site, tier), deque(maxlen=LATENCY_WINDOW)).append(first_output)
+            stats.input_tokens += input_tokens
+            stats.cached_tokens += cached_tokens
+            stats.output_tokens += output_tokens
+            stats.cost_usd += cost or 0.0
+
+    def stats(self) -> dict:
+        """Per-tier calls, failures, latency percentiles, tokens and cost since startup."""
+        with self._lock:
+            return {tier: stats.summary() for tier, stats in self._stats.items()}
+
+router = ModelRouter()
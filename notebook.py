@@ -0,0 +1,117 @@
+"""Line-indexed notebook document kept in sync with the frontend through edit deltas.
+
+The frontend sends line operations ({"start", "delete", "insert"}) against a version
+number instead of re-uploading the whole notebook. The document remembers which lines
+changed since the tutor last saw it, so the "Notebook changes" diff only has to look
+at that region instead of both full snapshots.
+"""
+import difflib
+import re
+from typing import List, Optional, Sequence, Set, Tuple
+
+DIFF_CONTEXT_LINES = 3
+_HUNK_HEADER = re.compile(r"^@@ -(\d+)((?:,\d+)?) \+(\d+)((?:,\d+)?) @@")
+
+# Unchanged prefix/suffix length when nothing has been edited since the tutor last looked.
+_UNBOUNDED = float("inf")
+
+class NotebookDeltaError(ValueError):
+    pass
+
+class NotebookDocument:
+    def __init__(self, content: str = ""):
+        self.lines = content.split("\n")
+        self.version = 0
+        self.mark_seen()
+
+    @property
+    def line_count(self) -> int:
+        return len(self.lines)
+
+    def text(self) -> str:
+        return "\n".join(self.lines)
+
+    def set_text(self, content: str, version: Optional[int] = None) -> None:
+        """Replace the whole document (initial load or resync after a version mismatch)."""
+        self._mark_changed(0, len(self.lines))
+        self.lines = content.split("\n")
+        self.version = self.version + 1 if version is None else version
+
+    def apply(self, base_version: int, ops: Sequence[dict]) -> bool:
+        """Apply line operations made against `base_version`. Returns False, leaving the document
+        untouched, if the frontend's base version doesn't match ours and it needs to resync.
+        Raises NotebookDeltaError, also leaving it untouched, if any operation is malformed."""
+        if base_version != self.version:
+            return False
+        ops = _validated(ops, len(self.lines))
+        for start, delete, insert in ops:
+            self._mark_changed(start, start + delete)
+            self.lines[start:start + delete] = insert
+        if not self.lines:
+            self.lines = [""]
+        self.version = base_version + 1
+        return True
+
+    def _mark_changed(self, start: int, end: int) -> None:
+        """Record that current lines [start, end) are being replaced."""
+        self._unchanged_prefix = min(self._unchanged_prefix, start)
+        self._unchanged_suffix = min(self._unchanged_suffix, len(self.lines) - end)
+
+    def has_unseen_changes(self) -> bool:
+        return self._unchanged_prefix != _UNBOUNDED
+
+    def mark_seen(self) -> None:
+        """The tutor has now seen the current content."""
+        self._seen_lines = list(self.lines)
+        self._unchanged_prefix = _UNBOUNDED
+        self._unchanged_suffix = _UNBOUNDED
+
+    def diff_since_seen(self) -> str:
+        """Unified diff from the content the tutor last saw, computed over the changed region only."""
+        if self._unchanged_prefix == _UNBOUNDED:
+            return ""
+        old, new = self._seen_lines, self.lines
+        prefix = min(self._unchanged_prefix, len(old), len(new))
+        suffix = min(self._unchanged_suffix, len(old) - prefix, len(new) - prefix)
+        window_start = max(0, prefix - DIFF_CONTEXT_LINES)
+        old_window = old[window_start:len(old) - suffix + min(suffix, DIFF_CONTEXT_LINES)]
+        new_window = new[window_start:len(new) - suffix + min(suffix, DIFF_CONTEXT_LINES)]
+        diff = difflib.unified_diff(old_window, new_window, fromfile="notebook", tofile="notebook", lineterm="", n=DIFF_CONTEXT_LINES)
+        return "\n".join(_shift_hunk_header(line, window_start) for line in diff)
+
+    def changed_lines(self) -> Set[int]:
+        """Indexes of current lines added or edited since the tutor last saw the document."""
+        if self._unchanged_prefix == _UNBOUNDED:
+            return set()
+        old, new = self._seen_lines, self.lines
+        prefix = min(self._unchanged_prefix, len(old), len(new))
+        suffix = min(self._unchanged_suffix, len(old) - prefix, len(new) - prefix)
+        matcher = difflib.SequenceMatcher(None, old[prefix:len(old) - suffix], new[prefix:len(new) - suffix], autojunk=False)
+        return {prefix + index for tag, _, _, start, end in matcher.get_opcodes() if tag != "equal" for index in range(start, end)}
+
+def _validated(ops: Sequence[dict], line_count: int) -> List[Tuple[int, int, List[str]]]:
+    """The operations as (start, delete, insert) after checking all of them against the line
+    count each one will see, so a bad one is caught before anything is applied."""
+    if not isinstance(ops, (list, tuple)):
+        raise NotebookDeltaError(f"operations must be a list, not {type(ops).__name__}")
+    validated = []
+    for index, op in enumerate(ops):
+        if not isinstance(op, dict):
+            raise NotebookDeltaError(f"operation {index} is not an object")
+        start, delete, insert = op.get("start"), op.get("delete"), op.get("insert")
+        if not all(isinstance(value, int) and not isinstance(value, bool) for value in (start, delete)):
+            raise NotebookDeltaError(f"operation {index} needs integer start and delete")
+        if not isinstance(insert, list) or not all(isinstance(line, str) for line in insert):
+            raise NotebookDeltaError(f"operation {index} needs insert as a list of strings")
+        if start < 0 or delete < 0 or start + delete > line_count:
+            raise NotebookDeltaError(f"operation {index}: line range {start}+{delete} outside document of {line_count} lines")
+        line_count += len(insert) - delete
+        validated.append((start, delete, list(insert)))
+    return validated
+
+def _shift_hunk_header(line: str, offset: int) -> str:
+    if not offset or not line.startswith("@@"):
+        return line
+    match = _HUNK_HEADER.match(line)
+    old_start, old_len, new_start, new_len = match.groups()
+    return f"@@ -{int(old_start) + offset}{old_len} +{int(new_start) + offset}{new_len} @@" + line[match.end():]
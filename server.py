@@ -0,0 +1,233 @@
+"""Serve web/index.html to many students from one process.
+
+Each browser tab gets its own tutor.Session. The frontend calls session methods with
+POST /api/call/<method> and long-polls POST /api/events for streaming events, so the
+server only needs the standard library. Sessions idle for longer than --idle-timeout
+(no call and no event poll, i.e. the tab was closed) are evicted from memory; they stay
+in the session store and are resumed when the tab comes back.
+
+    python server.py --host 0.0.0.0 --port 8000
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from tutor import FRONTEND_METHODS, Session
+
+WEB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "web")
+CONTENT_TYPES = {".html": "text/html; charset=utf-8", ".js": "application/javascript", ".css": "text/css"}
+EVENT_POLL_TIMEOUT = 25.0
+MAX_QUEUED_EVENTS = 2000
+
+class EventQueue:
+    """Streaming events of one session, waiting for the frontend's next long poll."""
+
+    def __init__(self):
+        self._events = deque(maxlen=MAX_QUEUED_EVENTS)
+        self._condition = threading.Condition()
+
+    def put(self, event: dict) -> None:
+        with self._condition:
+            self._events.append(event)
+            self._condition.notify_all()
+
+    def wait(self, timeout: float) -> List[dict]:
+        with self._condition:
+            if not self._events:
+                self._condition.wait(timeout)
+            events = list(self._events)
+            self._events.clear()
+        return events
+
+class SessionManager:
+    """Live sessions by id. The lock only guards the dicts: resuming from the store and closing an
+    evicted session happen outside it, so one slow session doesn't hold up requests for the others."""
+
+    def __init__(self, idle_timeout: float):
+        self.idle_timeout = idle_timeout
+        self._sessions: Dict[str, Session] = {}
+        self._queues: Dict[str, EventQueue] = {}
+        # Evicted sessions still being closed; resuming one waits until its last state is stored.
+        self._closing: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+
+    def open(self, session_id: Optional[str] = None) -> Session:
+        """Return the session with this id, live or resumed from the store, or start a new one."""
+        session = self._live_or_stored(session_id) if session_id else None
+        if session is None:
+            session = Session()
+            with self._lock:
+                self._add(session)
+        session.touch()
+        return session
+
+    def get(self, session_id: str) -> Optional[Session]:
+        return self._live_or_stored(session_id)
+
+    def _live_or_stored(self, session_id: str) -> Optional[Session]:
+        while True:
+            with self._lock:
+                session = self._sessions.get(session_id)
+                closing = self._closing.get(session_id)
+            if session is not None:
+                return session
+            if closing is not None:
+                closing.wait()
+                continue
+            session = Session.resume(session_id)
+            if session is None:
+                return None
+            with self._lock:
+                # Another request may have resumed it meanwhile (use theirs), or resumed and evicted it (load again).
+                if session_id in self._sessions:
+                    return self._sessions[session_id]
+                if session_id not in self._closing:
+                    return self._add(session)
+
+    def _add(self, session: Session) -> Session:
+        queue = EventQueue()
+        session.emit_event = queue.put
+        self._sessions[session.id] = session
+        self._queues[session.id] = queue
+        return session
+
+    def rekey(self, old_id: str, session: Session) -> None:
+        """Track a session under its new id after new_session started a new conversation in it."""
+        with self._lock:
+            if self._sessions.get(old_id) is session:
+                del self._sessions[old_id]
+                self._sessions[session.id] = session
+                self._queues[session.id] = self._queues.pop(old_id)
+
+    def events(self, session_id: str) -> Optional[EventQueue]:
+        """The session's event queue, resuming an evicted session (with a new queue) like any other request.
+        A poll counts as activity: a tab that is open but quiet keeps its session in memory."""
+        session = self._live_or_stored(session_id)
+        if session is None:
+            return None
+        session.touch()
+        with self._lock:
+            return self._queues.get(session.id)
+
+    def evict_idle(self) -> int:
+        cutoff = time.monotonic() - self.idle_timeout
+        with self._lock:
+            idle = [(session_id, session) for session_id, session in self._sessions.items() if session.last_active < cutoff]
+            for session_id, _ in idle:
+                del self._sessions[session_id]
+                del self._queues[session_id]
+                self._closing[session_id] = threading.Event()
+        for session_id, session in idle:
+            try:
+                session.close()
+            finally:
+                with self._lock:
+                    closed = self._closing.pop(session_id)
+                closed.set()
+        return len(idle)
+
+    def run_evictor(self, interval: float = 60.0) -> None:
+        def loop():
+            while True:
+                time.sleep(interval)
+                evicted = self.evict_idle()
+                if evicted:
+                    print(f"Evicted {evicted} idle session(s); {len(self._sessions)} active")
+        threading.Thread(target=loop, name="session-evictor", daemon=True).start()
+
+class TutorRequestHandler(BaseHTTPRequestHandler):
+    sessions: SessionManager = None
+
+    def _send_json(self, status: int, body: dict) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/":
+            path = "/index.html"
+        file_path = os.path.normpath(os.path.join(WEB_DIR, path.lstrip("/")))
+        if not file_path.startswith(WEB_DIR + os.sep) or not os.path.isfile(file_path):
+            self.send_error(404)
+            return
+        with open(file_path, "rb") as f:
+            data = f.read()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPES.get(os.path.splitext(file_path)[1], "application/octet-stream"))
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        try:
+            body = self._read_json()
+        except ValueError:
+            self._send_json(400, {"error": "invalid JSON"})
+            return
+        if self.path == "/api/open_session":
+            session = self.sessions.open(body.get("session_id"))
+            self._send_json(200, {"session_id": session.id})
+            return
+        session_id = body.get("session_id") or ""
+        if self.path == "/api/events":
+            queue = self.sessions.events(session_id)
+            if queue is None:
+                self._send_json(404, {"error": "unknown session"})
+                return
+            timeout = min(float(body.get("timeout", EVENT_POLL_TIMEOUT)), EVENT_POLL_TIMEOUT)
+            self._send_json(200, {"events": queue.wait(timeout)})
+            return
+        if self.path.startswith("/api/call/"):
+            method = self.path[len("/api/call/"):]
+            if method not in FRONTEND_METHODS:
+                self._send_json(404, {"error": f"unknown method {method}"})
+                return
+            session = self.sessions.get(session_id)
+            if session is None:
+                self._send_json(404, {"error": "unknown session"})
+                return
+            try:
+                result = getattr(session, method)(*body.get("args", []))
+            except Exception as e:
+                print(f"{method} failed for session {session_id}: {e!r}")
+                self._send_json(500, {"error": str(e)})
+                return
+            if method == "new_session":
+                self.sessions.rekey(session_id, session)
+            self._send_json(200, {"result": result})
+            return
+        self._send_json(404, {"error": "not found"})
+
+    def log_message(self, format, *args):
+        # Event long polls would otherwise log a line every few seconds per student.
+        if "/api/events" not in self.requestline:
+            super().log_message(format, *args)
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the Goosetor tutor to many students over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--idle-timeout", type=float, default=30 * 60, help="seconds before an idle session is evicted")
+    args = parser.parse_args()
+
+    TutorRequestHandler.sessions = SessionManager(idle_timeout=args.idle_timeout)
+    TutorRequestHandler.sessions.run_evictor()
+    server = ThreadingHTTPServer((args.host, args.port), TutorRequestHandler)
+    server.daemon_threads = True
+    print(f"Serving Goosetor on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
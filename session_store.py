@@ -0,0 +1,253 @@
+"""Durable store of tutoring sessions: messages, problem, notebook, teaching steps and history digest.
+
+Messages are appended one row each, keyed by their position in the session's history,
+and each kind of state (problem, notebook, teaching_steps, context) is logged on every
+change with its latest value kept alongside for resuming. Writes are queued and committed
+in batches by a background thread, so neither the UI thread nor the agent loop waits on
+disk. Resuming reads the latest state and only the history after the digest, which stays
+small however long the session is; older messages are read on demand.
+
+List and prune stored sessions:
+
+    python session_store.py list
+    python session_store.py prune --days 30
+"""
+import argparse
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+from config import DATA_DIR
+
+# How long the writer waits for more writes before committing a batch.
+FLUSH_INTERVAL_SECONDS = 0.2
+MAX_BATCH = 500
+# Cap on messages loaded on resume, in case the history was never compacted (e.g. the summarizer kept failing).
+RESUME_MAX_MESSAGES = 400
+STATE_KINDS = ("problem", "notebook", "teaching_steps", "context", "prepared_problem")
+
+class SessionStore:
+    def __init__(self, path: Optional[str] = None, enabled: Optional[bool] = None):
+        """
+        Args:
+            path: SQLite file; defaults to sessions.sqlite3 in config.DATA_DIR.
+            enabled: set GOOSETOR_SESSION_STORE=0 to keep sessions in memory only.
+        """
+        self.enabled = os.environ.get("GOOSETOR_SESSION_STORE", "1") != "0" if enabled is None else enabled
+        if path is None:
+            path = os.path.join(DATA_DIR, "sessions.sqlite3")
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._writer = None
+
+    def _connection(self) -> sqlite3.Connection:
+        # Opened on first use so importing the tutor doesn't touch the disk.
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    id TEXT PRIMARY KEY,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    concept TEXT NOT NULL DEFAULT '',
+                    message_count INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated_at);
+                CREATE TABLE IF NOT EXISTS messages (
+                    session_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    role TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (session_id, seq)
+                );
+                CREATE TABLE IF NOT EXISTS state (
+                    session_id TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (session_id, kind)
+                );
+                CREATE TABLE IF NOT EXISTS state_log (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS state_log_session ON state_log (session_id, kind);
+            """)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    # ---------- writes ----------
+
+    def write(self, session_id: str, messages: List[Tuple[int, BaseMessage]] = (), state: Optional[Dict[str, dict]] = None,
+              truncate_from: Optional[int] = None) -> None:
+        """Queue new history messages (seq, message) and changed state for the background writer.
+        `truncate_from` first deletes the stored messages from that seq on (history rolled back by a cancelled turn)."""
+        if not self.enabled or (not messages and not state and truncate_from is None):
+            return
+        rows = [(seq, message.type, json.dumps(message_to_dict(message))) for seq, message in messages]
+        state_rows = {kind: json.dumps(payload) for kind, payload in (state or {}).items()}
+        concept = (state or {}).get("teaching_steps", {}).get("concept")
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="session-store-writer", daemon=True)
+                self._writer.start()
+        self._queue.put((session_id, time.time(), rows, state_rows, concept, truncate_from))
+
+    def flush(self) -> None:
+        """Block until every queued write is committed."""
+        if self.enabled and self._writer is not None:
+            self._queue.join()
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _write_loop(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + FLUSH_INTERVAL_SECONDS
+            while len(batch) < MAX_BATCH:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                print(f"Session store write failed: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write_batch(self, batch: List[tuple]) -> None:
+        # Within a batch only the last value of each state kind is kept, so a burst of
+        # notebook edits costs one write.
+        latest: Dict[Tuple[str, str], Tuple[float, str]] = {}
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                for session_id, at, rows, state_rows, concept, truncate_from in batch:
+                    conn.execute("INSERT OR IGNORE INTO sessions (id, created_at, updated_at) VALUES (?, ?, ?)", (session_id, at, at))
+                    if truncate_from is not None:
+                        conn.execute("DELETE FROM messages WHERE session_id = ? AND seq >= ?", (session_id, truncate_from))
+                        conn.execute("UPDATE sessions SET message_count = MIN(message_count, ?) WHERE id = ?", (truncate_from, session_id))
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO messages (session_id, seq, role, payload, created_at) VALUES (?, ?, ?, ?, ?)",
+                        [(session_id, seq, role, payload, at) for seq, role, payload in rows])
+                    conn.execute(
+                        "UPDATE sessions SET updated_at = ?, message_count = MAX(message_count, ?), concept = COALESCE(?, concept) WHERE id = ?",
+                        (at, max((seq + 1 for seq, _, _ in rows), default=0), concept, session_id))
+                    for kind, payload in state_rows.items():
+                        latest[(session_id, kind)] = (at, payload)
+                for (session_id, kind), (at, payload) in latest.items():
+                    conn.execute("INSERT OR REPLACE INTO state (session_id, kind, payload, updated_at) VALUES (?, ?, ?, ?)",
+                                 (session_id, kind, payload, at))
+                    conn.execute("INSERT INTO state_log (session_id, kind, payload, created_at) VALUES (?, ?, ?, ?)",
+                                 (session_id, kind, payload, at))
+
+    # ---------- reads ----------
+
+    def load(self, session_id: str, from_seq: Optional[int] = None) -> Optional[dict]:
+        """Latest state of a session and its messages from `from_seq` on (default: after the digest),
+        or None if the session isn't stored."""
+        if not self.enabled:
+            return None
+        self.flush()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT message_count FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            if row is None:
+                return None
+            state = {kind: json.loads(payload) for kind, payload in
+                     conn.execute("SELECT kind, payload FROM state WHERE session_id = ?", (session_id,))}
+            if from_seq is None:
+                from_seq = state.get("context", {}).get("folded_upto", 0)
+            from_seq = max(from_seq, row[0] - RESUME_MAX_MESSAGES)
+            rows = conn.execute("SELECT seq, payload FROM messages WHERE session_id = ? AND seq >= ? ORDER BY seq",
+                                (session_id, from_seq)).fetchall()
+        return {
+            "state": state,
+            "message_count": row[0],
+            "first_seq": rows[0][0] if rows else row[0],
+            "messages": messages_from_dict([json.loads(payload) for _, payload in rows]),
+        }
+
+    def messages(self, session_id: str, before_seq: Optional[int] = None, limit: int = 50,
+                 roles: Tuple[str, ...] = ("human", "ai")) -> List[Tuple[int, BaseMessage]]:
+        """Up to `limit` stored messages before `before_seq`, oldest first, for showing older history."""
+        if not self.enabled:
+            return []
+        self.flush()
+        placeholders = ",".join("?" * len(roles))
+        with self._lock:
+            rows = self._connection().execute(
+                f"SELECT seq, payload FROM messages WHERE session_id = ? AND seq < ? AND role IN ({placeholders}) ORDER BY seq DESC LIMIT ?",
+                (session_id, before_seq if before_seq is not None else 2 ** 62, *roles, limit)).fetchall()
+        rows.reverse()
+        return list(zip((seq for seq, _ in rows), messages_from_dict([json.loads(payload) for _, payload in rows])))
+
+    def latest_session_id(self) -> Optional[str]:
+        sessions = self.list_sessions(limit=1)
+        return sessions[0]["id"] if sessions else None
+
+    def list_sessions(self, limit: int = 50) -> List[dict]:
+        """Most recently active sessions first."""
+        if not self.enabled:
+            return []
+        self.flush()
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT id, created_at, updated_at, concept, message_count FROM sessions ORDER BY updated_at DESC LIMIT ?",
+                (limit,)).fetchall()
+        return [dict(zip(("id", "created_at", "updated_at", "concept", "message_count"), row)) for row in rows]
+
+    def prune(self, older_than_seconds: float) -> int:
+        """Delete sessions not active for this long, with their messages and state. Returns how many."""
+        if not self.enabled:
+            return 0
+        self.flush()
+        cutoff = time.time() - older_than_seconds
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                ids = [row[0] for row in conn.execute("SELECT id FROM sessions WHERE updated_at < ?", (cutoff,))]
+                for table, column in (("messages", "session_id"), ("state", "session_id"), ("state_log", "session_id"), ("sessions", "id")):
+                    conn.executemany(f"DELETE FROM {table} WHERE {column} = ?", [(session_id,) for session_id in ids])
+        return len(ids)
+
+session_store = SessionStore()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List or prune stored tutoring sessions.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    list_command = commands.add_parser("list")
+    list_command.add_argument("--limit", type=int, default=20)
+    prune_command = commands.add_parser("prune")
+    prune_command.add_argument("--days", type=float, required=True, help="delete sessions idle for longer than this")
+    args = parser.parse_args()
+    if args.command == "list":
+        for session in session_store.list_sessions(args.limit):
+            updated = time.strftime("%Y-%m-%d %H:%M", time.localtime(session["updated_at"]))
+            print(f"{session['id']}  {updated}  {session['message_count']:>5} messages  {session['concept'] or '-'}")
+    else:
+        print(f"Pruned {session_store.prune(args.days * 24 * 3600)} session(s)")
@@ -0,0 +1,183 @@
+"""Persistent cache of generated teaching step lists, keyed by normalized concept.
+
+Entries are stored in SQLite as the TeachingStepList JSON. The key also covers the
+prompt and model version, so changing either silently starts a fresh set of entries.
+A concept can hold several variants; lookups pick one at random so popular concepts
+don't always get the exact same lesson plan.
+
+Lookups only read: the hit/miss counters and last-used times they update are kept in
+memory and written with the next `put`, every COUNTER_FLUSH_EVERY lookups, or on `flush`.
+The methods block on SQLite, so async callers run them with asyncio.to_thread.
+"""
+import hashlib
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from config import DATA_DIR
+
+# Lookups between writes of the in-memory counters and last-used times.
+COUNTER_FLUSH_EVERY = 20
+
+CONCEPT_ALIASES = {
+    "bfs": "breadth first search",
+    "dfs": "depth first search",
+    "dp": "dynamic programming",
+    "bst": "binary search tree",
+    "dsu": "union find",
+    "disjoint set union": "union find",
+}
+FILLER_WORDS = {"a", "an", "the", "algorithm", "algorithms", "concept", "of", "how", "to", "use"}
+
+def normalize_concept(concept: str) -> str:
+    """Lowercase, strip punctuation and filler words, and map common abbreviations, so
+    'Binary Search', 'binary-search algorithm' and 'the binary search' share an entry."""
+    text = re.sub(r"[^a-z0-9+#]+", " ", concept.lower()).strip()
+    text = CONCEPT_ALIASES.get(text, text)
+    words = [word for word in text.split() if word not in FILLER_WORDS]
+    text = " ".join(words) or text
+    return CONCEPT_ALIASES.get(text, text)
+
+def prompt_version(*parts: str) -> str:
+    """Short hash of everything that shapes the generated steps (prompt text, model name)."""
+    return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()[:16]
+
+class TeachingStepsCache:
+    def __init__(self, path: Optional[str] = None, ttl_seconds: float = 30 * 24 * 3600, max_entries: int = 2000, max_variants: int = 1):
+        """
+        Args:
+            path: SQLite file; defaults to teaching_steps_cache.sqlite3 in config.DATA_DIR.
+            ttl_seconds: entries older than this are treated as missing and evicted.
+            max_entries: total rows kept; least recently used rows are evicted beyond this.
+            max_variants: step lists kept per concept. With more than one, lookups for a concept
+                that has fewer variants than this sometimes miss so another variant gets generated.
+        """
+        if path is None:
+            path = os.path.join(DATA_DIR, "teaching_steps_cache.sqlite3")
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_variants = max_variants
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        self._lock = threading.Lock()
+        # Not yet written: counter increments, and last-used times by (cache_key, variant).
+        self._pending_counts = {"hits": 0, "misses": 0}
+        self._pending_used: Dict[Tuple[str, int], float] = {}
+
+    def _connection(self) -> sqlite3.Connection:
+        # Opened on first use so importing the tutor doesn't touch the disk.
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS teaching_steps (
+                    cache_key TEXT NOT NULL,
+                    variant INTEGER NOT NULL,
+                    concept TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL,
+                    PRIMARY KEY (cache_key, variant)
+                );
+                CREATE INDEX IF NOT EXISTS teaching_steps_last_used ON teaching_steps (last_used_at);
+                CREATE TABLE IF NOT EXISTS cache_counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            """)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def key(self, concept: str, version: str) -> str:
+        return f"{version}:{normalize_concept(concept)}"
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the payload of one fresh variant for `key`, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT variant, payload FROM teaching_steps WHERE cache_key = ? AND created_at >= ?",
+                (key, now - self.ttl_seconds)).fetchall()
+            # Below max_variants, miss with the probability of the free slots to grow the pool.
+            if not rows or random.random() >= len(rows) / self.max_variants:
+                self._count("misses")
+                return None
+            variant, payload = random.choice(rows)
+            self._pending_used[(key, variant)] = now
+            self._count("hits")
+            return payload
+
+    def put(self, key: str, concept: str, payload: str) -> None:
+        """Store a new variant, replacing the least recently used one when the concept is full."""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            self._write_pending(conn)
+            conn.execute("DELETE FROM teaching_steps WHERE created_at < ?", (now - self.ttl_seconds,))
+            rows = conn.execute(
+                "SELECT variant FROM teaching_steps WHERE cache_key = ? ORDER BY last_used_at", (key,)).fetchall()
+            if len(rows) >= self.max_variants:
+                variant = rows[0][0]
+            else:
+                used = {row[0] for row in rows}
+                variant = next(index for index in range(self.max_variants) if index not in used)
+            conn.execute(
+                "INSERT OR REPLACE INTO teaching_steps (cache_key, variant, concept, payload, created_at, last_used_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, variant, concept, payload, now, now))
+            conn.execute("""
+                DELETE FROM teaching_steps WHERE rowid IN (
+                    SELECT rowid FROM teaching_steps ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+                )""", (self.max_entries,))
+            conn.commit()
+
+    def _count(self, name: str) -> None:
+        setattr(self, name, getattr(self, name) + 1)
+        self._pending_counts[name] += 1
+        if sum(self._pending_counts.values()) >= COUNTER_FLUSH_EVERY:
+            conn = self._connection()
+            self._write_pending(conn)
+            conn.commit()
+
+    def _write_pending(self, conn: sqlite3.Connection) -> None:
+        """Add the pending counter increments and last-used times to the open transaction."""
+        conn.executemany(
+            "INSERT INTO cache_counters (name, value) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            [(name, count) for name, count in self._pending_counts.items() if count])
+        conn.executemany("UPDATE teaching_steps SET last_used_at = ? WHERE cache_key = ? AND variant = ? AND last_used_at < ?",
+                         [(at, key, variant, at) for (key, variant), at in self._pending_used.items()])
+        self._pending_counts = dict.fromkeys(self._pending_counts, 0)
+        self._pending_used = {}
+
+    def flush(self) -> None:
+        """Write the pending counters and last-used times."""
+        with self._lock:
+            if any(self._pending_counts.values()) or self._pending_used:
+                conn = self._connection()
+                self._write_pending(conn)
+                conn.commit()
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> dict:
+        """Hit/miss counters for this process and across all runs sharing the cache file."""
+        self.flush()
+        with self._lock:
+            conn = self._connection()
+            totals = dict(conn.execute("SELECT name, value FROM cache_counters").fetchall())
+            entries = conn.execute("SELECT COUNT(*) FROM teaching_steps").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "total_hits": totals.get("hits", 0),
+            "total_misses": totals.get("misses", 0),
+            "entries": entries,
+        }
@@ -1,94 +1,178 @@
-# tutorial link: https://python.langchain.com/v0.1/docs/modules/model_io/chat/function_calling/
-from langchain_core.messages import HumanMessage, ToolMessage, AIMessage, SystemMessage
-from langchain_openai import ChatOpenAI
-from langchain_core.tools import tool
-from typing import Annotated, Literal, Optional
-import os 
-import prompts
+"""Headless driver for the tutor's agent loop (tutor.Session), with cassette record and replay.
 
-llm = ChatOpenAI(model="gpt-4.1")
+Chat in the terminal, or run a script of turns, against the same Session the desktop app
+and server use. With --record every LLM request and reply, and every tool call, is saved
+to a cassette; --replay runs the recorded inputs again offline, answering LLM calls from
+the cassette, and reports where the prompts or tool results diverge from the recording and
+how long each turn spends in local code (everything but the model).
 
-@tool
-def add(a: int, b: int) -> int:
-    """Adds a and b.
-    Args:
-        a: first int
-        b: second int
-    """
-    return a + b
+    python terminal_tutor.py                                   # chat
+    python terminal_tutor.py --record session.json             # chat and record
+    python terminal_tutor.py --script turns.json --record session.json
+    python terminal_tutor.py --replay session.json --strict    # exit 1 on any divergence
 
-@tool
-def multiply(
-        a: Annotated[int, "The first number to multiply"],
-        b: Annotated[int, "The second number to multiply"],
-    ) -> int:
-    """Multiplies a and b."""
-    return a * b
+In the chat, `/notebook PATH` puts a file's contents in the notebook before the next message.
+A script is a JSON list of turns in bench.py's scenario format: {"student", "notebook"?}
+where "notebook" is a list of line edits, or {"student", "notebook_text"}.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import List, Optional
 
-@tool
-def get_guided_discovery_steps(concept: str) -> str:
-    """Gets expert-curated guided discovery steps for teaching a student the given concept."""
-    prompt = prompts.GUIDED_DISCOVERY_STEPS_PROMPT.format(concept=concept)
-    response = llm.invoke(prompt)
-    extra_instructions = "NOTICE: Do not show the steps to the student, keep this as your internal knowledge for reference only. Instead, guide the student through the steps one by one. Make sure they can answer the question in each step before moving on to the next."
-    res = response.content + "\n" + extra_instructions
-    return res
+if "--replay" in sys.argv:
+    # The ChatOpenAI clients are never called during a replay.
+    os.environ.setdefault("OPENAI_API_KEY", "cassette-replay")
 
-tool_name_map = {
-    "add": add,
-    "multiply": multiply,
-    "get_guided_discovery_steps": get_guided_discovery_steps
-}
+from langchain_core.messages import AIMessage, ToolMessage
+import tutor
+from cassette import Cassette, CassetteChatModel
+from model_router import router
+from session_store import SessionStore
+from teaching_steps_cache import TeachingStepsCache
+from tracing import tracer
 
-tools = list(tool_name_map.values())
-llm_with_tools = llm.bind_tools(tools)
-# llm_with_tools = llm.bind_tools(tools, tool_choice="any") # force the llm to always choose at least 1 tool
-# llm_with_tools = llm.bind_tools(tools, tool_choice="multiply") # force the llm to always choose the multiply tool
+GREETING = "Greetings! What concept would you like to explore today?"
 
-greeting_message = "Greetings! What concept would you like to explore today?"
+def interactive_turns():
+    print("Chat with the tutor! Type 'exit' or 'quit' to end the conversation.\n")
+    print(f"Agent: {GREETING}\n")
+    notebook_text = None
+    while True:
+        try:
+            user_input = input("You: ").strip()
+        except EOFError:
+            return
+        if user_input.lower() in ("exit", "quit", "q"):
+            print("Goodbye!")
+            return
+        if user_input.startswith("/notebook "):
+            with open(user_input[len("/notebook "):].strip(), encoding="utf-8") as f:
+                notebook_text = f.read()
+            print("(notebook updated)")
+            continue
+        if not user_input:
+            continue
+        turn = {"student": user_input}
+        if notebook_text is not None:
+            turn["notebook_text"] = notebook_text
+            notebook_text = None
+        yield turn
 
-# Initialize conversation history
-messages = [
-    SystemMessage(content="You are a tutor who wants to help students learn concepts by guiding them to derive the concept on their own."),
-    AIMessage(content=greeting_message)
-]
+def turn_tool_calls(new_messages) -> List[dict]:
+    """Tool calls made during a turn, with their outputs."""
+    calls = {call["id"]: call for message in new_messages if isinstance(message, AIMessage) for call in message.tool_calls}
+    return [{"name": calls[message.tool_call_id]["name"], "args": calls[message.tool_call_id]["args"], "output": message.content}
+            for message in new_messages if isinstance(message, ToolMessage) and message.tool_call_id in calls]
 
-print("Chat with the agent! Type 'exit' or 'quit' to end the conversation.\n")
-print(f"Agent: {greeting_message}\n")
+def run_turn(session: "tutor.Session", turn: dict) -> dict:
+    if turn.get("notebook"):
+        result = session.apply_notebook_delta(session.notebook.version, turn["notebook"])
+        if not result["ok"]:
+            raise RuntimeError(f"notebook edit does not apply: {turn['notebook']}")
+    elif turn.get("notebook_text") is not None:
+        session.set_notebook_section(turn["notebook_text"])
+    history_length = len(session.messages)
+    started = time.perf_counter()
+    reply = session.send_message(turn["student"])
+    seconds = time.perf_counter() - started
+    # Background step refreshes and compaction change the next prompt, so they finish before
+    # the next turn; otherwise a replay would race them differently than the recording did.
+    session.wait_for_background_work()
+    stats = session.get_turn_stats()
+    return {"reply": reply, "tools": turn_tool_calls(session.messages[history_length:]), "seconds": round(seconds, 4),
+            "llm_seconds": round(stats["llm_seconds"], 4), "tool_seconds": round(stats["tool_seconds"], 4)}
 
-while True:
-    # Get user input
-    user_input = input("You: ").strip()
-    
-    # Check for exit commands
-    if user_input.lower() in ['exit', 'quit', 'q']:
-        print("Goodbye!")
-        break
-    
-    if not user_input:
-        continue
-    
-    # Add user message to conversation history
-    messages.append(HumanMessage(user_input))
-    
-    # Get AI response
-    ai_msg = llm_with_tools.invoke(messages)
-    messages.append(ai_msg)
-    
-    # Process tool calls if any
-    if ai_msg.tool_calls:
-        for tool_call in ai_msg.tool_calls:
-            selected_tool = tool_name_map[tool_call["name"].lower()]
-            print(f"Calling tool: {tool_call['name'].lower()} with args: {tool_call['args']}")
-            tool_output = selected_tool.invoke(tool_call["args"])
-            messages.append(ToolMessage(tool_output, tool_call_id=tool_call["id"]))
-        
-        # Get final response after tool execution
-        final_response = llm_with_tools.invoke(messages)
-        messages.append(final_response)
-        print(f"Agent: {final_response.content}\n")
+def replay_report(cassette: Cassette, results: List[dict]) -> List[str]:
+    """Print per-turn local time and divergences; return the divergences."""
+    problems = []
+    for index, (recorded, replayed) in enumerate(zip(cassette.turns, results), 1):
+        print(f"turn {index}: local {replayed['seconds'] * 1000:.1f} ms (tools {replayed['tool_seconds'] * 1000:.1f} ms); "
+              f"recorded {recorded['seconds']:.2f}s, {recorded['llm_seconds']:.2f}s of it in the LLM")
+        if replayed["reply"] != recorded["reply"]:
+            problems.append(f"turn {index}: the reply differs from the recording")
+        for recorded_call, replayed_call in zip(recorded["tools"], replayed["tools"]):
+            if recorded_call != replayed_call:
+                problems.append(f"turn {index}: {replayed_call['name']} call or output differs:\n"
+                                f"  recorded {json.dumps(recorded_call)[:300]}\n  replayed {json.dumps(replayed_call)[:300]}")
+        if len(recorded["tools"]) != len(replayed["tools"]):
+            problems.append(f"turn {index}: {len(replayed['tools'])} tool calls, recorded {len(recorded['tools'])}")
+    for divergence in cassette.divergences:
+        problems.append(f"LLM call {divergence['call']} ({divergence['tier']}) was built differently:\n{divergence['diff']}")
+    unused = cassette.unused_calls()
+    if unused:
+        problems.append(f"{len(unused)} recorded LLM call(s) were not made: {unused}")
+    local = sum(result["seconds"] for result in results)
+    live = sum(turn["seconds"] for turn in cassette.turns)
+    print(f"{len(results)} turns: {local * 1000:.1f} ms local in total, {live:.2f}s when recorded; "
+          f"{len(problems)} divergence(s)")
+    for problem in problems:
+        print(f"DIVERGENCE {problem}")
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive a tutor session from the terminal, recording or replaying its LLM calls.")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--record", metavar="CASSETTE", help="save every LLM call and tool call to this file")
+    mode.add_argument("--replay", metavar="CASSETTE", help="rerun a recorded session offline and report divergences")
+    parser.add_argument("--script", help="JSON list of turns to send instead of reading from the terminal")
+    parser.add_argument("--strict", action="store_true", help="with --replay, exit 1 if anything diverged")
+    parser.add_argument("--verbose", action="store_true", help="with --replay, keep the tutor's console output")
+    args = parser.parse_args()
+
+    cassette: Optional[Cassette] = None
+    if args.replay:
+        cassette = Cassette.load(args.replay)
+        turns = cassette.turns
     else:
-        # No tool calls, just display the response
-        print(f"Agent: {ai_msg.content}\n")
-    
-    print("="*100)
+        if args.record:
+            cassette = Cassette(args.record)
+        if args.script:
+            with open(args.script, encoding="utf-8") as f:
+                turns = json.load(f)
+        else:
+            turns = interactive_turns()
+    if cassette is not None:
+        for tier in router.tiers:
+            inner = router.model(tier) if args.record else None
+            router.set_model(tier, CassetteChatModel(cassette=cassette, tier=tier, inner=inner))
+        # Recording and replay must see the same tool results: no teaching steps cached
+        # from earlier runs or served from a lesson pack, and nothing resumed or written
+        # to the session store.
+        tracer.enabled = False
+        tutor.lesson_pack = None
+        cache_dir = tempfile.TemporaryDirectory()
+        tutor.teaching_steps_cache = TeachingStepsCache(path=os.path.join(cache_dir.name, "teaching_steps.sqlite3"))
+        tutor.session_store = SessionStore(enabled=False)
+
+    session = tutor.Session()
+    results = []
+    quiet = args.replay and not args.verbose
+    for turn in turns:
+        output = contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext()
+        with output:
+            result = run_turn(session, turn)
+        results.append(result)
+        if not args.replay:
+            print(f"Agent: {result['reply']}\n")
+            print("=" * 100)
+        if args.record:
+            cassette.turns.append({"student": turn["student"], **{key: turn[key] for key in ("notebook", "notebook_text") if key in turn},
+                                   **result})
+            cassette.save()
+    session.close()
+
+    if args.replay:
+        problems = replay_report(cassette, results)
+        if args.strict and problems:
+            sys.exit(1)
+    elif args.record:
+        print(f"Recorded {len(cassette.turns)} turn(s) and {len(cassette.calls)} LLM call(s) to {args.record}")
+
+if __name__ == "__main__":
+    main()
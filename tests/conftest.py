@@ -0,0 +1,53 @@
+"""Offline test setup: the tutor talks to bench.FakeChatModel and keeps its data in a temporary directory."""
+import os
+import sys
+import tempfile
+
+# Before anything imports config: no API key needed, nothing written under ~/.goosetor.
+os.environ["GOOSETOR_DATA_DIR"] = tempfile.mkdtemp(prefix="goosetor-tests-")
+os.environ["GOOSETOR_SESSION_STORE"] = "0"
+os.environ["GOOSETOR_TRACE"] = "0"
+os.environ.setdefault("OPENAI_API_KEY", "offline-tests")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import tutor
+from bench import FakeChatModel
+from model_router import router
+from session_store import SessionStore
+
+@pytest.fixture
+def use_fake_model():
+    """Route every tier to a FakeChatModel (or subclass) built with the given options; returns the model.
+    Sessions from the `session` fixture are rebound to it (a session binds its chat model when it is created)."""
+    previous = dict(router._models)
+
+    def use(model_class=FakeChatModel, **options) -> FakeChatModel:
+        model = model_class(**{"first_token_seconds": 0.01, "seconds_per_token": 0.001, "reply_words": 20, **options})
+        for tier in router.tiers:
+            router.set_model(tier, model)
+        for session in use.sessions:
+            session._chat_models.clear()
+        return model
+
+    use.sessions = []
+    use()
+    yield use
+    router._models.clear()
+    router._models.update(previous)
+
+@pytest.fixture
+def session(use_fake_model):
+    session = tutor.Session()
+    use_fake_model.sessions.append(session)
+    yield session
+    session.close()
+
+@pytest.fixture
+def stored_sessions(tmp_path, monkeypatch):
+    """A session store in a temporary file, for tests of saving and resuming sessions."""
+    store = SessionStore(path=str(tmp_path / "sessions.sqlite3"), enabled=True)
+    monkeypatch.setattr(tutor, "session_store", store)
+    yield store
+    store.close()
@@ -0,0 +1,74 @@
+import asyncio
+import sys
+
+import pytest
+
+import code_runner
+from code_runner import CodeRunner, _run_sandbox, parse_test_cases
+
+CASES = parse_test_cases("f() == 1")
+rlimits = pytest.mark.skipif(sys.platform == "win32", reason="no rlimits on Windows")
+
+def run(body: str):
+    """Run `f`, whose body is the given code followed by `return 1`, in the sandbox."""
+    code = "def f():\n" + "".join(f"    {line}\n" for line in body.split("\n")) + "    return 1\n"
+    return _run_sandbox(code, CASES)
+
+def error(result) -> str:
+    assert result.status == "failed", result
+    return result.cases[0]["error"]
+
+def test_sandboxed_code_runs():
+    result = run("import math\nopen('scratch.txt', 'w').write(str(math.pi))")
+    assert result.status == "passed", result
+
+@pytest.mark.parametrize("body", ["import socket", "import _socket", "import urllib.request", "import ssl"])
+def test_no_network(body):
+    assert error(run(body)).startswith("ImportError")
+
+@pytest.mark.parametrize("body", ["open('/tmp/goosetor-sandbox-escape.txt', 'w')", "import os\nos.remove('/etc/hostname')",
+                                  "import os\nos.mkdir('/tmp/goosetor-sandbox-escape')", "open('/etc/passwd')"])
+def test_no_files_outside_the_sandbox(body):
+    assert error(run(body)).startswith("PermissionError")
+
+@pytest.mark.parametrize("body", ["import os\nos.fork()", "import os\nos.system('true')",
+                                  "import subprocess\nsubprocess.run(['true'])", "import os\nos.kill(1, 0)"])
+def test_no_new_processes(body):
+    assert error(run(body)).startswith("PermissionError")
+
+@rlimits
+def test_memory_limit():
+    assert error(run(f"data = bytearray({2 * code_runner.MEMORY_BYTES})")).startswith("MemoryError")
+
+@rlimits
+def test_file_size_limit():
+    assert error(run(f"open('big.txt', 'w').write('x' * {2 * code_runner.OUTPUT_BYTES})")).startswith("OSError")
+
+@rlimits
+def test_cpu_limit(monkeypatch):
+    monkeypatch.setattr(code_runner, "CPU_SECONDS", 1)
+    result = run("while True:\n    pass")
+    assert result.status == "timeout" and "CPU time" in result.summary
+
+def test_wall_clock_timeout(monkeypatch):
+    monkeypatch.setattr(code_runner, "TIMEOUT_SECONDS", 1.0)
+    result = run("import time\ntime.sleep(10)")
+    assert result.status == "timeout" and "did not finish" in result.summary
+
+def test_identical_concurrent_runs_share_one_execution(monkeypatch):
+    executions = []
+
+    def counting_run_sandbox(code, cases):
+        executions.append(code)
+        return _run_sandbox(code, cases)
+
+    monkeypatch.setattr(code_runner, "_run_sandbox", counting_run_sandbox)
+    notebook = "def f():\n    return 1"
+
+    async def scenario():
+        runner = CodeRunner()
+        return await asyncio.gather(runner.run(notebook, "f() == 1"), runner.run(notebook, "f() == 1"))
+
+    first, second = asyncio.run(scenario())
+    assert first.status == "passed" and first is second
+    assert len(executions) == 1
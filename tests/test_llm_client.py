@@ -0,0 +1,116 @@
+import asyncio
+import threading
+import time
+
+import openai
+import pytest
+
+import llm_client
+from bench import FakeChatModel
+from fake_openai_server import FakeOpenAIServer
+from llm_client import call_with_retries, claim_output, hedged
+from tutor import run_in_agent_loop
+
+@pytest.fixture
+def server(monkeypatch):
+    """A fake OpenAI endpoint in a thread of this process, so tests can change its behavior between requests."""
+    server = FakeOpenAIServer(FakeChatModel(first_token_seconds=0.01, seconds_per_token=0.001, reply_words=5), slow_seconds=0.5)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def chat(timeout=5.0):
+    return llm_client.chat_model("fake-model", timeout)
+
+async def stream(model, shown: list) -> str:
+    """Stream a reply the way the tutor does: claim the output before showing the first chunk."""
+    text = ""
+    async for chunk in model.astream("hi"):
+        if not text and not claim_output():
+            raise asyncio.CancelledError()
+        text += chunk.content
+        shown.append(chunk.content)
+    return text
+
+def test_a_rate_limited_call_is_retried_after_the_retry_after(server):
+    server.rate_limit_fraction = 1.0
+    retries = []
+
+    def on_retry(error, delay):
+        retries.append((error.status_code, delay))
+        server.rate_limit_fraction = 0.0
+
+    reply = run_in_agent_loop(call_with_retries(lambda: chat().ainvoke("hi"), time.monotonic() + 5, on_retry=on_retry))
+    assert reply.content == " ".join(f"word{index}" for index in range(5))
+    assert retries == [(429, 0.2)]
+    assert server.stats["requests"] == 2 and server.stats["rate_limited"] == 1
+
+def test_a_server_error_is_retried(server):
+    server.error_fraction = 1.0
+    retries = []
+
+    def on_retry(error, delay):
+        retries.append(error.status_code)
+        server.error_fraction = 0.0
+
+    reply = run_in_agent_loop(call_with_retries(lambda: chat().ainvoke("hi"), time.monotonic() + 5, on_retry=on_retry))
+    assert reply.content
+    assert retries == [500]
+    assert server.stats["requests"] == 2 and server.stats["server_errors"] == 1
+
+def test_retries_give_up_rather_than_sleep_past_the_deadline(server):
+    server.rate_limit_fraction = 1.0
+    started = time.monotonic()
+    deadline = started + 0.5
+    with pytest.raises(openai.RateLimitError):
+        run_in_agent_loop(call_with_retries(lambda: chat().ainvoke("hi"), deadline, max_retries=10))
+    # Retry-After is 0.2s: tries at about 0, 0.2 and 0.4s, then a fourth would start past the deadline.
+    assert time.monotonic() < deadline
+    assert server.stats["requests"] == 3
+
+def test_the_hedge_answers_a_slow_call_and_the_slow_attempt_is_cancelled(server):
+    server.slow_fraction = 1.0
+    hedges, shown, finished = [], [], []
+
+    def on_hedge():
+        hedges.append(time.monotonic())
+        server.slow_fraction = 0.0  # the duplicate is fast
+
+    async def attempt():
+        text = await stream(chat(), shown)
+        finished.append(text)
+        return text
+
+    started = time.monotonic()
+    text, hedge_won = run_in_agent_loop(hedged(attempt, 0.1, on_hedge))
+    assert hedge_won and len(hedges) == 1
+    assert time.monotonic() - started < 0.5
+    # The slow attempt never streams: it was cancelled while waiting for its first byte.
+    time.sleep(0.6)
+    assert finished == [text]
+    assert "".join(shown) == text
+    assert server.stats["requests"] == 2 and server.stats["slow_requests"] == 1
+
+def test_the_first_attempt_to_stream_wins_without_duplicate_output(server):
+    server.model = server.model.model_copy(update={"first_token_seconds": 0.2})
+    shown, finished = [], []
+
+    def on_hedge():
+        server.slow_fraction = 1.0  # the duplicate is still waiting when the first attempt streams
+
+    async def attempt():
+        text = await stream(chat(), shown)
+        finished.append(text)
+        return text
+
+    text, hedge_won = run_in_agent_loop(hedged(attempt, 0.1, on_hedge))
+    time.sleep(0.6)
+    assert not hedge_won
+    assert finished == [text]
+    assert "".join(shown) == text
+    assert server.stats["requests"] == 2
+
+def test_claim_output_outside_a_hedged_call():
+    assert claim_output()
@@ -0,0 +1,59 @@
+import pytest
+
+from notebook import NotebookDeltaError, NotebookDocument
+
+def test_ops_apply_in_order_against_the_shifted_document():
+    document = NotebookDocument("a\nb\nc")
+    assert document.apply(0, [{"start": 1, "delete": 1, "insert": ["B", "B2"]}, {"start": 3, "delete": 1, "insert": []}])
+    assert document.text() == "a\nB\nB2"
+    assert document.version == 1
+    assert document.changed_lines() == {1, 2}
+
+def test_stale_base_version_asks_for_a_resync():
+    document = NotebookDocument("a")
+    assert not document.apply(5, [{"start": 0, "delete": 1, "insert": ["x"]}])
+    assert document.text() == "a" and document.version == 0
+
+@pytest.mark.parametrize("ops", [
+    [{"start": 4, "delete": 0, "insert": ["x"]}],
+    [{"start": 1, "delete": 3, "insert": []}],
+    [{"start": -1, "delete": 0, "insert": ["x"]}],
+    # Valid against the original three lines, not after the first op removed two of them.
+    [{"start": 0, "delete": 2, "insert": []}, {"start": 2, "delete": 0, "insert": ["x"]}],
+], ids=["start-past-end", "delete-past-end", "negative-start", "range-shifted-by-earlier-op"])
+def test_out_of_range_delta_is_rejected_without_changes(ops):
+    document = NotebookDocument("a\nb\nc")
+    with pytest.raises(NotebookDeltaError):
+        document.apply(0, ops)
+    assert document.text() == "a\nb\nc"
+    assert document.version == 0
+    assert not document.has_unseen_changes()
+
+@pytest.mark.parametrize("ops", [
+    [{"start": 0, "insert": ["x"]}],
+    [{"start": 0, "delete": 0}],
+    [{"start": "0", "delete": 0, "insert": []}],
+    [{"start": True, "delete": 0, "insert": []}],
+    [{"start": 0, "delete": 0, "insert": "x"}],
+    [{"start": 0, "delete": 0, "insert": [1]}],
+    [["start", 0]],
+    {"start": 0, "delete": 0, "insert": []},
+    # The first op is fine; the second must stop both from applying.
+    [{"start": 0, "delete": 1, "insert": ["x"]}, {"start": 0}],
+], ids=["no-delete", "no-insert", "string-start", "bool-start", "string-insert", "non-string-line", "op-not-object",
+        "ops-not-list", "bad-second-op"])
+def test_malformed_delta_is_rejected_without_changes(ops):
+    document = NotebookDocument("a\nb\nc")
+    with pytest.raises(NotebookDeltaError):
+        document.apply(0, ops)
+    assert document.text() == "a\nb\nc"
+    assert document.version == 0
+
+def test_session_answers_a_malformed_delta_with_a_resync(session):
+    session.set_notebook_section("a\nb")
+    version = session.notebook.version
+    assert session.apply_notebook_delta(version, [{"start": 0}]) == {"ok": False, "version": version}
+    assert session.apply_notebook_delta(version, [{"start": 9, "delete": 0, "insert": ["x"]}]) == {"ok": False, "version": version}
+    assert session.notebook.text() == "a\nb"
+    assert session.apply_notebook_delta(version, [{"start": 2, "delete": 0, "insert": ["c"]}]) == {"ok": True, "version": version + 1}
+    assert session.notebook.text() == "a\nb\nc"
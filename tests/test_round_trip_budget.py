@@ -0,0 +1,30 @@
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from bench import FakeChatModel
+from tutor import MAX_LLM_ROUND_TRIPS
+
+class ToolLoopModel(FakeChatModel):
+    """Calls a tool on every round trip, even when told to answer in text."""
+
+    def _respond(self, messages):
+        message = super()._respond(messages)
+        if self.tool_choice in (None, "none", "auto"):
+            rounds = sum(isinstance(m, AIMessage) for m in messages)
+            message.content = "Let me look once more."
+            message.tool_calls = [{"name": "get_notebook_section", "args": {}, "id": f"call_loop_{rounds}"}]
+        return message
+
+def test_turn_stops_after_the_last_allowed_round_trip(use_fake_model, session):
+    use_fake_model(ToolLoopModel)
+    reply = session.send_message("keep going")
+    stats = session.get_turn_stats()
+    assert stats["llm_round_trips"] == MAX_LLM_ROUND_TRIPS
+    assert stats["budget_exhausted"]
+    assert stats["tool_calls"] == MAX_LLM_ROUND_TRIPS - 1
+    assert reply.strip() == "Let me look once more."
+    # The final answer's tool calls were dropped, so none is left without a result.
+    last_student = max(index for index, message in enumerate(session.messages) if isinstance(message, HumanMessage))
+    turn = session.messages[last_student + 1:]
+    assert isinstance(turn[-1], AIMessage) and not turn[-1].tool_calls
+    calls = [call["id"] for message in turn if isinstance(message, AIMessage) for call in message.tool_calls]
+    assert calls == [message.tool_call_id for message in turn if isinstance(message, ToolMessage)]
@@ -0,0 +1,30 @@
+from server import SessionManager
+
+def test_events_poll_resumes_an_evicted_session(use_fake_model, stored_sessions):
+    use_fake_model()
+    sessions = SessionManager(idle_timeout=0.0)
+    session = sessions.open()
+    assert session.send_message("hello")
+    assert sessions.evict_idle() == 1
+
+    # The tab's next long poll brings the same conversation back instead of losing it.
+    queue = sessions.events(session.id)
+    assert queue is not None
+    resumed = sessions.get(session.id)
+    assert resumed is not session
+    assert [message.content for message in resumed.messages] == [message.content for message in session.messages]
+    assert sessions.events(session.id) is queue
+    assert sessions.open(session.id) is resumed
+    resumed.close()
+
+def test_unknown_session_has_no_events(stored_sessions):
+    assert SessionManager(idle_timeout=60.0).events("not-a-session") is None
+
+def test_event_polls_keep_an_open_tab_from_being_evicted(stored_sessions):
+    sessions = SessionManager(idle_timeout=60.0)
+    session = sessions.open()
+    session.last_active -= 120  # no calls for two minutes, but the tab is still polling
+    sessions.events(session.id)
+    assert sessions.evict_idle() == 0
+    assert sessions.get(session.id) is session
+    session.close()
@@ -0,0 +1,74 @@
+import asyncio
+
+from langchain_core.messages import HumanMessage
+
+import session_store
+from tutor import STARTING_MESSAGES, Session, run_in_agent_loop
+
+def _history(messages):
+    return [(message.type, message.content) for message in messages]
+
+def _stored(store, session_id):
+    """The stored history; the starting messages are part of every session and aren't stored."""
+    return _history(STARTING_MESSAGES + store.load(session_id, from_seq=0)["messages"])
+
+def test_a_superseded_turn_is_truncated_from_the_store(use_fake_model, stored_sessions, session):
+    use_fake_model(first_token_seconds=0.5)
+
+    async def scenario():
+        first = asyncio.create_task(session._send_message("first"))
+        while not (session.scheduler.busy and session._turn_id == 1):
+            await asyncio.sleep(0.005)
+        await asyncio.to_thread(stored_sessions.flush)
+        assert ("human", "first") in _stored(stored_sessions, session.id)  # stored when the turn started
+        second = asyncio.create_task(session._send_message("second"))
+        return await asyncio.gather(first, second)
+
+    run_in_agent_loop(scenario())
+    stored_sessions.flush()
+    assert _stored(stored_sessions, session.id) == _history(session.messages)
+    assert stored_sessions.load(session.id)["message_count"] == len(session.messages)
+
+    resumed = Session.resume(session.id)
+    assert _history(resumed.messages) == _history(session.messages)
+    assert resumed._seq_offset == 0
+    assert resumed._turn_id == 1
+    resumed.close()
+
+def test_resume_loads_only_the_history_after_the_digest(use_fake_model, stored_sessions, session):
+    use_fake_model()
+    for index in range(4):
+        session.send_message(f"question {index}")
+    # As if compaction had folded the first two turns into the digest.
+    folded_upto = session.messages.index(next(message for message in session.messages if message.content == "question 2"))
+    session.context.digest = "The student asked two questions."
+    session.context.folded_upto = folded_upto
+    session._persist("context")
+    stored_sessions.flush()
+
+    resumed = Session.resume(session.id)
+    assert _history(resumed.messages) == _history(STARTING_MESSAGES + session.messages[folded_upto:])
+    assert resumed._seq_offset == folded_upto - len(STARTING_MESSAGES)
+    assert resumed.context.digest == session.context.digest
+    assert resumed._turn_id == 4
+
+    # New messages are stored after the ones the resumed session didn't load.
+    loaded = len(resumed.messages)
+    resumed.send_message("question 4")
+    stored_sessions.flush()
+    assert _stored(stored_sessions, session.id) == _history(session.messages + resumed.messages[loaded:])
+    resumed.close()
+
+def test_a_capped_resume_starts_at_a_student_message(use_fake_model, stored_sessions, session, monkeypatch):
+    use_fake_model(tool_script={f"question {index}": [{"name": "get_notebook_section", "args": {}}] for index in range(3)})
+    for index in range(3):
+        session.send_message(f"question {index}")
+    stored_sessions.flush()
+    monkeypatch.setattr(session_store, "RESUME_MAX_MESSAGES", 6)
+
+    resumed = Session.resume(session.id)
+    tail = resumed.messages[len(STARTING_MESSAGES):]
+    assert isinstance(tail[0], HumanMessage)
+    assert _history(tail) == _history(session.messages[-len(tail):])
+    assert resumed._seq_offset == len(session.messages) - len(tail) - len(STARTING_MESSAGES)
+    resumed.close()
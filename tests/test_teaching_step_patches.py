@@ -0,0 +1,47 @@
+import pytest
+
+from tutor import (TeachingStep, TeachingStepList, TeachingStepPatch, TeachingStepPatchError, STARTING_MESSAGES,
+                   apply_teaching_step_patches, run_in_agent_loop, update_teaching_steps)
+
+def _steps(*contents):
+    return TeachingStepList(concept="binary search", steps=[TeachingStep(content=content, status="not_started") for content in contents])
+
+def _patch(op, index, status=None, content=None):
+    return TeachingStepPatch(op=op, index=index, status=status, content=content)
+
+def test_patches_apply_in_order_to_the_list_left_by_the_previous_ones():
+    steps = _steps("intro", "loop", "practice")
+    changes = apply_teaching_step_patches(steps, [
+        _patch("set_status", 0, "completed"),
+        _patch("insert", 1, content="invariants"),
+        _patch("set_status", 2, "in_progress"),  # "loop", shifted by the insert
+        _patch("remove", 3),
+    ])
+    assert [(step.content, step.status) for step in steps.steps] == [
+        ("intro", "completed"), ("invariants", "not_started"), ("loop", "in_progress")]
+    assert len(changes) == 4
+
+def test_setting_the_status_a_step_already_has_is_not_a_change():
+    steps = _steps("intro")
+    assert apply_teaching_step_patches(steps, [_patch("set_status", 0, "not_started")]) == []
+
+@pytest.mark.parametrize("patches", [
+    [_patch("set_status", 3, "completed")],
+    [_patch("remove", 0), _patch("remove", 1)],
+    [_patch("set_status", 0)],
+    [_patch("insert", 0)],
+    [_patch("insert", 4, content="past the end")],
+], ids=["index-past-end", "index-shifted-by-remove", "status-missing", "content-missing", "insert-past-end"])
+def test_a_bad_patch_leaves_the_whole_list_unchanged(patches):
+    steps = _steps("intro", "loop")
+    before = steps.model_dump()
+    with pytest.raises(TeachingStepPatchError):
+        apply_teaching_step_patches(steps, [_patch("set_status", 0, "completed")] + patches)
+    assert steps.model_dump() == before
+
+def test_update_applies_the_models_patches(use_fake_model):
+    use_fake_model()
+    steps = _steps(*(f"step {index}" for index in range(6)))
+    changes = run_in_agent_loop(update_teaching_steps(steps, list(STARTING_MESSAGES)))
+    assert changes == ["'step 0' is now completed"]
+    assert [step.status for step in steps.steps] == ["completed"] + ["not_started"] * 5
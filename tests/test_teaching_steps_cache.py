@@ -0,0 +1,34 @@
+import pytest
+
+import tutor
+from bench import FakeChatModel
+from model_router import router
+from teaching_steps_cache import TeachingStepsCache
+from tutor import TEACHING_STEPS_PROMPT_VERSION, TeachingStepList, get_expert_teaching_steps_v2, run_in_agent_loop
+
+class FailingModel(FakeChatModel):
+    """A first-choice model that is down: every call fails, so the router falls back."""
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        raise RuntimeError("model unavailable")
+
+@pytest.fixture
+def steps_cache(tmp_path, monkeypatch):
+    cache = TeachingStepsCache(path=str(tmp_path / "teaching_steps_cache.sqlite3"))
+    monkeypatch.setattr(tutor, "teaching_steps_cache", cache)
+    yield cache
+    cache.close()
+
+def test_steps_from_the_first_choice_tier_are_cached(use_fake_model, steps_cache):
+    use_fake_model()
+    run_in_agent_loop(get_expert_teaching_steps_v2("binary search", TeachingStepList(concept="", steps=[])))
+    assert steps_cache.get(steps_cache.key("binary search", TEACHING_STEPS_PROMPT_VERSION)) is not None
+
+def test_steps_from_a_fallback_tier_are_not_cached(use_fake_model, steps_cache):
+    use_fake_model()
+    first_choice = router.tiers_for("step_generation")[0]
+    router.set_model(first_choice, FailingModel())
+    steps = TeachingStepList(concept="", steps=[])
+    run_in_agent_loop(get_expert_teaching_steps_v2("binary search", steps))
+    assert len(steps.steps) == 6
+    assert steps_cache.get(steps_cache.key("binary search", TEACHING_STEPS_PROMPT_VERSION)) is None
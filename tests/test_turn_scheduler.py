@@ -0,0 +1,81 @@
+import asyncio
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+from tutor import STARTING_MESSAGES, run_in_agent_loop
+
+async def _wait_until(condition, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out waiting for the turn"
+        await asyncio.sleep(0.005)
+
+def _students(session):
+    return [message.content for message in session.messages if isinstance(message, HumanMessage)]
+
+def _assert_tool_calls_answered(messages):
+    for index, message in enumerate(messages):
+        if isinstance(message, AIMessage) and message.tool_calls:
+            answered = {reply.tool_call_id for reply in messages[index + 1:index + 1 + len(message.tool_calls)] if isinstance(reply, ToolMessage)}
+            assert answered == {call["id"] for call in message.tool_calls}
+
+def test_messages_sent_during_a_turn_are_answered_together(use_fake_model, session):
+    use_fake_model(seconds_per_token=0.005, reply_words=40)
+
+    async def scenario():
+        first = asyncio.create_task(session._send_message("first"))
+        await _wait_until(lambda: session._turn_shown)  # streaming: too late to supersede
+        second = asyncio.create_task(session._send_message("second"))
+        third = asyncio.create_task(session._send_message("third"))
+        return await asyncio.gather(first, second, third)
+
+    first, second, third = run_in_agent_loop(scenario())
+    assert first and third
+    assert second is None  # answered by the reply to the last message of the burst
+    assert _students(session) == ["first", "second\n\nthird"]
+    assert session.scheduler.stats["coalesced_messages"] == 1
+    assert session.scheduler.stats["superseded_turns"] == 0
+
+def test_new_message_before_the_first_token_supersedes_the_turn(use_fake_model, session):
+    use_fake_model(first_token_seconds=0.5)
+
+    async def scenario():
+        first = asyncio.create_task(session._send_message("first"))
+        await _wait_until(lambda: session.scheduler.busy and session._turn_id == 1)
+        second = asyncio.create_task(session._send_message("second"))
+        return await asyncio.gather(first, second)
+
+    first, second = run_in_agent_loop(scenario())
+    assert first is None and second
+    assert session.scheduler.stats["superseded_turns"] == 1
+    # The cancelled turn left nothing behind; one turn answered both messages.
+    assert _students(session) == ["first\n\nsecond"]
+    assert session._turn_id == 1  # the superseded attempt doesn't use up a turn
+    assert sum(isinstance(message, AIMessage) for message in session.messages[len(STARTING_MESSAGES):]) == 1
+
+def test_cancel_mid_stream_rolls_back_the_partial_turn(use_fake_model, session):
+    use_fake_model(tool_script={"explain": [{"name": "get_notebook_section", "args": {}}]}, seconds_per_token=0.005, reply_words=200)
+    history_length = len(session.messages)
+    events = []
+    session.emit_event = events.append
+
+    async def scenario():
+        reply = asyncio.create_task(session._send_message("explain"))
+        await _wait_until(lambda: any(event["type"] == "token" for event in events))
+        assert await session._cancel_turn()
+        return await reply
+
+    assert run_in_agent_loop(scenario()) is None
+    added = session.messages[history_length:]
+    # The student's message stays with a note; the tool round and the partial answer are gone.
+    assert isinstance(added[0], HumanMessage) and added[0].content == "explain"
+    assert isinstance(added[-1], SystemMessage) and "stopped" in added[-1].content
+    assert not any(isinstance(message, (AIMessage, ToolMessage)) for message in added)
+    _assert_tool_calls_answered(session.messages)
+    assert session.scheduler.stats["cancelled_turns"] == 1
+    assert session._turn_id == 0
+
+    # The next turn runs normally on the rolled-back history.
+    assert session.send_message("again")
+    assert session._turn_id == 1
+    _assert_tool_calls_answered(session.messages)
@@ -0,0 +1,166 @@
+"""Per-turn tracing: timed spans written as JSON lines, plus per-session latency/token summaries.
+
+Spans nest through a context variable, so an LLM call or tool run made inside a turn
+records the turn's span id as its parent, including across asyncio tasks. Tracing
+writes to config.DATA_DIR/traces/<date>.jsonl; set GOOSETOR_TRACE=0 to turn it off.
+
+Summarize a trace file:
+
+    python tracing.py ~/.goosetor/traces/2026-10-17.jsonl
+"""
+import contextvars
+import json
+import math
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+from config import DATA_DIR
+
+TRACE_DIR = os.path.join(DATA_DIR, "traces")
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile; None for no values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+class Span:
+    def __init__(self, name: str, attributes: dict):
+        self.name = name
+        self.id = uuid.uuid4().hex[:16]
+        parent = _current_span.get()
+        self.parent_id = parent.id if parent else None
+        # Session and turn are inherited so nested spans can be grouped without passing them around.
+        self.attributes = {key: parent.attributes[key] for key in ("session", "turn") if parent and key in parent.attributes}
+        self.attributes.update(attributes)
+        self.start = time.time()
+        self.duration_ms = None
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def record_usage(self, message) -> None:
+        """Copy prompt/completion/cached token counts from an AI message's usage metadata, if it has any."""
+        usage = getattr(message, "usage_metadata", None)
+        if not usage:
+            return
+        input_tokens = usage.get("input_tokens", 0)
+        cached_tokens = (usage.get("input_token_details") or {}).get("cache_read", 0)
+        self.set(
+            input_tokens=input_tokens,
+            output_tokens=usage.get("output_tokens", 0),
+            cached_tokens=cached_tokens,
+            cached_ratio=round(cached_tokens / input_tokens, 3) if input_tokens else None,
+        )
+
+    def to_record(self) -> dict:
+        return {"span": self.name, "id": self.id, "parent": self.parent_id, "start": round(self.start, 6),
+                "duration_ms": self.duration_ms, **self.attributes}
+
+class Tracer:
+    def __init__(self, path: Optional[str] = None, enabled: Optional[bool] = None):
+        self.enabled = os.environ.get("GOOSETOR_TRACE", "1") != "0" if enabled is None else enabled
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        span = Span(name, attributes)
+        token = _current_span.set(span)
+        started = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.set(error=f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            span.duration_ms = round((time.perf_counter() - started) * 1000, 3)
+            _current_span.reset(token)
+            self.write(span.to_record())
+
+    def write(self, record: dict) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._file is None:
+                if self.path is None:
+                    os.makedirs(TRACE_DIR, exist_ok=True)
+                    self.path = os.path.join(TRACE_DIR, time.strftime("%Y-%m-%d") + ".jsonl")
+                self._file = open(self.path, "a", buffering=1, encoding="utf-8")
+            self._file.write(json.dumps(record, default=str) + "\n")
+
+tracer = Tracer()
+
+class SessionMetrics:
+    """Rolling per-session numbers for turns: latency percentiles, LLM round trips and tokens."""
+
+    def __init__(self):
+        self.turn_seconds: List[float] = []
+        self.round_trips: List[int] = []
+        self.input_tokens: List[int] = []
+        self.output_tokens: List[int] = []
+        self.cached_tokens: List[int] = []
+        self.read_only_calls: List[int] = []
+        self.state_snapshots_unread: List[int] = []
+
+    def record_turn(self, seconds: float, round_trips: int, input_tokens: int, output_tokens: int, cached_tokens: int,
+                    read_only_calls: int = 0, state_snapshots_unread: int = 0) -> None:
+        self.turn_seconds.append(seconds)
+        self.round_trips.append(round_trips)
+        self.input_tokens.append(input_tokens)
+        self.output_tokens.append(output_tokens)
+        self.cached_tokens.append(cached_tokens)
+        self.read_only_calls.append(read_only_calls)
+        self.state_snapshots_unread.append(state_snapshots_unread)
+
+    def summary(self) -> dict:
+        turns = len(self.turn_seconds)
+        total_input = sum(self.input_tokens)
+        return {
+            "turns": turns,
+            "p50_turn_seconds": percentile(self.turn_seconds, 0.5),
+            "p95_turn_seconds": percentile(self.turn_seconds, 0.95),
+            "round_trips_per_turn": sum(self.round_trips) / turns if turns else None,
+            "input_tokens_per_turn": total_input / turns if turns else None,
+            "output_tokens_per_turn": sum(self.output_tokens) / turns if turns else None,
+            "cached_token_ratio": sum(self.cached_tokens) / total_input if total_input else None,
+            "read_only_tool_calls": sum(self.read_only_calls),
+            "state_snapshots_unread": sum(self.state_snapshots_unread),
+        }
+
+def summarize_records(records: Iterable[dict]) -> Dict[str, dict]:
+    """Per-session summary of a trace: turn latency percentiles, tokens per turn, and time per span type."""
+    metrics: Dict[str, SessionMetrics] = defaultdict(SessionMetrics)
+    span_ms: Dict[str, Dict[str, List[float]]] = defaultdict(lambda: defaultdict(list))
+    for record in records:
+        session = record.get("session", "?")
+        if record.get("duration_ms") is None:  # point events such as session_summary
+            continue
+        if record["span"] == "turn":
+            metrics[session].record_turn(record["duration_ms"] / 1000, record.get("llm_round_trips", 0),
+                                         record.get("input_tokens", 0), record.get("output_tokens", 0), record.get("cached_tokens", 0),
+                                         record.get("read_only_tool_calls", 0), record.get("state_snapshots_unread", 0))
+        span_ms[session][record["span"]].append(record["duration_ms"])
+    summaries = {}
+    for session in span_ms:
+        summaries[session] = metrics[session].summary()
+        summaries[session]["spans"] = {
+            name: {"count": len(values), "p50_ms": percentile(values, 0.5), "p95_ms": percentile(values, 0.95)}
+            for name, values in span_ms[session].items()
+        }
+    return summaries
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit("usage: python tracing.py TRACE.jsonl")
+    with open(sys.argv[1], encoding="utf-8") as f:
+        print(json.dumps(summarize_records(json.loads(line) for line in f if line.strip()), indent=2))
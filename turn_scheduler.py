@@ -0,0 +1,95 @@
+"""One session's student turns: run one at a time, coalesce bursts, cancel on request.
+
+Messages sent while a turn is running are queued, and everything queued is answered by a
+single turn once the running one ends, so three quick messages cost one LLM turn instead of
+three. If the running turn hasn't shown the student anything yet (no text streamed, no tool
+started), a new message supersedes it: the turn is cancelled and starts over with both
+messages. Cancelling a turn cancels its task, which aborts the LLM request in flight rather
+than letting it finish and throwing the answer away.
+"""
+import asyncio
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional
+
+@dataclass
+class _Message:
+    text: str
+    reply: asyncio.Future
+
+class TurnScheduler:
+    def __init__(self, run_turn: Callable[[List[str]], Awaitable[str]], can_supersede: Callable[[], bool]):
+        """
+        Args:
+            run_turn: runs one turn for a batch of student messages and returns the reply.
+            can_supersede: whether the running turn may still be restarted with newer messages.
+        """
+        self._run_turn = run_turn
+        self._can_supersede = can_supersede
+        self._queue: List[_Message] = []
+        self._turn: Optional[asyncio.Task] = None
+        self._worker: Optional[asyncio.Task] = None
+        # Set while the running turn is being cancelled to make room for newer messages.
+        self.superseding = False
+        self.stats: Dict[str, int] = {"coalesced_messages": 0, "superseded_turns": 0, "cancelled_turns": 0}
+
+    @property
+    def busy(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    async def submit(self, text: str) -> Optional[str]:
+        """Queue a student message. Returns the reply of the turn that answered it, or None when
+        the message was answered together with a later one (that one gets the reply) or cancelled."""
+        message = _Message(text, asyncio.get_running_loop().create_future())
+        self._queue.append(message)
+        if self._turn is not None and not self._turn.done() and not self.superseding and self._can_supersede():
+            self.superseding = True
+            self._turn.cancel()
+        if not self.busy:
+            self._worker = asyncio.create_task(self._work())
+        return await message.reply
+
+    async def _work(self):
+        while self._queue:
+            batch, self._queue = self._queue, []
+            self._turn = asyncio.create_task(self._run_turn([message.text for message in batch]))
+            await asyncio.wait({self._turn})
+            turn, self._turn = self._turn, None
+            # A turn can finish before a cancel requested for newer messages reaches it; those then just wait their turn.
+            superseded, self.superseding = self.superseding, False
+            if turn.cancelled():
+                if superseded:
+                    self.stats["superseded_turns"] += 1
+                    self._queue[:0] = batch
+                    continue
+                self.stats["cancelled_turns"] += 1
+                _resolve(batch, None)
+                continue
+            self.stats["coalesced_messages"] += len(batch) - 1
+            if turn.exception() is not None:
+                for message in batch:
+                    if not message.reply.done():
+                        message.reply.set_exception(turn.exception())
+                continue
+            _resolve(batch[:-1], None)
+            _resolve(batch[-1:], turn.result())
+
+    def cancel(self) -> bool:
+        """Cancel the running turn and drop queued messages; False if there was nothing to cancel."""
+        queued, self._queue = self._queue, []
+        _resolve(queued, None)
+        if self._turn is not None and not self._turn.done():
+            self.superseding = False
+            self._turn.cancel()
+            return True
+        return bool(queued)
+
+    async def stop(self):
+        """Cancel everything and wait until the running turn has unwound."""
+        self.cancel()
+        if self._worker is not None:
+            await asyncio.wait({self._worker})
+
+def _resolve(messages: List[_Message], reply: Optional[str]):
+    for message in messages:
+        if not message.reply.done():
+            message.reply.set_result(reply)
@@ -0,0 +1,982 @@
+import json
+import time
+import uuid
+import asyncio
+import threading
+from langchain_core.messages import HumanMessage, ToolMessage, AIMessage, SystemMessage, BaseMessage
+from langchain_core.messages.utils import message_chunk_to_message
+from langchain_core.tools import tool
+import prompts
+from context import ContextManager, count_tokens, format_transcript
+from teaching_steps_cache import TeachingStepsCache, prompt_version
+from lesson_pack import load_lesson_pack
+from exemplars import exemplar_library, exemplar_messages
+from notebook import NotebookDeltaError, NotebookDocument
+from code_runner import code_runner
+from tracing import SessionMetrics, tracer
+from model_router import router
+from llm_client import claim_output
+from session_store import STATE_KINDS, session_store
+from turn_scheduler import TurnScheduler
+from visualization import Visualization, VisualizationError, render_cache_info, render_visualization
+from pydantic import BaseModel, Field
+from typing import Callable, Dict, Literal, List, Optional, Tuple
+from textwrap import dedent
+from dataclasses import dataclass, field, asdict
+
+class TeachingStep(BaseModel):
+    content: str
+    status: Literal["not_started", "in_progress", "completed"] = Field(description="The status of the teaching step. 'not_started' means you haven't taught the step yet. 'in_progress' means you are teaching the step. 'completed' means the student has finished the step. In the beginning, all steps should be 'not_started'.")
+
+class TeachingStepList(BaseModel):
+    concept: str
+    steps: List[TeachingStep]
+
+class TeachingStepPatch(BaseModel):
+    op: Literal["set_status", "insert", "remove"]
+    index: int = Field(description="0-based index of the step, in the list as left by the previous patches.")
+    status: Optional[Literal["not_started", "in_progress", "completed"]] = Field(description="New status for set_status; null for other ops.")
+    content: Optional[str] = Field(description="Text of the new step for insert; null for other ops.")
+
+class TeachingStepPatchList(BaseModel):
+    """Changes to the teaching steps; much shorter to generate than a full TeachingStepList."""
+    patches: List[TeachingStepPatch]
+
+class TeachingStepPatchError(ValueError):
+    pass
+
+class LessonProblem(BaseModel):
+    title: str
+    description: str
+    test_case: str = Field(description="One `function(args) == expected` check per line.")
+    visualization: Optional[Visualization]
+    reference_solution: str = Field(description="A correct Python implementation, used only to check the test cases.")
+
+class LessonProblemError(RuntimeError):
+    pass
+
+BOLD_REMINDER = dedent("""
+    Reminder: If there are key ideas or take-home messages, write the important part of the message in **bold**. Examples of good bold messages: Kinetic energy is the energy an object has **due to its motion**. An engine is a machine that **converts energy into mechanical work**.
+""").strip()
+# Turn cadences, counted by the session's turn id (which survives a resume): the bold reminder goes
+# with turns 2, 5, 8, ... and the teaching steps are refreshed for turns 5, 10, 15, ...
+BOLD_REMINDER_EVERY_TURNS = 3
+STEPS_UPDATE_EVERY_TURNS = 5
+
+def print_teaching_steps(teaching_step_list: TeachingStepList) -> None:
+    print("==========TEACHING_STEPS==========")
+    print(f"Concept: {teaching_step_list.concept}")
+    for step in teaching_step_list.steps:
+        print(f"Step: {step.content}")
+        print(f"Status: {step.status}")
+    print("==================================")
+
+def format_teaching_steps(teaching_step_list: TeachingStepList) -> str:
+    """Numbered one-line-per-step view of the steps, for prompts (patch indexes refer to these numbers)."""
+    lines = [f"Concept: {teaching_step_list.concept}"]
+    lines += [f"{index}. [{step.status}] {step.content}" for index, step in enumerate(teaching_step_list.steps)]
+    return "\n".join(lines)
+
+def apply_teaching_step_patches(teaching_step_list: TeachingStepList, patches: List[TeachingStepPatch]) -> List[str]:
+    """Apply patches in order, all or nothing. Returns a short description of each actual change."""
+    steps = [step.model_copy() for step in teaching_step_list.steps]
+    changes = []
+    for patch in patches:
+        size = len(steps) + 1 if patch.op == "insert" else len(steps)
+        if not 0 <= patch.index < size:
+            raise TeachingStepPatchError(f"{patch.op} index {patch.index} is outside 0..{size - 1}")
+        if patch.op == "set_status":
+            if patch.status is None:
+                raise TeachingStepPatchError(f"set_status of step {patch.index} has no status")
+            step = steps[patch.index]
+            if step.status != patch.status:
+                step.status = patch.status
+                changes.append(f"'{step.content}' is now {patch.status}")
+        elif patch.op == "insert":
+            if not patch.content:
+                raise TeachingStepPatchError(f"insert at {patch.index} has no content")
+            steps.insert(patch.index, TeachingStep(content=patch.content, status=patch.status or "not_started"))
+            changes.append(f"added step {patch.index}: '{patch.content}'")
+        else:
+            changes.append(f"removed '{steps.pop(patch.index).content}'")
+    teaching_step_list.steps = steps
+    return changes
+
+async def invoke_structured(schema, messages, call_site: str, with_tier: bool = False):
+    """Structured-output LLM call on the call site's model tier, traced with its token usage (hence include_raw).
+    With `with_tier`, returns (parsed, tier that answered), which is a fallback tier if the first choice failed."""
+    async def run(tier, span):
+        result = await router.model(tier).with_structured_output(schema, include_raw=True).ainvoke(messages)
+        span.record_usage(result["raw"])
+        if result["parsed"] is None:
+            raise result["parsing_error"] or ValueError(f"no {schema.__name__} in the model's reply")
+        return (result["parsed"], tier) if with_tier else result["parsed"]
+    return await router.call(call_site, run)
+
+async def update_teaching_steps(teaching_step_list: TeachingStepList, messages: List[BaseMessage]) -> List[str]:
+    """Update the teaching steps in place from the conversation so far; returns the changes made."""
+    if teaching_step_list.concept == "" or len(teaching_step_list.steps) == 0:
+        return []
+    prompt = prompts.UPDATE_TEACHING_STEPS_PROMPT.format(teaching_steps=format_teaching_steps(teaching_step_list))
+    temp_messages = messages + [HumanMessage(prompt)]
+    response = await invoke_structured(TeachingStepPatchList, temp_messages, "step_update")
+    changes = apply_teaching_step_patches(teaching_step_list, response.patches)
+    if changes:
+        print_teaching_steps(teaching_step_list)
+    return changes
+
+TEACHING_STEPS_QUESTION = "How would you teach {concept}? Make sure to include a step that assign a practice problem to the student by calling the set_problem_statement tool."
+TEACHING_STEPS_PROMPT_VERSION = prompt_version(
+    router.model_name("step_generation"),
+    TEACHING_STEPS_QUESTION,
+    exemplar_library.fingerprint,
+    *(str(message.content) for message in prompts.TEACHING_PRINCIPLES_HISTORY),
+)
+teaching_steps_cache = TeachingStepsCache()
+# Everything that shapes a pre-generated lesson; a rebuild regenerates lessons made with other prompts or models.
+LESSON_PROMPT_VERSION = prompt_version(TEACHING_STEPS_PROMPT_VERSION, router.model_name("problem_generation"), prompts.LESSON_PROBLEM_PROMPT)
+# Lessons generated ahead of time by lesson_pack.py; memory-mapped, so loading it costs next to nothing.
+# A pack built with other prompts or models is ignored and lessons are generated live.
+lesson_pack = load_lesson_pack(prompt_version=LESSON_PROMPT_VERSION)
+# Tries at a practice problem whose test cases pass against its reference solution.
+LESSON_PROBLEM_ATTEMPTS = 2
+TEACHING_STEPS_NOTICE = "NOTICE: Do not show the steps to the student, keep this as your internal knowledge for reference only. Instead, guide the student through the steps one by one. Make sure they finish the step before moving on to the next."
+
+async def generate_teaching_steps(concept: str) -> TeachingStepList:
+    return (await _generate_teaching_steps(concept))[0]
+
+async def _generate_teaching_steps(concept: str) -> Tuple[TeachingStepList, str]:
+    """The teaching steps and the model tier that wrote them."""
+    examples = exemplar_library.select(concept)
+    tracer.write({"span": "teaching_steps_exemplars", "concept": concept, "exemplars": [example.name for example in examples]})
+    messages = prompts.TEACHING_PRINCIPLES_HISTORY + exemplar_messages(examples) + [HumanMessage(content=TEACHING_STEPS_QUESTION.format(concept=concept))]
+    response, tier = await invoke_structured(TeachingStepList, messages, "step_generation", with_tier=True)
+    for step in response.steps:
+        step.status = "not_started"
+    return response, tier
+
+async def get_expert_teaching_steps_v2(concept: str, teaching_step_list: TeachingStepList) -> str:
+    """Gets expert-curated checklist for teaching a student the given concept."""
+    cache_key = teaching_steps_cache.key(concept, TEACHING_STEPS_PROMPT_VERSION)
+    cached = await asyncio.to_thread(teaching_steps_cache.get, cache_key)
+    if cached is not None:
+        response = TeachingStepList.model_validate_json(cached)
+        tracer.write({"span": "teaching_steps_cache", "hit": True, "concept": concept})
+    else:
+        response, tier = await _generate_teaching_steps(concept)
+        # The key names the first-choice model; steps a fallback tier wrote aren't cached as if it had written them.
+        if tier == router.tiers_for("step_generation")[0]:
+            await asyncio.to_thread(teaching_steps_cache.put, cache_key, concept, response.model_dump_json())
+    teaching_step_list.concept = response.concept
+    teaching_step_list.steps = response.steps
+    str_response = response.model_dump_json()
+    print_teaching_steps(response)
+    return str_response + "\n" + TEACHING_STEPS_NOTICE
+
+def make_problem_statement(title: str, description: str, test_case: str = "", visualization: Optional[Visualization] = None,
+                           ascii_visualization: str = "") -> Tuple[Dict[str, str], Optional[VisualizationError]]:
+    """The problem section's fields with the visualization drawn, and the error if it couldn't be."""
+    problem = {"title": title, "description": description, "test_case": test_case,
+               "visualization": ascii_visualization, "visualization_svg": ""}
+    if visualization is None:
+        return problem, None
+    try:
+        rendered = render_visualization(visualization)
+    except VisualizationError as e:
+        return problem, e
+    problem["visualization"], problem["visualization_svg"] = rendered.text, rendered.svg
+    return problem, None
+
+async def generate_lesson_problem(concept: str, teaching_step_list: TeachingStepList) -> Dict[str, str]:
+    """A practice problem for the lesson whose test cases pass against the model's own reference solution."""
+    prompt = prompts.LESSON_PROBLEM_PROMPT.format(concept=concept, teaching_steps=format_teaching_steps(teaching_step_list))
+    feedback = ""
+    for _ in range(LESSON_PROBLEM_ATTEMPTS):
+        response = await invoke_structured(LessonProblem, [HumanMessage(content=prompt + feedback)], "problem_generation")
+        result = await code_runner.run(response.reference_solution, response.test_case)
+        problem, error = make_problem_statement(response.title, response.description, response.test_case, response.visualization)
+        if result.status == "passed" and error is None:
+            return problem
+        failure = result.format() if result.status != "passed" else f"The visualization could not be drawn: {error}"
+        feedback = f"\n\nA previous attempt was rejected; fix this:\n{failure}"
+    raise LessonProblemError(f"no practice problem for {concept} passed its own tests: {failure}")
+
+async def generate_lesson(concept: str) -> dict:
+    """Teaching steps and a checked practice problem for the concept, as stored in a lesson pack."""
+    teaching_step_list = await generate_teaching_steps(concept)
+    problem = await generate_lesson_problem(concept, teaching_step_list)
+    return {"concept": concept, "teaching_steps": teaching_step_list.model_dump(), "problem": problem}
+
+def make_tools(session: "Session") -> Dict[str, object]:
+    """Build the tutor's tools bound to one session's state, keyed by tool name."""
+
+    @tool
+    async def get_expert_teaching_steps(concept: str) -> str:
+        """Gets expert-curated checklist for teaching a student the given concept."""
+        lesson = lesson_pack.get(concept) if lesson_pack is not None else None
+        if lesson is not None:
+            return session.start_prepared_lesson(lesson)
+        return await get_expert_teaching_steps_v2(concept, session.teaching_steps)
+
+    @tool
+    async def set_problem_statement(title: str, description: str, test_case: str = "", visualization: Optional[Visualization] = None, ascii_visualization: str = "") -> str:
+        """Sets the problem statement, test case, and visualization in the problem section. Use this when introducing a new problem to the student.
+        Describe arrays, linked lists, binary trees, graphs and grids with `visualization` and they are drawn for you; use `ascii_visualization` only for pictures that don't fit those kinds."""
+        if not description.strip() and session.publish_prepared_problem():
+            return f"Problem '{session.problem_statement['title']}' from the lesson has been set."
+        problem, error = make_problem_statement(title, description, test_case, visualization, ascii_visualization)
+        reply = f"Problem '{title}' has been set."
+        if error is not None:
+            reply += f" The visualization could not be drawn ({error}); call set_problem_statement again to fix it."
+        elif visualization is not None:
+            reply = f"Problem '{title}' has been set with a {visualization.kind} visualization."
+        print("Visualization: ")
+        print(problem["visualization"])
+        session.problem_statement = problem
+        session.prepared_problem = None  # the model chose its own problem
+        session.mark_problem_seen()
+        return reply
+
+    @tool
+    async def get_notebook_section() -> str:
+        """Gets the current content of the notebook section where the student writes code, draw pictures, or write notes. The notebook is already attached to the conversation whenever it changes (in full while it is short, otherwise as a diff); call this only if you need the full text of a long notebook."""
+        return session.turn_notebook_text()
+
+    @tool
+    async def get_problem_statement() -> str:
+        """Gets the current problem statement, test case, and visualization. The current problem is already shown at the end of the conversation; call this only if it is cut short there."""
+        problem_statement = session.problem_statement
+        return f"Title: {problem_statement['title']}\nDescription: {problem_statement['description']}\nTest Case: {problem_statement['test_case']}\nVisualization: {problem_statement['visualization']}"
+
+    @tool
+    async def run_notebook_tests() -> str:
+        """Runs the Python code in the student's notebook against the test case of the current problem and reports which cases pass. Use this instead of tracing the code by hand when checking correctness."""
+        if not session.problem_statement["test_case"]:
+            return "There is no test case to run against. Set a problem with a test case first."
+        result = await code_runner.run(session.turn_notebook_text(), session.problem_statement["test_case"])
+        return result.format()
+
+    return {
+        "get_expert_teaching_steps": get_expert_teaching_steps,
+        "set_problem_statement": set_problem_statement,
+        "get_notebook_section": get_notebook_section,
+        "get_problem_statement": get_problem_statement,
+        "run_notebook_tests": run_notebook_tests
+    }
+
+# Upper bound on LLM round trips per student turn (first call plus follow-ups after tool results).
+MAX_LLM_ROUND_TRIPS = 6
+# A changed notebook up to this size is attached to the turn in full; a longer one only as a diff.
+NOTEBOOK_SNAPSHOT_TOKENS = 1200
+# The automatic test run on a changed notebook starts this long after the student's last edit...
+PRECHECK_DEBOUNCE_SECONDS = 0.3
+# ...and a turn waits at most this long for it before answering without the result.
+PRECHECK_WAIT_SECONDS = 1.0
+# Longer problem fields are cut short in the volatile tail; get_problem_statement returns them whole.
+PROBLEM_FIELD_CHARS = 1500
+# Tools that only read state the session attaches to the turn anyway, and the state each one reads.
+READ_ONLY_TOOLS = {"get_notebook_section": "notebook", "get_problem_statement": "problem"}
+
+STARTING_MESSAGES = [
+    SystemMessage(content=dedent("""
+        You are a tutor who wants to help students learn concepts by guiding them to derive the concept on their own. 
+        You are an expert at giving constructive feedback. That means:
+        - Timely correction: You always give corrections to misunderstandings and errors right after the student makes them.
+        - Supportive framing: Feedback focuses on improvement rather than judgment.
+        Consult the expert with get_expert_teaching_steps before teaching any concept. If you want to give an assignment, use the set_problem_statement tool to set the problem statement.""")),
+    AIMessage(content="Greetings! What concept would you like to explore today?")
+]
+
+def _clip(value: str, limit: int) -> str:
+    return value if len(value) <= limit else value[:limit] + f"... ({len(value) - limit} more characters)"
+
+def new_context_manager() -> ContextManager:
+    return ContextManager(num_pinned=len(STARTING_MESSAGES))
+
+async def summarize_history(digest: str, folded_messages: List[BaseMessage]) -> str:
+    """Fold a batch of old turns into the running digest."""
+    request = [
+        SystemMessage(prompts.SUMMARIZE_HISTORY_PROMPT),
+        HumanMessage(f"Previous notes:\n{digest or '(none)'}\n\nNext part of the conversation:\n{format_transcript(folded_messages)}"),
+    ]
+    async def run(tier, span):
+        response = await router.model(tier).ainvoke(request)
+        span.record_usage(response)
+        return response.content
+    return await router.call("summarize", run)
+
+STREAM_FLUSH_INTERVAL = 0.05
+
+_agent_loop = None
+_agent_loop_lock = threading.Lock()
+
+def get_agent_loop() -> asyncio.AbstractEventLoop:
+    """Return the event loop that runs agent turns for every session, starting its thread on first use."""
+    global _agent_loop
+    with _agent_loop_lock:
+        if _agent_loop is None:
+            _agent_loop = asyncio.new_event_loop()
+            threading.Thread(target=_agent_loop.run_forever, name="agent-loop", daemon=True).start()
+    return _agent_loop
+
+def run_in_agent_loop(coro):
+    """Run a coroutine on the agent loop and block the calling (pywebview or HTTP) thread until it finishes."""
+    return asyncio.run_coroutine_threadsafe(coro, get_agent_loop()).result()
+
+@dataclass
+class TurnStats:
+    """Wall-clock breakdown of one student turn."""
+    llm_round_trips: int = 0
+    tool_calls: int = 0
+    llm_seconds: float = 0.0
+    tool_seconds: float = 0.0
+    total_seconds: float = 0.0
+    budget_exhausted: bool = False
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0
+    # State attached to the turn because it changed since the model last saw it, read-only tool calls
+    # made anyway, and snapshots no read-only call re-read. The last is only what the model didn't
+    # re-read, not round trips saved: most of those turns would not have called the tool at all.
+    state_snapshots: int = 0
+    read_only_tool_calls: int = 0
+    state_snapshots_unread: int = 0
+    tool_timings: List[dict] = field(default_factory=list)
+    llm_calls: List[dict] = field(default_factory=list)
+
+TOOL_PROGRESS_LABELS = {
+    "get_expert_teaching_steps": "Consulting the expert",
+    "set_problem_statement": "Writing a practice problem",
+    "get_notebook_section": "Reading your notebook",
+    "get_problem_statement": "Re-reading the problem",
+    "run_notebook_tests": "Running your code",
+}
+
+# Session methods the frontend may call, through pywebview's js_api or the HTTP server.
+FRONTEND_METHODS = (
+    "send_message", "update_problem", "get_problem", "set_notebook_section", "apply_notebook_delta", "get_notebook_section",
+    "cancel_turn", "new_session", "get_turn_stats", "get_cache_stats", "get_session_metrics", "get_model_stats", "get_history",
+)
+# Chat messages per get_history page.
+HISTORY_PAGE_SIZE = 50
+
+class Session:
+    """One student's tutoring state: the conversation, problem, notebook and teaching steps.
+
+    All state is read and written on the agent loop. The public methods are synchronous and
+    meant to be called from frontend threads; turns of one session never overlap.
+    """
+
+    def __init__(self, session_id: Optional[str] = None):
+        self.id = session_id or uuid.uuid4().hex
+        # Receives streaming events ({"type", "turn", ...}); set by the desktop window or the HTTP server.
+        self.emit_event: Optional[Callable[[dict], None]] = None
+        self.last_active = time.monotonic()
+        self.tool_name_map = make_tools(self)
+        # Chat models with this session's tools bound, per (tier, answer_only); see _chat_model.
+        self._chat_models = {}
+        self._chat_model(router.tiers_for("chat")[0])
+        self.scheduler = TurnScheduler(self._traced_turn, lambda: not self._turn_shown)
+        # Whether the running turn has streamed text or started a tool; until then a new message may restart it.
+        self._turn_shown = False
+        # The notebook as it was when the running turn started; edits made meanwhile are seen next turn.
+        self._turn_notebook = None
+        self._turn_id = 0
+        self._pending_tokens = ""
+        self._last_flush = 0.0
+        self._last_turn_stats = None
+        self._steps_update_task = None
+        self._steps_update_generation = 0
+        self._compaction_task = None
+        self._precheck_task = None
+        self.metrics = SessionMetrics()
+        self._reset_state()
+
+    def _reset_state(self):
+        self.messages = STARTING_MESSAGES.copy()
+        self.context = new_context_manager()
+        self.problem_statement = {"title": "", "description": "", "test_case": "", "visualization": "", "visualization_svg": ""}
+        self.notebook = NotebookDocument()
+        self.teaching_steps = TeachingStepList(concept="", steps=[])
+        # Practice problem from a lesson pack, shown once the lesson reaches its practice step.
+        self.prepared_problem = None
+        # Changes from the last background step update, shown in the volatile tail for one turn.
+        self._step_changes = []
+        # Store position of messages[i] is i + _seq_offset; a resumed session holds only its recent history.
+        self._seq_offset = 0
+        self._persisted_messages = len(self.messages)
+        self._persisted_state = {}
+        # Index in messages of the last full notebook snapshot, and the problem as the model last saw it.
+        self._notebook_snapshot_at = None
+        self._problem_seen = json.dumps(self.problem_statement, sort_keys=True)
+
+    @classmethod
+    def resume(cls, session_id: str) -> Optional["Session"]:
+        """Rebuild a stored session from its latest state and the history after its digest; None if it isn't stored."""
+        stored = session_store.load(session_id)
+        if stored is None:
+            return None
+        session = cls(session_id)
+        session._restore(stored)
+        return session
+
+    def _restore(self, stored: dict):
+        state = stored["state"]
+        context = state.get("context", {})
+        tail = stored["messages"]
+        first_seq = stored["first_seq"] if tail else max(stored["message_count"], len(STARTING_MESSAGES))
+        if first_seq > context.get("folded_upto", 0):
+            # Loading was capped short of the digest; start at a student message so no tool result loses its call.
+            skip = next((index for index, message in enumerate(tail) if isinstance(message, HumanMessage)), len(tail))
+            tail = tail[skip:]
+            first_seq += skip
+        self.messages = STARTING_MESSAGES.copy() + tail
+        self._seq_offset = first_seq - len(STARTING_MESSAGES)
+        self._persisted_messages = len(self.messages)
+        self.context.digest = context.get("digest", "")
+        self._turn_id = context.get("turn_id", 0)
+        if "problem" in state:
+            self.problem_statement.update(state["problem"])
+        if "notebook" in state:
+            self.notebook = NotebookDocument(state["notebook"]["text"])
+            self.notebook.version = state["notebook"]["version"]
+        if "teaching_steps" in state:
+            self.teaching_steps = TeachingStepList.model_validate(state["teaching_steps"])
+        if "prepared_problem" in state:
+            self.prepared_problem = state["prepared_problem"]["problem"]
+        self._persisted_state = {kind: json.dumps(self._state(kind), sort_keys=True) for kind in STATE_KINDS}
+        self.mark_problem_seen()
+
+    def _state(self, kind: str) -> dict:
+        if kind == "problem":
+            return self.problem_statement
+        if kind == "notebook":
+            return {"text": self.notebook.text(), "version": self.notebook.version}
+        if kind == "teaching_steps":
+            return self.teaching_steps.model_dump()
+        if kind == "prepared_problem":
+            return {"problem": self.prepared_problem}
+        return {"digest": self.context.digest, "folded_upto": self.context.folded_upto + self._seq_offset, "turn_id": self._turn_id}
+
+    def _persist(self, *kinds: str):
+        """Queue history messages not yet stored, and the given (default: all) kinds of state that changed, for the session store."""
+        start = self._persisted_messages
+        messages = [(index + self._seq_offset, message) for index, message in enumerate(self.messages[start:], start)]
+        self._persisted_messages = len(self.messages)
+        state = {}
+        for kind in kinds or STATE_KINDS:
+            payload = self._state(kind)
+            encoded = json.dumps(payload, sort_keys=True)
+            if self._persisted_state.get(kind) != encoded:
+                self._persisted_state[kind] = encoded
+                state[kind] = payload
+        session_store.write(self.id, messages, state)
+
+    def touch(self):
+        self.last_active = time.monotonic()
+
+    def volatile_tail(self) -> str:
+        """Current teaching steps, problem and reminders, sent after the history on every call.
+
+        Rebuilt per call and never stored in `messages`, so the history ahead of it stays
+        byte-identical from call to call and can be served from the provider's prompt cache.
+        """
+        parts = []
+        if self.teaching_steps.concept:
+            parts.append(f"Current teaching steps:\n{format_teaching_steps(self.teaching_steps)}")
+        if self._step_changes:
+            parts.append("Teaching steps just updated: " + "; ".join(self._step_changes))
+        if self.problem_statement["title"]:
+            problem = {key: _clip(value, PROBLEM_FIELD_CHARS) for key, value in self.problem_statement.items() if key != "visualization_svg"}
+            edited = " (edited by the student since you last saw it)" if self._problem_changed() else ""
+            parts.append(f"Current problem{edited}: {json.dumps(problem)}")
+        if self.prepared_problem is not None:
+            parts.append(f"Prepared practice problem, not shown to the student yet: '{self.prepared_problem['title']}'. "
+                         "It appears in the problem section when the practice step starts, or call set_problem_statement "
+                         "with its title and an empty description to show it now.")
+        if self._turn_id % BOLD_REMINDER_EVERY_TURNS == 2:
+            parts.append(BOLD_REMINDER)
+        return "\n\n".join(parts)
+
+    def start_prepared_lesson(self, lesson: dict) -> str:
+        """Take the teaching steps and practice problem from a lesson pack instead of generating them; returns the tool reply."""
+        steps = TeachingStepList.model_validate(lesson["teaching_steps"])
+        self.teaching_steps.concept = steps.concept
+        self.teaching_steps.steps = steps.steps
+        self.prepared_problem = dict(lesson["problem"])
+        self._persist("teaching_steps", "prepared_problem")
+        tracer.write({"span": "lesson_pack", "hit": True, "concept": lesson["concept"]})
+        print_teaching_steps(steps)
+        problem = self.prepared_problem
+        return (steps.model_dump_json() + "\n" + TEACHING_STEPS_NOTICE + "\n"
+                f"This lesson comes with a checked practice problem, '{problem['title']}': {problem['description']}\n"
+                "It is shown to the student when the lesson reaches the practice step. To show it then, call "
+                "set_problem_statement with its title and an empty description; write your own problem only if "
+                "the student needs a different one.")
+
+    def publish_prepared_problem(self) -> bool:
+        """Show the lesson pack's practice problem in the problem section; False if there is none waiting."""
+        if self.prepared_problem is None:
+            return False
+        self.problem_statement = self.prepared_problem
+        self.prepared_problem = None
+        self.mark_problem_seen()
+        self._persist("problem", "prepared_problem")
+        return True
+
+    def _practice_step_started(self) -> bool:
+        """Whether the step that assigns the practice problem is under way, per the step statuses."""
+        steps = self.teaching_steps.steps
+        for keyword in ("set_problem_statement", "practice", "problem"):
+            step = next((step for step in steps if keyword in step.content.lower()), None)
+            if step is not None:
+                return step.status != "not_started"
+        return False
+
+    def mark_problem_seen(self):
+        self._problem_seen = json.dumps(self.problem_statement, sort_keys=True)
+
+    def _problem_changed(self) -> bool:
+        return json.dumps(self.problem_statement, sort_keys=True) != self._problem_seen
+
+    def _notebook_snapshot(self) -> str:
+        """The notebook as the model should see it this turn, or "" if it already has.
+
+        While the notebook is short it's sent in full, changed lines marked, whenever the model has
+        no earlier snapshot in the unfolded history or the diff would be about as long; after that
+        the diff against what it last saw is enough. A long notebook only ever gets the diff.
+        """
+        changed = self.notebook.has_unseen_changes()
+        has_snapshot = self._notebook_snapshot_at is not None and self._notebook_snapshot_at >= self.context.folded_upto
+        if not changed and (has_snapshot or not self.notebook.text().strip()):
+            return ""
+        if not self.notebook.text().strip():
+            return "Notebook changes:\nThe notebook is now empty."
+        diff = self.notebook.diff_since_seen()
+        marked = self.notebook.changed_lines()
+        numbered = "\n".join(f"{'*' if index in marked else ' '}{index + 1:>4}  {line}" for index, line in enumerate(self.notebook.lines))
+        snapshot_tokens = count_tokens(numbered)
+        if snapshot_tokens <= NOTEBOOK_SNAPSHOT_TOKENS and (not has_snapshot or 2 * count_tokens(diff) >= snapshot_tokens):
+            self._notebook_snapshot_at = len(self.messages)
+            marks = "; * marks lines changed since you last saw it" if marked else ""
+            return f"Notebook now ({self.notebook.line_count} lines{marks}):\n{numbered}"
+        return f"Notebook changes:\n{diff}" if diff else ""
+
+    def context_messages(self) -> List[BaseMessage]:
+        return self.context.build(self.messages, self.volatile_tail())
+
+    def _emit(self, event_type, **payload):
+        """Push a streaming event to the chat pane. No-op when nothing is listening (e.g. terminal use)."""
+        if self.emit_event is None:
+            return
+        self.emit_event({"type": event_type, "turn": self._turn_id, **payload})
+
+    def _flush_tokens(self):
+        if self._pending_tokens:
+            self._emit("token", text=self._pending_tokens)
+            self._pending_tokens = ""
+        self._last_flush = time.monotonic()
+
+    def _chat_model(self, tier, answer_only=False):
+        key = (tier, answer_only)
+        if key not in self._chat_models:
+            tools = list(self.tool_name_map.values())
+            # A per-session cache key routes this session's calls to the same provider cache, where its prefix lives.
+            # answer_only is used for the last round trip of a turn once the budget is spent, so the model has to answer in text.
+            self._chat_models[key] = router.model(tier).bind_tools(
+                tools, tool_choice="none" if answer_only else None, prompt_cache_key=f"goosetor-{self.id}")
+        return self._chat_models[key]
+
+    async def _stream_llm(self, stats, answer_only=False):
+        """Stream one LLM round trip, forwarding text tokens to the frontend, and return the full AI message.
+
+        Falls back to the next chat tier if the call fails before any text reached the student.
+        """
+        self._emit("round_start")
+        started = time.perf_counter()
+        request = self.context_messages()
+        streamed_text = False
+
+        async def run(tier, span):
+            nonlocal streamed_text
+            span.set(round_trip=stats.llm_round_trips + 1, prompt_messages=len(request), prompt_tokens_estimate=self.context.last_build_tokens)
+            attempt_started = time.perf_counter()
+            ai_msg = None
+            async for chunk in self._chat_model(tier, answer_only).astream(request):
+                if ai_msg is None:
+                    # A hedged duplicate of this call may already be answering; only one of them streams.
+                    if not claim_output():
+                        raise asyncio.CancelledError()
+                    span.set(first_chunk_ms=round((time.perf_counter() - attempt_started) * 1000, 3))
+                ai_msg = chunk if ai_msg is None else ai_msg + chunk
+                if isinstance(chunk.content, str) and chunk.content:
+                    streamed_text = self._turn_shown = True
+                    self._pending_tokens += chunk.content
+                    if time.monotonic() - self._last_flush >= STREAM_FLUSH_INTERVAL:
+                        self._flush_tokens()
+            self._flush_tokens()
+            ai_msg = message_chunk_to_message(ai_msg) if ai_msg is not None else AIMessage(content="")
+            span.record_usage(ai_msg)
+            span.set(tool_calls=[tool_call["name"] for tool_call in ai_msg.tool_calls])
+            stats.input_tokens += span.attributes.get("input_tokens", 0)
+            stats.output_tokens += span.attributes.get("output_tokens", 0)
+            stats.cached_tokens += span.attributes.get("cached_tokens", 0)
+            stats.llm_calls.append({"tier": tier, **{key: span.attributes.get(key) for key in ("input_tokens", "cached_tokens", "cached_ratio")}})
+            return ai_msg
+
+        ai_msg = await router.call("chat", run, can_retry=lambda: not streamed_text)
+        stats.llm_round_trips += 1
+        stats.llm_seconds += time.perf_counter() - started
+        return ai_msg
+
+    async def _run_tool_call(self, tool_call, stats):
+        name = tool_call["name"].lower()
+        print(f"Calling tool: {name} with args: {tool_call['args']}")
+        self._turn_shown = True
+        self._emit("tool_call", name=name, label=TOOL_PROGRESS_LABELS.get(name, "Working"))
+        started = time.perf_counter()
+        with tracer.span("tool", tool=name) as span:
+            try:
+                tool_output = await self.tool_name_map[name].ainvoke(tool_call["args"])
+            except Exception as e:
+                # The AI message already holds this tool call, so it must get a ToolMessage back either way.
+                tool_output = f"Error while running {name}: {e}"
+                span.set(error=str(e))
+            span.set(output_chars=len(str(tool_output)))
+        elapsed = time.perf_counter() - started
+        stats.tool_timings.append({"name": name, "seconds": round(elapsed, 3)})
+        return ToolMessage(tool_output, tool_call_id=tool_call["id"])
+
+    async def _run_tool_calls(self, tool_calls, stats):
+        """Run all tool calls of one AI message concurrently and return their ToolMessages in call order."""
+        started = time.perf_counter()
+        tool_messages = await asyncio.gather(*(self._run_tool_call(tool_call, stats) for tool_call in tool_calls))
+        stats.tool_calls += len(tool_calls)
+        stats.tool_seconds += time.perf_counter() - started
+        return tool_messages
+
+    def send_message(self, user_input):
+        self.touch()
+        return run_in_agent_loop(self._send_message(user_input))
+
+    async def _send_message(self, user_input):
+        return await self.scheduler.submit(user_input)
+
+    async def _traced_turn(self, user_inputs):
+        with tracer.span("turn", session=self.id, turn=self._turn_id + 1, student_messages=len(user_inputs)) as span:
+            response = await self._run_turn(user_inputs)
+            span.set(**{key: value for key, value in asdict(self._last_turn_stats).items() if key not in ("tool_timings", "llm_calls")})
+        return response
+
+    def turn_notebook_text(self) -> str:
+        """Notebook text for tools: as of the start of the running turn, or the live text between turns."""
+        return self._turn_notebook if self._turn_notebook is not None else self.notebook.text()
+
+    async def _run_turn(self, user_inputs):
+        """Answer the student's messages (several when a burst was coalesced) with one LLM turn."""
+        try:
+            return await self._answer(user_inputs)
+        finally:
+            self._turn_notebook = None
+
+    async def _answer(self, user_inputs):
+        messages = self.messages
+        turn_started = time.perf_counter()
+        stats = TurnStats()
+        step_changes = self._step_changes
+        self._turn_shown = False
+        self._turn_notebook = self.notebook.text()
+
+        injected = set()
+        with tracer.span("notebook_diff", lines=self.notebook.line_count) as span:
+            notebook_note = self._notebook_snapshot()
+            span.set(snapshot_lines=notebook_note.count("\n") if notebook_note else 0)
+        if notebook_note:
+            messages.append(SystemMessage(f"{notebook_note}{await self._turn_precheck()}"))
+            injected.add("notebook")
+        self.notebook.mark_seen()
+        if self._problem_changed():
+            injected.add("problem")
+
+        history_length, turn_id = len(messages), self._turn_id
+        messages.append(HumanMessage("\n\n".join(user_inputs)))
+        self._turn_id += 1
+        self._persist()
+        self._emit("turn_start", student_messages=len(user_inputs))
+        try:
+            response = await self._stream_llm(stats)
+            messages.append(response)
+            while response.tool_calls:
+                messages.extend(await self._run_tool_calls(response.tool_calls, stats))
+                if stats.llm_round_trips + 1 >= MAX_LLM_ROUND_TRIPS:
+                    # Last allowed round trip: the model has to answer with the tool results it has. Tool calls
+                    # it makes anyway (tool_choice="none" isn't honored everywhere) are dropped, which ends the turn.
+                    stats.budget_exhausted = True
+                    response = await self._stream_llm(stats, answer_only=True)
+                    response = AIMessage(content=response.content, id=response.id, usage_metadata=response.usage_metadata,
+                                         response_metadata=response.response_metadata)
+                else:
+                    response = await self._stream_llm(stats)
+                messages.append(response)
+        except asyncio.CancelledError:
+            self._unwind_cancelled_turn(history_length, turn_id)
+            raise
+        stats.total_seconds = time.perf_counter() - turn_started
+        reads = [READ_ONLY_TOOLS[call["name"]] for message in messages[history_length:] if isinstance(message, AIMessage)
+                 for call in message.tool_calls if call["name"] in READ_ONLY_TOOLS]
+        stats.state_snapshots = len(injected)
+        stats.read_only_tool_calls = len(reads)
+        stats.state_snapshots_unread = len(injected - set(reads))
+        self.mark_problem_seen()
+        if self._step_changes is step_changes:
+            # Shown for this whole turn; a newer update that landed meanwhile stays for the next one.
+            self._step_changes = []
+        self._last_turn_stats = stats
+        self._persist()
+        self.metrics.record_turn(stats.total_seconds, stats.llm_round_trips, stats.input_tokens, stats.output_tokens, stats.cached_tokens,
+                                 stats.read_only_tool_calls, stats.state_snapshots_unread)
+        print(f"Turn {self._turn_id}: {stats.total_seconds:.2f}s, {stats.llm_round_trips} LLM round trip(s), {stats.tool_calls} tool call(s), "
+              f"{stats.input_tokens} input tokens ({stats.cached_tokens} cached)")
+        if (self._turn_id + 1) % STEPS_UPDATE_EVERY_TURNS == 0:
+            # The next turn is due for a step refresh; start it now so it runs while the student reads and types.
+            self._schedule_teaching_steps_update()
+        if self._compaction_task is None or self._compaction_task.done():
+            self._compaction_task = asyncio.create_task(self._compact_history(self.context, messages))
+        return response.content
+
+    def _unwind_cancelled_turn(self, history_length, turn_id):
+        """Drop what a cancelled turn added to the history, so no tool call is left without its result.
+
+        A superseded turn showed the student nothing and is redone with the newer messages, so its
+        student message goes too; a turn the student stopped keeps it, with a note for the model.
+        Either way the turn id goes back to `turn_id`, so the per-turn cadences only count answered turns.
+        """
+        superseded = self.scheduler.superseding
+        self._pending_tokens = ""
+        self._rollback(history_length if superseded else history_length + 1)
+        if not superseded:
+            self.messages.append(SystemMessage("The student stopped your answer to this message before it was finished."))
+        self._emit("turn_cancelled", superseded=superseded)
+        print(f"Turn {self._turn_id} {'superseded by a newer message' if superseded else 'cancelled'}")
+        self._turn_id = turn_id
+        self._persist()
+
+    def _rollback(self, length):
+        del self.messages[length:]
+        if self._persisted_messages > length:
+            session_store.write(self.id, truncate_from=length + self._seq_offset)
+            self._persisted_messages = length
+
+    async def _turn_precheck(self) -> str:
+        """Test verdict attached to a notebook diff, so the tutor doesn't need a round trip to check the code.
+
+        Usually the run started after the student's last edit has finished by now (or is in the code
+        runner's cache). A slow run doesn't hold up the answer past PRECHECK_WAIT_SECONDS: the model
+        is told it is still running and the run finishes in the background for run_notebook_tests.
+        """
+        if self._precheck_task is not None:
+            self._precheck_task.cancel()  # still waiting out the debounce; a run it started carries on
+        check = asyncio.ensure_future(self._notebook_precheck(self._turn_notebook))
+        done, _ = await asyncio.wait({check}, timeout=PRECHECK_WAIT_SECONDS)
+        if check in done:
+            return check.result()
+        check.cancel()
+        return (f"\n\nAutomatic check of the notebook code against the problem's test case: still running after "
+                f"{PRECHECK_WAIT_SECONDS:g}s (slow code or an infinite loop?). Call run_notebook_tests if you need the result.")
+
+    async def _notebook_precheck(self, notebook: str) -> str:
+        if not self.problem_statement["test_case"]:
+            return ""
+        result = await code_runner.run(notebook, self.problem_statement["test_case"])
+        if result.status == "unsupported":
+            return ""
+        return f"\n\nAutomatic check of the notebook code against the problem's test case:\n{result.format()}"
+
+    def _start_precheck(self):
+        """Check the notebook shortly after the student stops editing, so the next turn finds the result ready."""
+        if self._precheck_task is not None:
+            self._precheck_task.cancel()
+        if self.problem_statement["test_case"]:
+            self._precheck_task = asyncio.create_task(self._debounced_precheck(self.notebook.text()))
+
+    async def _debounced_precheck(self, notebook: str):
+        await asyncio.sleep(PRECHECK_DEBOUNCE_SECONDS)
+        await self._notebook_precheck(notebook)
+
+    def _schedule_teaching_steps_update(self):
+        """Start a background refresh of the teaching steps, superseding any refresh still in flight."""
+        if self._steps_update_task is not None and not self._steps_update_task.done():
+            self._steps_update_task.cancel()
+        self._steps_update_generation += 1
+        self._steps_update_task = asyncio.create_task(self._update_teaching_steps_in_background(
+            self._steps_update_generation, self.context.build(self.messages), self.teaching_steps.model_copy(deep=True)))
+
+    async def _update_teaching_steps_in_background(self, generation, history, snapshot):
+        with tracer.span("teaching_steps_update", session=self.id, turn=self._turn_id) as span:
+            before = snapshot.model_dump_json()
+            try:
+                changes = await update_teaching_steps(snapshot, history)
+            except Exception as e:
+                print(f"Teaching steps update failed: {e}")
+                span.set(result="failed")
+                return
+            if not changes:
+                span.set(result="unchanged")
+                return
+            # Drop the result if a newer refresh was started or the steps changed underneath us
+            # (new concept from get_expert_teaching_steps, or a new session).
+            if generation != self._steps_update_generation or self.teaching_steps.model_dump_json() != before:
+                span.set(result="stale")
+                return
+            span.set(result="applied", changes=len(changes))
+        self.teaching_steps.concept = snapshot.concept
+        self.teaching_steps.steps = snapshot.steps
+        self._step_changes = changes
+        self._persist("teaching_steps")
+        if self._practice_step_started() and self.publish_prepared_problem():
+            self._step_changes = changes + [f"the lesson's practice problem '{self.problem_statement['title']}' is now shown in the problem section"]
+
+    async def _compact_history(self, context_manager, history):
+        with tracer.span("history_compaction", session=self.id, turn=self._turn_id) as span:
+            try:
+                folded = await context_manager.compact(history, summarize_history)
+                span.set(folded=folded, folded_upto=context_manager.folded_upto)
+                if folded and context_manager is self.context:
+                    self._persist("context")
+            except Exception as e:
+                print(f"History compaction failed: {e}")
+
+    async def _cancel_background_work(self):
+        for task in (self._steps_update_task, self._compaction_task, self._precheck_task):
+            if task is not None:
+                task.cancel()
+        self._steps_update_generation += 1
+
+    async def _background_work_done(self):
+        tasks = [task for task in (self._steps_update_task, self._compaction_task) if task is not None]
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def wait_for_background_work(self):
+        """Block until the step refresh and history compaction started by the last turn are done (headless runs)."""
+        run_in_agent_loop(self._background_work_done())
+
+    def get_cache_stats(self):
+        """Teaching-steps cache counters, plus lesson pack hits and visualization render cache use, across all sessions."""
+        stats = teaching_steps_cache.stats()
+        if lesson_pack is not None:
+            stats["lesson_pack"] = lesson_pack.stats()
+        stats["visualizations"] = render_cache_info()
+        return stats
+
+    def get_model_stats(self):
+        """Calls, fallbacks, latency, tokens and cost per model tier, across all sessions."""
+        return router.stats()
+
+    def get_session_metrics(self):
+        """p50/p95 turn latency, round trips and tokens per turn, and coalesced or cancelled turns, for this session."""
+        return {**self.metrics.summary(), **self.scheduler.stats}
+
+    def cancel_turn(self):
+        """Stop the running turn (and drop messages queued behind it); False if nothing was running."""
+        self.touch()
+        return run_in_agent_loop(self._cancel_turn())
+
+    async def _cancel_turn(self):
+        return self.scheduler.cancel()
+
+    def get_turn_stats(self):
+        """Timing of the most recent turn, for the frontend or debugging."""
+        return asdict(self._last_turn_stats) if self._last_turn_stats else None
+
+    def update_problem(self, title, description, test_case, visualization):
+        self.touch()
+        return run_in_agent_loop(self._update_problem(title, description, test_case, visualization))
+
+    async def _update_problem(self, title, description, test_case, visualization):
+        self.problem_statement = {
+            "title": title or "",
+            "description": description or "",
+            "test_case": test_case or "",
+            "visualization": visualization or "",
+            "visualization_svg": "",
+        }
+        self._persist("problem")
+        return "Problem updated"
+
+    def get_problem(self):
+        self.touch()
+        return self.problem_statement
+
+    def set_notebook_section(self, content, version=None):
+        """Replace the whole notebook; the frontend's fallback when its delta stream got out of sync."""
+        self.touch()
+        return run_in_agent_loop(self._set_notebook_section(content, version))
+
+    async def _set_notebook_section(self, content, version):
+        if self.notebook.text() != content or version is not None:
+            self.notebook.set_text(content, version)
+            self._persist("notebook")
+            self._start_precheck()
+        return "Code updated"
+
+    def apply_notebook_delta(self, base_version, ops):
+        """Apply line edits made against `base_version`; `ok` is False when the frontend must resync."""
+        self.touch()
+        return run_in_agent_loop(self._apply_notebook_delta(base_version, ops))
+
+    async def _apply_notebook_delta(self, base_version, ops):
+        try:
+            ok = self.notebook.apply(base_version, ops)
+        except NotebookDeltaError as e:
+            print(f"Rejected notebook delta: {e}")
+            ok = False
+        if ok:
+            self._persist("notebook")
+            self._start_precheck()
+        return {"ok": ok, "version": self.notebook.version}
+
+    def get_notebook_section(self):
+        self.touch()
+        return self.notebook.text()
+
+    def new_session(self):
+        self.touch()
+        return run_in_agent_loop(self._new_session())
+
+    async def _new_session(self):
+        """Start a new conversation under a new id; the old one stays in the session store."""
+        await self.scheduler.stop()
+        await self._cancel_background_work()
+        self._persist()
+        tracer.write({"span": "session_summary", "session": self.id, **self.get_session_metrics()})
+        self.id = uuid.uuid4().hex
+        self._chat_models = {}  # bound with the old id's prompt cache key
+        self.metrics = SessionMetrics()
+        self.scheduler = TurnScheduler(self._traced_turn, lambda: not self._turn_shown)
+        self._reset_state()
+        return {"session_id": self.id}
+
+    def get_history(self, before_seq=None, limit=HISTORY_PAGE_SIZE):
+        """Stored student and tutor messages for the chat pane: up to `limit` before `before_seq`, oldest first."""
+        self.touch()
+        rows = session_store.messages(self.id, before_seq, limit + 1)
+        page = rows[-limit:]
+        messages = [
+            {"seq": seq, "role": "user" if isinstance(message, HumanMessage) else "assistant", "text": message.content}
+            for seq, message in page
+            # Tool-calling rounds aren't shown as their own bubbles in the chat, only the final answer.
+            if isinstance(message.content, str) and message.content and not getattr(message, "tool_calls", None)
+        ]
+        return {"messages": messages, "has_more": len(rows) > limit, "before_seq": page[0][0] if page else None}
+
+    async def _close(self):
+        await self.scheduler.stop()
+        await self._cancel_background_work()
+        self._persist()
+
+    def close(self):
+        """Stop background work and save what's left; called when the session is evicted or the app exits."""
+        run_in_agent_loop(self._close())
+        tracer.write({"span": "session_summary", "session": self.id, **self.get_session_metrics()})
+        session_store.flush()
+        teaching_steps_cache.flush()
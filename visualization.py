@@ -0,0 +1,361 @@
+"""Structured visualizations for problem statements, rendered locally to ASCII and SVG.
+
+The tutor describes a picture as a small spec (an array with pointers, a binary tree in
+level order, graph edges, a grid or a linked list) instead of drawing it character by
+character, which costs far fewer output tokens. Renders are memoized by spec, so the same
+picture set twice or re-read by the frontend is drawn once.
+"""
+import json
+import math
+from dataclasses import dataclass
+from functools import lru_cache
+from html import escape
+from typing import Dict, List, Literal, Optional, Tuple, Union
+from pydantic import BaseModel, Field
+
+Cell = Union[int, float, str, None]
+
+# Limits keep a malformed spec from producing a picture nobody can read.
+MAX_ITEMS = 64
+MAX_GRID_SIDE = 20
+RENDER_CACHE_SIZE = 256
+
+class Pointer(BaseModel):
+    label: str = Field(description="Pointer name shown under the element, e.g. 'lo', 'mid', 'i'.")
+    index: int = Field(description="0-based index of the element the pointer is at.")
+
+class Visualization(BaseModel):
+    """A picture for the problem pane. Fill in only the fields the kind uses."""
+    kind: Literal["array", "binary_tree", "graph", "grid", "linked_list"]
+    values: Optional[List[Cell]] = Field(None, description="array / linked_list: the elements in order. binary_tree: level order with null for missing children, e.g. [4, 2, 7, null, 3].")
+    pointers: Optional[List[Pointer]] = Field(None, description="array / linked_list: labelled positions, e.g. lo, mid and hi.")
+    edges: Optional[List[List[Cell]]] = Field(None, description="graph: [from, to] or [from, to, weight] per edge.")
+    directed: bool = Field(False, description="graph: whether edges are one-way.")
+    rows: Optional[List[List[Cell]]] = Field(None, description="grid: rows of cells, e.g. [['S', '.', '#'], ['.', '.', 'E']].")
+    caption: Optional[str] = Field(None, description="One line shown under the picture.")
+
+class VisualizationError(ValueError):
+    pass
+
+@dataclass(frozen=True)
+class RenderedVisualization:
+    text: str
+    svg: str
+
+def _label(value: Cell) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+def _check_size(name: str, items: Optional[list], limit: int = MAX_ITEMS) -> list:
+    if not items:
+        raise VisualizationError(f"{name} is empty")
+    if len(items) > limit:
+        raise VisualizationError(f"{name} has {len(items)} entries; at most {limit} can be drawn")
+    return items
+
+def _pointer_labels(spec: Visualization, size: int) -> Dict[int, str]:
+    labels: Dict[int, List[str]] = {}
+    for pointer in spec.pointers or []:
+        if not 0 <= pointer.index < size:
+            raise VisualizationError(f"pointer '{pointer.label}' is at {pointer.index}, outside 0..{size - 1}")
+        labels.setdefault(pointer.index, []).append(pointer.label)
+    return {index: ",".join(names) for index, names in labels.items()}
+
+def _pointer_lines(labels: Dict[int, str], centers: List[int]) -> List[str]:
+    """A line of carets under the pointed-at elements, then labels stacked onto as few lines as fit."""
+    if not labels:
+        return []
+    carets = [" "] * (max(centers) + 1)
+    for index in labels:
+        carets[centers[index]] = "^"
+    lines: List[List[str]] = []
+    for index in sorted(labels):
+        label, start = labels[index], centers[index]
+        for line in lines:
+            if all(ch == " " for ch in line[max(0, start - 1):start + len(label)]):
+                break
+        else:
+            line = []
+            lines.append(line)
+        line.extend(" " * (start + len(label) - len(line)))
+        line[start:start + len(label)] = label
+    return ["".join(carets).rstrip()] + ["".join(line).rstrip() for line in lines]
+
+# ---------- binary trees ----------
+
+class _TreeNode:
+    def __init__(self, label: str):
+        self.label = label
+        self.left: Optional["_TreeNode"] = None
+        self.right: Optional["_TreeNode"] = None
+
+def _build_tree(values: List[Cell]) -> Optional[_TreeNode]:
+    """Tree from a level-order list where null marks a missing child (LeetCode style)."""
+    if not values or values[0] is None:
+        return None
+    root = _TreeNode(_label(values[0]))
+    queue, position = [root], 1
+    for node in queue:
+        for side in ("left", "right"):
+            if position >= len(values):
+                return root
+            if values[position] is not None:
+                child = _TreeNode(_label(values[position]))
+                setattr(node, side, child)
+                queue.append(child)
+            position += 1
+    return root
+
+def _tree_lines(node: _TreeNode) -> Tuple[List[str], int, int]:
+    """Lines of the subtree, its width and the column of its root label's middle."""
+    label = node.label
+    if node.left is None and node.right is None:
+        return [label], len(label), len(label) // 2
+    if node.right is None:
+        lines, width, middle = _tree_lines(node.left)
+        first = " " * (middle + 1) + "_" * (width - middle - 1) + label
+        second = " " * middle + "/" + " " * (width - middle - 1 + len(label))
+        shifted = [line + " " * len(label) for line in lines]
+        return [first, second] + shifted, width + len(label), width + len(label) // 2
+    if node.left is None:
+        lines, width, middle = _tree_lines(node.right)
+        first = label + "_" * middle + " " * (width - middle)
+        second = " " * (len(label) + middle) + "\\" + " " * (width - middle - 1)
+        shifted = [" " * len(label) + line for line in lines]
+        return [first, second] + shifted, width + len(label), len(label) // 2
+    left, left_width, left_middle = _tree_lines(node.left)
+    right, right_width, right_middle = _tree_lines(node.right)
+    first = (" " * (left_middle + 1) + "_" * (left_width - left_middle - 1) + label
+             + "_" * right_middle + " " * (right_width - right_middle))
+    second = (" " * left_middle + "/" + " " * (left_width - left_middle - 1 + len(label) + right_middle)
+              + "\\" + " " * (right_width - right_middle - 1))
+    left += [" " * left_width] * (len(right) - len(left))
+    right += [" " * right_width] * (len(left) - len(right))
+    body = [a + " " * len(label) + b for a, b in zip(left, right)]
+    return [first, second] + body, left_width + right_width + len(label), left_width + len(label) // 2
+
+def _tree_layout(root: _TreeNode) -> Tuple[List[Tuple[_TreeNode, float, int]], int, int]:
+    """(node, x slot, depth) for an in-order layout, plus the number of slots and levels."""
+    placed = []
+    def visit(node, depth):
+        if node is None:
+            return
+        visit(node.left, depth + 1)
+        placed.append((node, len(placed), depth))
+        visit(node.right, depth + 1)
+    visit(root, 0)
+    return placed, len(placed), max(depth for _, _, depth in placed) + 1
+
+# ---------- graphs ----------
+
+def _graph_edges(spec: Visualization) -> Tuple[List[str], List[Tuple[str, str, Optional[str]]]]:
+    edges = []
+    nodes: List[str] = []
+    for edge in _check_size("edges", spec.edges):
+        if len(edge) not in (2, 3):
+            raise VisualizationError(f"edge {edge} should be [from, to] or [from, to, weight]")
+        source, target = _label(edge[0]), _label(edge[1])
+        edges.append((source, target, _label(edge[2]) if len(edge) == 3 else None))
+        for node in (source, target):
+            if node not in nodes:
+                nodes.append(node)
+    if len(nodes) > MAX_ITEMS:
+        raise VisualizationError(f"the graph has {len(nodes)} nodes; at most {MAX_ITEMS} can be drawn")
+    return nodes, edges
+
+# ---------- ASCII ----------
+
+def _array_text(spec: Visualization) -> str:
+    labels = [_label(value) for value in _check_size("values", spec.values)]
+    width = max(len(label) for label in labels)
+    cells = [label.center(width) for label in labels]
+    row = "[ " + " | ".join(cells) + " ]"
+    centers = [2 + index * (width + 3) + (width - 1) // 2 for index in range(len(cells))]
+    indexes = [" "] * len(row)
+    for index, center in enumerate(centers):
+        text = str(index)
+        indexes[center:center + len(text)] = text
+    return "\n".join(["".join(indexes).rstrip(), row] + _pointer_lines(_pointer_labels(spec, len(cells)), centers))
+
+def _linked_list_text(spec: Visualization) -> str:
+    labels = [_label(value) for value in _check_size("values", spec.values)]
+    parts, centers, column = [], [], 0
+    for label in labels:
+        box = f"[{label}]"
+        parts.append(box)
+        centers.append(column + len(box) // 2)
+        column += len(box) + len(" -> ")
+    row = " -> ".join(parts) + " -> None"
+    return "\n".join([row] + _pointer_lines(_pointer_labels(spec, len(labels)), centers))
+
+def _graph_text(spec: Visualization) -> str:
+    nodes, edges = _graph_edges(spec)
+    arrow = "->" if spec.directed else "--"
+    neighbors: Dict[str, List[str]] = {node: [] for node in nodes}
+    for source, target, weight in edges:
+        neighbors[source].append(f"{target} ({weight})" if weight is not None else target)
+        if not spec.directed and source != target:
+            neighbors[target].append(f"{source} ({weight})" if weight is not None else source)
+    width = max(len(node) for node in nodes)
+    return "\n".join(f"{node.ljust(width)} {arrow} {', '.join(neighbors[node]) or '(none)'}" for node in nodes)
+
+def _grid_text(spec: Visualization) -> str:
+    rows = _check_size("rows", spec.rows, MAX_GRID_SIDE)
+    for row in rows:
+        _check_size("grid row", row, MAX_GRID_SIDE)
+    labels = [[_label(cell) for cell in row] for row in rows]
+    width = max(len(label) for row in labels for label in row)
+    return "\n".join(" ".join(label.rjust(width) for label in row) for row in labels)
+
+def _tree_text(spec: Visualization) -> str:
+    root = _build_tree(_check_size("values", spec.values, 2 * MAX_ITEMS))
+    if root is None:
+        return "(empty tree)"
+    return "\n".join(line.rstrip() for line in _tree_lines(root)[0])
+
+TEXT_RENDERERS = {
+    "array": _array_text,
+    "linked_list": _linked_list_text,
+    "binary_tree": _tree_text,
+    "graph": _graph_text,
+    "grid": _grid_text,
+}
+
+# ---------- SVG ----------
+
+SVG_FONT = "font-family=\"Courier New, monospace\" font-size=\"14\""
+CELL = 40
+
+def _svg(width: float, height: float, body: List[str], caption: Optional[str]) -> str:
+    if caption:
+        body.append(f'<text x="{width / 2:.0f}" y="{height + 18:.0f}" text-anchor="middle">{escape(caption)}</text>')
+        height += 28
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{width:.0f}" height="{height:.0f}" '
+            f'viewBox="0 0 {width:.0f} {height:.0f}" {SVG_FONT}>' + "".join(body) + "</svg>")
+
+def _box(x: float, y: float, label: str, width: float = CELL) -> str:
+    return (f'<rect x="{x:.0f}" y="{y:.0f}" width="{width:.0f}" height="{CELL}" fill="#fff" stroke="#333"/>'
+            f'<text x="{x + width / 2:.0f}" y="{y + CELL / 2 + 5:.0f}" text-anchor="middle">{escape(label)}</text>')
+
+def _pointer_svg(labels: Dict[int, str], centers: List[float], y: float) -> List[str]:
+    return [f'<text x="{centers[index]:.0f}" y="{y:.0f}" text-anchor="middle" fill="#c0392b">&#8593; {escape(label)}</text>'
+            for index, label in labels.items()]
+
+def _cell_width(labels: List[str]) -> float:
+    return max(CELL, 12 + 9 * max(len(label) for label in labels))
+
+def _array_svg(spec: Visualization) -> Tuple[float, float, List[str]]:
+    labels = [_label(value) for value in _check_size("values", spec.values)]
+    width = _cell_width(labels)
+    body, centers = [], []
+    for index, label in enumerate(labels):
+        x = 10 + index * width
+        body.append(f'<text x="{x + width / 2:.0f}" y="16" text-anchor="middle" fill="#888" font-size="11">{index}</text>')
+        body.append(_box(x, 22, label, width))
+        centers.append(x + width / 2)
+    pointers = _pointer_labels(spec, len(labels))
+    body += _pointer_svg(pointers, centers, 22 + CELL + 20)
+    return 20 + len(labels) * width, 22 + CELL + (30 if pointers else 8), body
+
+def _linked_list_svg(spec: Visualization) -> Tuple[float, float, List[str]]:
+    labels = [_label(value) for value in _check_size("values", spec.values)]
+    width = _cell_width(labels)
+    gap = 30
+    body, centers = [], []
+    for index, label in enumerate(labels):
+        x = 10 + index * (width + gap)
+        body.append(_box(x, 10, label, width))
+        centers.append(x + width / 2)
+        end = x + width + gap
+        body.append(f'<line x1="{x + width:.0f}" y1="{10 + CELL / 2:.0f}" x2="{end - 4:.0f}" y2="{10 + CELL / 2:.0f}" stroke="#333" marker-end="url(#arrow)"/>')
+    tail_x = 10 + len(labels) * (width + gap)
+    body.append(f'<text x="{tail_x:.0f}" y="{10 + CELL / 2 + 5:.0f}" fill="#888">None</text>')
+    body.insert(0, '<defs><marker id="arrow" markerWidth="8" markerHeight="8" refX="7" refY="4" orient="auto">'
+                   '<path d="M0,0 L8,4 L0,8 z" fill="#333"/></marker></defs>')
+    pointers = _pointer_labels(spec, len(labels))
+    body += _pointer_svg(pointers, centers, 10 + CELL + 20)
+    return tail_x + 50, 10 + CELL + (30 if pointers else 10), body
+
+def _tree_svg(spec: Visualization) -> Tuple[float, float, List[str]]:
+    root = _build_tree(_check_size("values", spec.values, 2 * MAX_ITEMS))
+    if root is None:
+        return 120, 30, ['<text x="10" y="20">(empty tree)</text>']
+    placed, slots, levels = _tree_layout(root)
+    radius, dx, dy = 16, 40, 56
+    position = {id(node): (20 + radius + slot * dx, 20 + radius + depth * dy) for node, slot, depth in placed}
+    lines, circles = [], []
+    for node, _, _ in placed:
+        x, y = position[id(node)]
+        for child in (node.left, node.right):
+            if child is not None:
+                cx, cy = position[id(child)]
+                lines.append(f'<line x1="{x}" y1="{y}" x2="{cx}" y2="{cy}" stroke="#333"/>')
+        circles.append(f'<circle cx="{x}" cy="{y}" r="{radius}" fill="#fff" stroke="#333"/>'
+                       f'<text x="{x}" y="{y + 5}" text-anchor="middle">{escape(node.label)}</text>')
+    return 40 + 2 * radius + (slots - 1) * dx, 40 + 2 * radius + (levels - 1) * dy, lines + circles
+
+def _graph_svg(spec: Visualization) -> Tuple[float, float, List[str]]:
+    nodes, edges = _graph_edges(spec)
+    radius = 18
+    ring = max(60, 22 * len(nodes) / math.pi)
+    center = ring + radius + 20
+    position = {node: (center + ring * math.cos(2 * math.pi * index / len(nodes) - math.pi / 2),
+                       center + ring * math.sin(2 * math.pi * index / len(nodes) - math.pi / 2))
+                for index, node in enumerate(nodes)}
+    body = []
+    if spec.directed:
+        body.append('<defs><marker id="arrow" markerWidth="8" markerHeight="8" refX="7" refY="4" orient="auto">'
+                    '<path d="M0,0 L8,4 L0,8 z" fill="#333"/></marker></defs>')
+    for source, target, weight in edges:
+        (x1, y1), (x2, y2) = position[source], position[target]
+        length = math.hypot(x2 - x1, y2 - y1) or 1
+        # Stop the line at the circles' edges so arrowheads stay visible.
+        ux, uy = (x2 - x1) / length, (y2 - y1) / length
+        marker = ' marker-end="url(#arrow)"' if spec.directed else ""
+        body.append(f'<line x1="{x1 + ux * radius:.0f}" y1="{y1 + uy * radius:.0f}" x2="{x2 - ux * radius:.0f}" '
+                    f'y2="{y2 - uy * radius:.0f}" stroke="#333"{marker}/>')
+        if weight is not None:
+            body.append(f'<text x="{(x1 + x2) / 2 - uy * 10:.0f}" y="{(y1 + y2) / 2 + ux * 10:.0f}" '
+                        f'text-anchor="middle" fill="#2a6ebb" font-size="12">{escape(weight)}</text>')
+    for node, (x, y) in position.items():
+        body.append(f'<circle cx="{x:.0f}" cy="{y:.0f}" r="{radius}" fill="#fff" stroke="#333"/>'
+                    f'<text x="{x:.0f}" y="{y + 5:.0f}" text-anchor="middle">{escape(node)}</text>')
+    return 2 * center, 2 * center, body
+
+def _grid_svg(spec: Visualization) -> Tuple[float, float, List[str]]:
+    rows = _check_size("rows", spec.rows, MAX_GRID_SIDE)
+    labels = [[_label(cell) for cell in _check_size("grid row", row, MAX_GRID_SIDE)] for row in rows]
+    size = _cell_width([label for row in labels for label in row])
+    body = [_box(10 + column * size, 10 + row_index * CELL, label, size)
+            for row_index, row in enumerate(labels) for column, label in enumerate(row)]
+    return 20 + max(len(row) for row in labels) * size, 20 + len(labels) * CELL, body
+
+SVG_RENDERERS = {
+    "array": _array_svg,
+    "linked_list": _linked_list_svg,
+    "binary_tree": _tree_svg,
+    "graph": _graph_svg,
+    "grid": _grid_svg,
+}
+
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def _render(spec_json: str) -> RenderedVisualization:
+    spec = Visualization.model_validate_json(spec_json)
+    text = TEXT_RENDERERS[spec.kind](spec)
+    if spec.caption:
+        text += "\n" + spec.caption
+    width, height, body = SVG_RENDERERS[spec.kind](spec)
+    return RenderedVisualization(text=text, svg=_svg(width, height, body, spec.caption))
+
+def render_visualization(spec: Union[Visualization, dict]) -> RenderedVisualization:
+    """ASCII and SVG renders of a spec; raises VisualizationError when it can't be drawn."""
+    if isinstance(spec, dict):
+        spec = Visualization.model_validate(spec)
+    return _render(json.dumps(spec.model_dump(exclude_none=True), sort_keys=True))
+
+def render_cache_info() -> dict:
+    info = _render.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "entries": info.currsize}
@@ -0,0 +1,274 @@
+// Virtualized chat list: only messages in or near the viewport are in the DOM.
+// Long sessions otherwise keep every rendered bubble (code blocks, tables) mounted for good,
+// and scrolling and typing get slower the longer the student works. Each message keeps its
+// rendered markdown, so scrolling back to it costs no re-parse; a message that is still
+// streaming re-renders only its unfinished last block, the complete blocks before it are
+// rendered once and appended.
+//
+//     const chatList = createChatList(document.getElementById('chat'));
+//     const item = chatList.append('assistant', 'Hello');
+//     chatList.setText(item, 'Hello **there**', { streaming: true });
+//
+// Messages scrolled far out of view are unmounted, so a text selection can't extend over them.
+(function () {
+    const BUFFER_PX = 1000;         // mounted above and below the viewport
+    const MESSAGE_GAP = 15;          // .message margin-bottom in chat.css
+    const STICK_TO_BOTTOM_PX = 40;
+    const FENCE = /^\s*(```|~~~)/;
+
+    // Offset just past the last blank line outside a fenced code block: the text before it is
+    // a run of complete markdown blocks that later tokens can't change.
+    function stableLength(text) {
+        let inFence = false;
+        let offset = 0;
+        let stable = 0;
+        const lines = text.split('\n');
+        // The last line is still being written.
+        for (let i = 0; i < lines.length - 1; i++) {
+            if (FENCE.test(lines[i])) inFence = !inFence;
+            else if (!inFence && !lines[i].trim()) stable = offset + lines[i].length + 1;
+            offset += lines[i].length + 1;
+        }
+        return stable;
+    }
+
+    function estimateHeight(item) {
+        const lines = item.text.split('\n').reduce((total, line) => total + 1 + Math.floor(line.length / 70), 0);
+        return 22 + 20 * lines + MESSAGE_GAP;
+    }
+
+    function createChatList(container, options = {}) {
+        const bufferPx = options.bufferPx === undefined ? BUFFER_PX : options.bufferPx;
+        const incremental = options.incrementalStreaming !== false;
+        const header = document.createElement('div');
+        const topSpacer = document.createElement('div');
+        const list = document.createElement('div');
+        const bottomSpacer = document.createElement('div');
+        container.append(header, topSpacer, list, bottomSpacer);
+        container.style.position = 'relative';
+        container.style.overflowAnchor = 'none';  // anchoring is done in layout()
+
+        let items = [];
+        let offsets = [0];         // offsets[i]: top of items[i] within the list; offsets[n]: total height
+        let offsetsDirty = false;
+        let mounted = new Map();   // item -> element
+        let dirty = new Set();     // mounted items whose content changed
+        let frameRequested = false;
+        let stickToBottom = true;
+        let nextId = 0;
+
+        function html(item) {
+            // Memoized per text; a streaming message is rendered as its stable part plus the tail.
+            if (item.htmlFor !== item.text) {
+                item.html = marked.parse(item.text);
+                item.htmlFor = item.text;
+            }
+            return item.html;
+        }
+
+        function stableHtml(item) {
+            const stable = item.text.slice(0, stableLength(item.text));
+            if (stable === item.stableText) return '';
+            let added = null;
+            if (stable.startsWith(item.stableText)) {
+                added = marked.parse(stable.slice(item.stableText.length));
+                item.stableHtml += added;
+            } else {
+                item.stableHtml = marked.parse(stable);
+            }
+            item.stableText = stable;
+            return added;
+        }
+
+        function renderInto(item, element) {
+            const content = element.firstChild;
+            if (item.role === 'user') {
+                content.textContent = item.text;
+            } else if (item.streaming && !incremental) {
+                content.firstChild.innerHTML = marked.parse(item.text);
+            } else if (item.streaming) {
+                const [stablePart, tailPart] = content.children;
+                const added = stableHtml(item);
+                // A freshly mounted bubble gets all complete blocks; a mounted one only the new ones.
+                if (added === null || !element.dataset.streamed) stablePart.innerHTML = item.stableHtml;
+                else if (added) stablePart.insertAdjacentHTML('beforeend', added);
+                tailPart.innerHTML = marked.parse(item.text.slice(item.stableText.length));
+                element.dataset.streamed = '1';
+            } else {
+                content.innerHTML = html(item);
+            }
+            if (item.role !== 'user') {
+                let status = content.querySelector(':scope > .stream-status');
+                if (item.status) {
+                    if (!status) {
+                        status = document.createElement('div');
+                        status.className = 'stream-status';
+                        content.appendChild(status);
+                    }
+                    status.textContent = item.status;
+                } else if (status) {
+                    status.remove();
+                }
+            }
+        }
+
+        function createElement(item) {
+            const element = document.createElement('div');
+            element.className = 'message ' + item.role;
+            const content = document.createElement('div');
+            content.className = 'content';
+            if (item.role === 'user') content.style.whiteSpace = 'pre-wrap';
+            element.appendChild(content);
+            if (item.streaming) {
+                content.append(document.createElement('div'), document.createElement('div'));
+            }
+            renderInto(item, element);
+            return element;
+        }
+
+        function refreshOffsets() {
+            if (!offsetsDirty && offsets.length === items.length + 1) return;
+            offsets = new Array(items.length + 1);
+            offsets[0] = 0;
+            for (let i = 0; i < items.length; i++) offsets[i + 1] = offsets[i] + items[i].height;
+            offsetsDirty = false;
+        }
+
+        // Index of the item containing list position y.
+        function indexAt(y) {
+            let lo = 0, hi = items.length - 1;
+            while (lo < hi) {
+                const mid = (lo + hi + 1) >> 1;
+                if (offsets[mid] <= y) lo = mid; else hi = mid - 1;
+            }
+            return lo;
+        }
+
+        function schedule() {
+            if (frameRequested) return;
+            frameRequested = true;
+            requestAnimationFrame(layout);
+        }
+
+        function layout() {
+            frameRequested = false;
+            refreshOffsets();
+            const listTop = topSpacer.offsetTop;
+            const viewTop = container.scrollTop - listTop;
+            // Keep the first visible message where it is on screen while heights above it change.
+            const anchor = items.length ? indexAt(Math.max(0, viewTop)) : -1;
+            const anchorDelta = anchor >= 0 ? viewTop - offsets[anchor] : 0;
+            const anchorItem = anchor >= 0 ? items[anchor] : null;
+
+            let first = 0, last = items.length - 1;
+            if (bufferPx !== Infinity && items.length) {
+                const bottom = stickToBottom ? offsets[items.length] : viewTop + container.clientHeight;
+                const top = stickToBottom ? bottom - container.clientHeight : viewTop;
+                first = indexAt(Math.max(0, top - bufferPx));
+                last = indexAt(Math.max(0, bottom + bufferPx));
+            }
+            const wanted = new Map();
+            for (let i = first; i <= last; i++) {
+                const item = items[i];
+                let element = mounted.get(item);
+                if (!element) element = createElement(item);
+                else if (dirty.has(item)) renderInto(item, element);
+                wanted.set(item, element);
+            }
+            dirty.clear();
+            const elements = [...wanted.values()];
+            if (elements.length !== list.children.length || elements.some((element, i) => list.children[i] !== element)) {
+                list.replaceChildren(...elements);
+            }
+            mounted = wanted;
+
+            // Measure what is mounted and correct the estimates.
+            for (const [item, element] of mounted) {
+                const height = element.offsetHeight + MESSAGE_GAP;
+                if (height !== item.height) {
+                    item.height = height;
+                    offsetsDirty = true;
+                }
+            }
+            refreshOffsets();
+            topSpacer.style.height = (items.length ? offsets[first] : 0) + 'px';
+            bottomSpacer.style.height = (items.length ? offsets[items.length] - offsets[last + 1] : 0) + 'px';
+            if (stickToBottom) {
+                container.scrollTop = container.scrollHeight;
+            } else if (anchorItem) {
+                const index = items.indexOf(anchorItem);
+                if (index >= 0) container.scrollTop = listTop + offsets[index] + anchorDelta;
+            }
+        }
+
+        function insertAt(index, role, text, fields) {
+            const item = { id: nextId++, role, text, html: '', htmlFor: null, stableText: '', stableHtml: '',
+                           streaming: false, status: '', ...fields };
+            item.height = estimateHeight(item);
+            items.splice(index, 0, item);
+            offsetsDirty = true;
+            schedule();
+            return item;
+        }
+
+        container.addEventListener('scroll', () => {
+            stickToBottom = container.scrollHeight - container.scrollTop - container.clientHeight < STICK_TO_BOTTOM_PX;
+            schedule();
+        }, { passive: true });
+        // Mounted messages are measured again on every layout; the rest keep their last height until mounted.
+        window.addEventListener('resize', schedule);
+
+        return {
+            get items() { return items; },
+            get mountedCount() { return mounted.size; },
+            append(role, text, fields = {}) {
+                return insertAt(items.length, role, text, fields);
+            },
+            // Older messages go before everything but the first `skip` items (the greeting).
+            insertHistory(messages, skip = 1) {
+                const start = Math.min(skip, items.length);
+                messages.forEach((message, i) => insertAt(start + i, message.role, message.text, {}));
+            },
+            setText(item, text, { streaming = item.streaming } = {}) {
+                if (item.streaming !== streaming) {
+                    item.stableText = '';
+                    item.stableHtml = '';
+                    mounted.delete(item);  // rebuilt with the other bubble layout
+                }
+                item.text = text;
+                item.streaming = streaming;
+                dirty.add(item);
+                schedule();
+            },
+            setStatus(item, status) {
+                item.status = status;
+                dirty.add(item);
+                schedule();
+            },
+            remove(item) {
+                const index = items.indexOf(item);
+                if (index < 0) return;
+                items.splice(index, 1);
+                offsetsDirty = true;
+                schedule();
+            },
+            clear() {
+                items = [];
+                offsetsDirty = true;
+                stickToBottom = true;
+                schedule();
+            },
+            setHeader(element) {
+                header.replaceChildren(...(element ? [element] : []));
+            },
+            scrollToBottom() {
+                stickToBottom = true;
+                schedule();
+            },
+            layout,
+        };
+    }
+
+    window.createChatList = createChatList;
+    window.chatStableLength = stableLength;
+})();